@@ -18,7 +18,9 @@ class BuildAdmin(admin.ModelAdmin):
         'user',
         'category',
         'created_at',
-        'total_likes',
+        'like_count',
+        'comment_count',
+        'views',
         'image_count']
     list_filter = ['category', 'created_at']
     search_fields = ['title', 'user__username']
@@ -0,0 +1,84 @@
+"""
+Versioned cache keys for rendered build fragments
+
+Templates cache the parts of a build page that look the same for every
+visitor with ``{% cache %}``, keyed on the build id and a version token
+kept in the cache. builds.signals replaces the token once a change to
+the build, its images, comments, votes, likes or its author's profile
+commits. Bumping inside the transaction would let a render that runs
+before the commit cache the old data under the new token; after the
+commit, a fragment can only lag the data until the token is replaced.
+
+Versions are opaque tokens rather than counters: if one is evicted a
+fresh token is issued, and fragments rendered under the old one are
+simply never read again.
+
+A per-process cache only sees the bumps made in its own process, so
+there fragments are kept for LOCAL_CACHE_TIMEOUT seconds at most and
+other processes show a change within that time.
+"""
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from utils.cache_utils import get_cache_timeout
+
+VERSION_KEY = 'build_fragment_version:{}'
+
+
+def get_fragment_timeout():
+    """Seconds a rendered build fragment is kept in the cache"""
+    return get_cache_timeout(
+        getattr(settings, 'BUILD_FRAGMENT_CACHE_TIMEOUT', 3600))
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def get_versions(build_ids):
+    """Return {build_id: fragment version} for the given builds"""
+    keys = {VERSION_KEY.format(build_id): build_id for build_id in build_ids}
+    versions = cache.get_many(keys.keys())
+
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def get_version(build_id):
+    """Return the fragment version of a single build"""
+    return get_versions([build_id])[build_id]
+
+
+def bump_versions(build_ids):
+    """Invalidate every cached fragment of the given builds"""
+    if build_ids:
+        cache.set_many(
+            {VERSION_KEY.format(build_id): _new_version()
+             for build_id in build_ids},
+            timeout=None
+        )
+
+
+def bump_version(build_id):
+    """Invalidate every cached fragment of a single build"""
+    bump_versions([build_id])
+
+
+def bump_versions_on_commit(build_ids):
+    """Invalidate the builds' fragments once the transaction commits"""
+    build_ids = [build_id for build_id in build_ids if build_id is not None]
+    if build_ids:
+        transaction.on_commit(partial(bump_versions, build_ids))
+
+
+def attach_versions(builds):
+    """Set ``fragment_version`` on each build for the cache tag"""
+    versions = get_versions([build.pk for build in builds])
+    for build in builds:
+        build.fragment_version = versions[build.pk]
@@ -0,0 +1,90 @@
+"""
+Management command to time image URL generation for a listing page
+
+Compares calling cloudinary_url() for every image on every render with
+the memoized helpers and with URLs stored on the image rows. Nothing
+touches the database or the network.
+"""
+import time
+
+import cloudinary
+from cloudinary import CloudinaryResource
+from cloudinary.utils import cloudinary_url
+from django.core.management.base import BaseCommand
+from utils.cloudinary_utils import (
+    BUILD_SIZES, PROFILE_SIZES, clear_url_cache, get_build_image_url,
+    get_build_image_urls, get_profile_picture_url, get_profile_picture_urls
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark Cloudinary URL generation per listing page'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--builds',
+            type=int,
+            default=12,
+            help='Build cards per page (default: 12)')
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=1000,
+            help='Page renders to time (default: 1000)')
+
+    def handle(self, *args, **options):
+        # URLs are built locally; any cloud name will do
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(cloud_name='benchmark')
+        clear_url_cache()
+
+        count = options['builds']
+        images = [
+            CloudinaryResource(f'build_images/build_{n}') for n in range(count)]
+        avatars = [
+            CloudinaryResource(f'profile_pics/user_{n}') for n in range(count)]
+        size = BUILD_SIZES['medium']
+        avatar_size = PROFILE_SIZES['small']['width']
+        stored = [
+            (get_build_image_urls(image), get_profile_picture_urls(avatar))
+            for image, avatar in zip(images, avatars)
+        ]
+
+        def uncached():
+            # What every render did before URLs were memoized
+            for image, avatar in zip(images, avatars):
+                cloudinary_url(
+                    image.public_id, quality='auto:good',
+                    fetch_format='auto', width=size['width'],
+                    height=size['height'], crop='fill')
+                cloudinary_url(
+                    avatar.public_id, quality='auto:good',
+                    fetch_format='auto', width=avatar_size,
+                    height=avatar_size, crop='fill', gravity='face',
+                    radius='max')
+
+        def memoized():
+            for image, avatar in zip(images, avatars):
+                get_build_image_url(image, size['width'], size['height'])
+                get_profile_picture_url(avatar, avatar_size)
+
+        def precomputed():
+            for build_urls, avatar_urls in stored:
+                build_urls.get('medium')
+                avatar_urls.get('small')
+
+        self.stdout.write(
+            f'{count} build cards with author avatars, '
+            f'{options["pages"]} page renders')
+        for name, render in (
+                ('cloudinary_url per render', uncached),
+                ('memoized (LRU)', memoized),
+                ('stored on the row', precomputed)):
+            start = time.perf_counter()
+            for _ in range(options['pages']):
+                render()
+            per_page = (
+                (time.perf_counter() - start) * 1000000 / options['pages'])
+            self.stdout.write(f'{name}: {per_page:.1f}us per page')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,107 @@
+"""
+Management command to compare full-text build search with the old
+icontains filter on a generated fixture
+
+Everything runs inside a transaction that is rolled back, so the
+database is left untouched.
+"""
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from builds.models import Build
+from builds.search import SearchBackend, get_search_backend
+
+WORDS = [
+    'moonveil', 'rivers', 'blood', 'bleed', 'frost', 'katana', 'greatsword',
+    'colossal', 'sorcery', 'incantation', 'faith', 'arcane', 'dexterity',
+    'strength', 'radahn', 'malenia', 'godrick', 'rennala', 'mimic', 'tear',
+    'shield', 'talisman', 'erdtree', 'comet', 'azur', 'lightning', 'dragon',
+    'knight', 'samurai', 'vagabond', 'astrologer', 'prophet', 'wretch',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-text build search against the icontains filter'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--builds',
+            type=int,
+            default=100000,
+            help='Number of builds to generate (default: 100000)')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Runs per query, best time is reported (default: 5)')
+        parser.add_argument(
+            'queries',
+            nargs='*',
+            default=['moonveil', 'blood katana', 'radah', 'comet azur'],
+            help='Search queries to time')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.generate_fixture(options['builds'])
+            backend = get_search_backend()
+            self.stdout.write(
+                f'Comparing {type(backend).__name__} with the icontains '
+                f'filter over {options["builds"]} builds')
+
+            for query in options['queries']:
+                old_ms, old_count = self.time_search(
+                    SearchBackend(), query, options['repeat'])
+                new_ms, new_count = self.time_search(
+                    backend, query, options['repeat'])
+                self.stdout.write(
+                    f'{query!r}: icontains {old_ms:.1f}ms '
+                    f'({old_count} matches), full-text {new_ms:.1f}ms '
+                    f'({new_count} matches)')
+
+            # Leave the database exactly as it was
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    def generate_fixture(self, count):
+        rng = random.Random(42)
+        user = User.objects.create_user(username='benchmark_search_user')
+
+        # Mostly filler with one themed word, so queries stay selective
+        filler = [f'lore{n}' for n in range(5000)]
+
+        def phrase(length):
+            words = [rng.choice(filler) for _ in range(length - 1)]
+            words.append(rng.choice(WORDS))
+            rng.shuffle(words)
+            return ' '.join(words)
+
+        Build.objects.bulk_create(
+            (Build(
+                user=user,
+                title=phrase(3).title(),
+                description=phrase(40),
+                weapons=phrase(3),
+                armor=phrase(3),
+                talismans=phrase(3),
+                spells=phrase(2),
+            ) for _ in range(count)),
+            batch_size=2000
+        )
+        # bulk_create skips post_save, so index the fixture in one go
+        get_search_backend().rebuild()
+
+    def time_search(self, backend, query, repeat):
+        """Return the best time to count matches and load the first page"""
+        best = None
+        for _ in range(repeat):
+            queryset = backend.search(Build.objects.all(), query)
+            start = time.perf_counter()
+            count = queryset.count()
+            list(queryset.order_by('-search_rank', '-created_at')[:12])
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, count
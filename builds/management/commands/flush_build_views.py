@@ -0,0 +1,29 @@
+"""
+Management command to write buffered build views to the database
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from builds.view_counts import flush_view_counts
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered build view counts to Build.views ' \
+        '(run periodically, e.g. from a scheduler or worker dyno)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and flush every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            flushed = flush_view_counts()
+            self.stdout.write(self.style.SUCCESS(
+                f'Flushed view counts for {flushed} builds'))
+            if not interval:
+                break
+            time.sleep(interval)
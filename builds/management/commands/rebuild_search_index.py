@@ -0,0 +1,17 @@
+"""
+Management command to rebuild the full-text search index for builds
+"""
+from django.core.management.base import BaseCommand
+from builds.models import Build
+from builds.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for every build'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt search index with {type(backend).__name__} for '
+            f'{Build.objects.count()} builds'))
@@ -0,0 +1,74 @@
+"""
+Management command to recompute the denormalized counters on Build
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from builds.models import Build
+from builds.signals import comment_count_subquery, like_count_subquery
+
+
+class Command(BaseCommand):
+    help = 'Recompute Build.like_count and Build.comment_count and ' \
+        'repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of builds to check per batch (default: 1000)')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted builds without fixing them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        repaired = 0
+        last_pk = 0
+
+        while True:
+            batch = list(
+                Build.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]
+
+            # Only rewrite rows whose stored counters disagree
+            drifted = list(
+                Build.objects.filter(pk__in=batch).annotate(
+                    actual_likes=like_count_subquery(),
+                    actual_comments=comment_count_subquery(),
+                ).filter(
+                    ~Q(like_count=F('actual_likes')) |
+                    ~Q(comment_count=F('actual_comments'))
+                ).values_list('pk', flat=True)
+            )
+            if not drifted:
+                continue
+
+            for pk in drifted:
+                self.stdout.write(f'Counters drifted for build #{pk}')
+
+            if not dry_run:
+                with transaction.atomic():
+                    Build.objects.filter(pk__in=drifted).update(
+                        like_count=like_count_subquery(),
+                        comment_count=comment_count_subquery(),
+                    )
+            repaired += len(drifted)
+
+        if repaired == 0:
+            self.stdout.write(self.style.SUCCESS(
+                'All build counters are accurate'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'Found {repaired} builds with drifted counters'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully repaired counters on {repaired} builds'))
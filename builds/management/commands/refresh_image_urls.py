@@ -0,0 +1,42 @@
+"""
+Management command to store preset URLs on existing image rows
+"""
+from django.core.management.base import BaseCommand
+from builds.models import BuildImage
+from users.models import UserProfile
+from utils.cloudinary_utils import store_image_urls
+
+
+class Command(BaseCommand):
+    help = 'Store the URL of every size preset on build images and ' \
+        'profile pictures (needs CLOUDINARY_STORE_IMAGE_URLS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of rows to load per batch (default: 500)')
+
+    def handle(self, *args, **options):
+        if not store_image_urls():
+            self.stdout.write(self.style.WARNING(
+                'CLOUDINARY_STORE_IMAGE_URLS is off; nothing to do'))
+            return
+
+        batch_size = options['batch_size']
+        images = 0
+        for image in BuildImage.objects.iterator(chunk_size=batch_size):
+            image.store_image_urls()
+            images += 1
+
+        profiles = 0
+        for profile in UserProfile.objects.exclude(
+                profile_picture__isnull=True).exclude(
+                profile_picture='').iterator(chunk_size=batch_size):
+            profile.store_profile_picture_urls()
+            profiles += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored image URLs for {images} build images and '
+            f'{profiles} profile pictures'))
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Build = apps.get_model('builds', 'Build')
+    Comment = apps.get_model('builds', 'Comment')
+    Like = Build.liked_by.through
+
+    likes = Like.objects.filter(build_id=OuterRef('pk')).order_by().values(
+        'build_id').annotate(total=Count('pk')).values('total')
+    comments = Comment.objects.filter(build_id=OuterRef('pk')).order_by(
+    ).values('build_id').annotate(total=Count('pk')).values('total')
+
+    Build.objects.update(
+        like_count=Coalesce(Subquery(likes), 0),
+        comment_count=Coalesce(Subquery(comments), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builds', '0010_build_views'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='build',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['-created_at', '-id'], name='builds_buil_created_699448_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['-like_count', '-created_at', '-id'], name='builds_buil_like_co_8e0233_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['-comment_count', '-created_at', '-id'], name='builds_buil_comment_a5413e_idx'),
+        ),
+    ]
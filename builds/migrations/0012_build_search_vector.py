@@ -0,0 +1,82 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:48
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    'CREATE INDEX IF NOT EXISTS builds_build_search_vector_gin '
+    'ON builds_build USING gin (search_vector)',
+    """
+    UPDATE builds_build AS b SET search_vector =
+        setweight(to_tsvector('english', coalesce(b.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(u.username, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(b.weapons, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(b.armor, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(b.talismans, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(b.spells, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(b.description, '')), 'C')
+    FROM auth_user AS u WHERE u.id = b.user_id
+    """,
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS builds_build_search_vector_gin',
+]
+
+# Column order must match builds.search.SEARCH_FIELDS
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS builds_build_fts USING fts5(
+        title, username, weapons, armor, talismans, spells, description,
+        tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    INSERT INTO builds_build_fts (
+        rowid, title, username, weapons, armor, talismans, spells,
+        description
+    )
+    SELECT b.id, b.title, u.username, b.weapons, b.armor, b.talismans,
+        coalesce(b.spells, ''), b.description
+    FROM builds_build AS b JOIN auth_user AS u ON u.id = b.user_id
+    """,
+]
+
+SQLITE_REVERSE = [
+    'DROP TABLE IF EXISTS builds_build_fts',
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor)
+        for statement in vendor_statements or []:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builds', '0011_build_counters'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_for_vendor({
+                'postgresql': POSTGRES_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run_for_vendor({
+                'postgresql': POSTGRES_REVERSE,
+                'sqlite': SQLITE_REVERSE,
+            }),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builds', '0012_build_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildimage',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
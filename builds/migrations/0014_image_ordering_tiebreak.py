@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:17
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builds', '0013_stored_image_urls'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='buildimage',
+            options={'ordering': ['-is_primary', 'uploaded_at', 'id']},
+        ),
+    ]
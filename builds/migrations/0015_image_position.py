@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builds', '0014_image_ordering_tiebreak'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='buildimage',
+            options={'ordering': ['-is_primary', 'position', 'uploaded_at', 'id']},
+        ),
+        migrations.AddField(
+            model_name='buildimage',
+            name='position',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
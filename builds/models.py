@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.contrib.postgres.search import SearchVectorField
 from cloudinary.models import CloudinaryField
 
 # Create your models here.
@@ -60,13 +61,38 @@ class Build(models.Model):
     liked_by = models.ManyToManyField(
         User, related_name='liked_builds', blank=True)
     views = models.PositiveIntegerField(default=0)
+    # Denormalized counters kept in sync by builds.signals
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Weighted full-text vector, only populated on PostgreSQL
+    # (see builds.search)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['-like_count', '-created_at', '-id']),
+            models.Index(fields=['-comment_count', '-created_at', '-id']),
+        ]
+
     def total_likes(self):
-        return self.liked_by.count()
+        return self.like_count
+
+    def _prefetched_images(self):
+        """Return prefetched images, or None if they weren't prefetched"""
+        cache = getattr(self, '_prefetched_objects_cache', {})
+        if 'images' in cache:
+            return list(cache['images'])
+        return None
 
     def get_primary_image(self):
         """Get the primary (first) image for this build"""
+        images = self._prefetched_images()
+        if images is not None:
+            # Prefetched images use Meta ordering, so primary comes first
+            return images[0] if images else None
+
         primary_image = self.images.filter(is_primary=True).first()
         if not primary_image:
             primary_image = self.images.first()
@@ -76,6 +102,9 @@ class Build(models.Model):
         """Return optimized build image URL or default image"""
         primary_image = self.get_primary_image()
         if primary_image:
+            stored_url = primary_image.get_stored_url(size)
+            if stored_url:
+                return stored_url
             from utils.cloudinary_utils import (
                 get_build_image_url, get_thumbnail_url, BUILD_SIZES
             )
@@ -94,6 +123,14 @@ class Build(models.Model):
         # Return default emblem image based on build category
         return self.get_default_image_url()
 
+    def get_image_srcset(self):
+        """Return a srcset of the primary image's sizes, or '' if none"""
+        primary_image = self.get_primary_image()
+        if not primary_image:
+            return ''
+        from utils.cloudinary_utils import build_srcset, BUILD_SIZES
+        return build_srcset(primary_image.get_image_urls(), BUILD_SIZES)
+
     def get_default_image_url(self):
         """Return a default emblem image based on build category"""
         from django.templatetags.static import static
@@ -129,6 +166,9 @@ class Build(models.Model):
 
     def has_custom_image(self):
         """Check if build has any uploaded images"""
+        images = self._prefetched_images()
+        if images is not None:
+            return bool(images)
         return self.images.exists()
 
     def can_add_image(self):
@@ -170,11 +210,17 @@ class BuildImage(models.Model):
         }
     )
     is_primary = models.BooleanField(default=False)
+    # Display order chosen on the edit form, after the primary image
+    position = models.PositiveSmallIntegerField(default=0)
     caption = models.CharField(max_length=200, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # {size: URL} for each BUILD_SIZES preset, stored on upload when
+    # CLOUDINARY_STORE_IMAGE_URLS is set
+    image_urls = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
-        ordering = ['-is_primary', 'uploaded_at']
+        # Images created together share uploaded_at; id keeps their order
+        ordering = ['-is_primary', 'position', 'uploaded_at', 'id']
 
     def save(self, *args, **kwargs):
         # Validate max 3 images per build
@@ -193,6 +239,22 @@ class BuildImage(models.Model):
                 is_primary=False)
 
         super().save(*args, **kwargs)
+        self.store_image_urls()
+
+    def store_image_urls(self):
+        """Save the URL of every size preset once the image is uploaded"""
+        from utils.cloudinary_utils import (
+            get_build_image_urls, store_image_urls
+        )
+
+        if not store_image_urls():
+            return
+        # Uploads only become Cloudinary resources while the row is saved
+        image = self._meta.get_field('image').to_python(self.image)
+        urls = get_build_image_urls(image)
+        if urls != self.image_urls:
+            self.image_urls = urls
+            BuildImage.objects.filter(pk=self.pk).update(image_urls=urls)
 
     def delete(self, *args, **kwargs):
         # If deleting primary image, make the next image primary
@@ -203,12 +265,45 @@ class BuildImage(models.Model):
                 next_image.save()
         super().delete(*args, **kwargs)
 
+    def get_image_urls(self):
+        """Return {size: URL} for every BUILD_SIZES preset"""
+        from utils.cloudinary_utils import (
+            get_build_image_urls, store_image_urls, BUILD_SIZES
+        )
+
+        if store_image_urls() and set(self.image_urls) >= set(BUILD_SIZES):
+            return self.image_urls
+        return get_build_image_urls(self.image)
+
+    def get_stored_url(self, size):
+        """Return the stored URL of a size preset, if there is one"""
+        from utils.cloudinary_utils import store_image_urls
+
+        if store_image_urls():
+            return self.image_urls.get(size)
+        return None
+
     def __str__(self):
         return f"Image for {
             self.build.title} {
             '(Primary)' if self.is_primary else ''}"
 
 
+class CommentQuerySet(models.QuerySet):
+    def with_vote_counts(self):
+        """Annotate upvote_count, downvote_count and score in one query"""
+        return self.annotate(
+            upvote_count=models.Count(
+                'votes', filter=models.Q(votes__vote_type='upvote')
+            ),
+            downvote_count=models.Count(
+                'votes', filter=models.Q(votes__vote_type='downvote')
+            )
+        ).annotate(
+            score=models.F('upvote_count') - models.F('downvote_count')
+        )
+
+
 class Comment(models.Model):
     build = models.ForeignKey(
         Build,
@@ -219,6 +314,8 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
 
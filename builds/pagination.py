@@ -0,0 +1,120 @@
+"""
+Keyset (cursor) pagination helpers for build listings
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _sort_key(obj, field):
+    """Return the JSON-safe value of an ordering field on an object"""
+    value = getattr(obj, field.lstrip('-'))
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(obj, ordering):
+    """
+    Encode the position of an object in a listing as an opaque cursor
+
+    Args:
+        obj: The last object on the current page
+        ordering (tuple): The ordering used for the listing
+
+    Returns:
+        str: URL-safe cursor string
+    """
+    values = [_sort_key(obj, field) for field in ordering]
+    payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def _ordering_field(queryset, field):
+    """Return the model field or annotation an ordering field sorts on"""
+    name = field.lstrip('-')
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    if name == 'pk':
+        return queryset.model._meta.pk
+    return queryset.model._meta.get_field(name)
+
+
+def decode_cursor(cursor, ordering, queryset):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Each value is converted with the to_python() of the field it sorts
+    on, so a cursor holding a value of the wrong type is rejected here
+    rather than failing in the query.
+
+    Raises:
+        ValueError: If the cursor is malformed or doesn't match the ordering
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError('Invalid cursor')
+    try:
+        values = [
+            _ordering_field(queryset, field).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValidationError, TypeError, ValueError) as exc:
+        raise ValueError('Invalid cursor') from exc
+    # Ordering fields are never null, and None can't be compared
+    if any(value is None for value in values):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Build a filter selecting rows that come after the given sort key
+
+    For an ordering (a, b, c) this produces
+    a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND c > vc),
+    using < for descending fields.
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def paginate_by_cursor(queryset, ordering, cursor, page_size):
+    """
+    Return one page of an ordered queryset starting after a cursor
+
+    Args:
+        queryset: Queryset already ordered by ``ordering``
+        ordering (tuple): Ordering fields, ending with a unique tiebreaker
+        cursor (str): Cursor from a previous page, or empty for the first
+        page_size (int): Number of objects per page
+
+    Returns:
+        tuple: (list of objects, cursor for the next page or None)
+    """
+    if cursor:
+        values = decode_cursor(cursor, ordering, queryset)
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    # Fetch one extra row to find out whether another page exists
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1], ordering)
+    return items, next_cursor
@@ -0,0 +1,197 @@
+"""
+Full-text search backends for builds
+
+PostgreSQL keeps a weighted tsvector in Build.search_vector (GIN indexed),
+SQLite keeps an FTS5 shadow table keyed by build id. Both are refreshed
+from builds.signals whenever a build is saved.
+"""
+import re
+
+from django.db import connection
+from django.db.models import CharField, F, FloatField, Q, Value
+
+FTS_TABLE = 'builds_build_fts'
+
+# Columns indexed for search, with their relevance weight
+SEARCH_FIELDS = [
+    ('title', 'A'),
+    ('username', 'B'),
+    ('weapons', 'B'),
+    ('armor', 'B'),
+    ('talismans', 'B'),
+    ('spells', 'B'),
+    ('description', 'C'),
+]
+
+# bm25() column weights matching the tsvector weights above
+FTS_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 1.0}
+
+
+def search_terms(query):
+    """Split user input into plain word tokens safe for any backend"""
+    return re.findall(r'\w+', query or '')
+
+
+def _field_value(build, field):
+    if field == 'username':
+        return build.user.username
+    return getattr(build, field) or ''
+
+
+class SearchBackend:
+    """Fallback backend using the original icontains filter"""
+
+    def index_build(self, build):
+        """Refresh the search index entry for a build"""
+
+    def remove_build(self, build_id):
+        """Drop a build from the search index"""
+
+    def rebuild(self):
+        """Reindex every build"""
+        from .models import Build
+
+        for build in Build.objects.select_related('user').iterator():
+            self.index_build(build)
+
+    def search(self, queryset, query):
+        """Filter builds matching a query and annotate ``search_rank``"""
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(weapons__icontains=query) |
+            Q(armor__icontains=query) |
+            Q(talismans__icontains=query) |
+            Q(spells__icontains=query) |
+            Q(user__username__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector column with a GIN index and ts_rank ordering"""
+
+    config = 'english'
+
+    def _vector(self, build):
+        from django.contrib.postgres.search import SearchVector
+
+        vector = None
+        for field, weight in SEARCH_FIELDS:
+            if field == 'username':
+                source = Value(build.user.username, output_field=CharField())
+            else:
+                source = field
+            part = SearchVector(source, weight=weight, config=self.config)
+            vector = part if vector is None else vector + part
+        return vector
+
+    def index_build(self, build):
+        from .models import Build
+
+        Build.objects.filter(pk=build.pk).update(
+            search_vector=self._vector(build))
+
+    def rebuild(self):
+        vector = ' || '.join(
+            f"setweight(to_tsvector('{self.config}', "
+            f"coalesce({'u' if field == 'username' else 'b'}.{field}, '')), "
+            f"'{weight}')"
+            for field, weight in SEARCH_FIELDS
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE builds_build AS b SET search_vector = {vector} '
+                f'FROM auth_user AS u WHERE u.id = b.user_id'
+            )
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        terms = search_terms(query)
+        if not terms:
+            return super().search(queryset, query)
+
+        # Prefix-match every term so partially typed words still match
+        tsquery = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            search_type='raw',
+            config=self.config
+        )
+        return queryset.filter(search_vector=tsquery).annotate(
+            search_rank=SearchRank(F('search_vector'), tsquery))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 virtual table with bm25 ordering"""
+
+    def index_build(self, build):
+        columns = [field for field, weight in SEARCH_FIELDS]
+        values = [_field_value(build, field) for field in columns]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [build.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(columns)}) '
+                f'VALUES (%s, {", ".join(["%s"] * len(columns))})',
+                [build.pk] + values
+            )
+
+    def remove_build(self, build_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [build_id])
+
+    def rebuild(self):
+        columns = [field for field, weight in SEARCH_FIELDS]
+        selected = [
+            'u.username' if field == 'username' else
+            f"coalesce(b.{field}, '')"
+            for field in columns
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(columns)}) '
+                f'SELECT b.id, {", ".join(selected)} FROM builds_build AS b '
+                f'JOIN auth_user AS u ON u.id = b.user_id'
+            )
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return super().search(queryset, query)
+
+        # Quote each term and prefix-match it; FTS5 ANDs them together
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(
+            str(FTS_WEIGHTS[weight]) for field, weight in SEARCH_FIELDS)
+        table = queryset.model._meta.db_table
+
+        # Join the FTS table so SQLite drives the query from the MATCH
+        # and computes bm25() once per hit; it is lower for better
+        # matches, so negate it
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE} MATCH %s',
+                f'{FTS_TABLE}.rowid = "{table}"."id"',
+            ],
+            params=[match],
+            select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+        )
+
+
+_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    """Return the search backend for the default database"""
+    return _BACKENDS.get(connection.vendor, SearchBackend)()
+
+
+def search_builds(queryset, query):
+    """Filter a Build queryset by a search query, ranked by relevance"""
+    return get_search_backend().search(queryset, query)
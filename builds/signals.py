@@ -0,0 +1,207 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.contrib.auth.models import User
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from users.models import UserProfile
+from .models import Build, BuildImage, Comment, CommentVote
+from .search import get_search_backend
+from . import fragment_cache, site_stats
+
+
+def like_count_subquery():
+    """Subquery counting the likes of the outer Build row"""
+    likes = Build.liked_by.through.objects.filter(
+        build_id=OuterRef('pk')
+    ).order_by().values('build_id').annotate(total=Count('pk'))
+    return Coalesce(Subquery(likes.values('total')), 0)
+
+
+def comment_count_subquery():
+    """Subquery counting the comments of the outer Build row"""
+    comments = Comment.objects.filter(
+        build_id=OuterRef('pk')
+    ).order_by().values('build_id').annotate(total=Count('pk'))
+    return Coalesce(Subquery(comments.values('total')), 0)
+
+
+@receiver(m2m_changed, sender=Build.liked_by.through)
+def update_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Build.like_count in step with the liked_by relation"""
+    if action == 'pre_clear' and reverse:
+        # Remember which builds a user.liked_builds.clear() touches
+        instance._cleared_build_ids = list(
+            instance.liked_builds.values_list('pk', flat=True))
+        return
+
+    if action == 'post_add':
+        # pk_set only contains rows that were actually inserted
+        if reverse:
+            Build.objects.filter(pk__in=pk_set).update(
+                like_count=F('like_count') + 1)
+        else:
+            Build.objects.filter(pk=instance.pk).update(
+                like_count=F('like_count') + len(pk_set))
+    elif action == 'post_remove':
+        # pk_set for removals may include rows that never existed,
+        # so recount instead of subtracting
+        build_ids = pk_set if reverse else [instance.pk]
+        Build.objects.filter(pk__in=build_ids).update(
+            like_count=like_count_subquery())
+    elif action == 'post_clear':
+        if reverse:
+            Build.objects.filter(
+                pk__in=getattr(instance, '_cleared_build_ids', [])
+            ).update(like_count=like_count_subquery())
+        else:
+            Build.objects.filter(pk=instance.pk).update(like_count=0)
+
+
+@receiver(pre_delete, sender=User)
+def remember_liked_builds(sender, instance, **kwargs):
+    """Remember the builds a deleted user liked"""
+    instance._liked_build_ids = list(
+        Build.liked_by.through.objects.filter(
+            user_id=instance.pk).values_list('build_id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def recount_liked_builds(sender, instance, **kwargs):
+    """
+    Recount the builds a deleted user liked
+
+    Their likes go with the user through the cascade on the liked_by
+    table, which doesn't send m2m_changed.
+    """
+    build_ids = getattr(instance, '_liked_build_ids', [])
+    if build_ids:
+        Build.objects.filter(pk__in=build_ids).update(
+            like_count=like_count_subquery())
+        fragment_cache.bump_versions_on_commit(build_ids)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    """Count a new comment against its build"""
+    if created:
+        Build.objects.filter(pk=instance.build_id).update(
+            comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    """Remove a deleted comment from its build's count"""
+    Build.objects.filter(
+        pk=instance.build_id, comment_count__gt=0
+    ).update(comment_count=F('comment_count') - 1)
+
+
+@receiver(post_save, sender=Build)
+def index_build(sender, instance, **kwargs):
+    """Refresh the full-text search entry for a saved build"""
+    get_search_backend().index_build(instance)
+
+
+@receiver(post_delete, sender=Build)
+def unindex_build(sender, instance, **kwargs):
+    """Drop a deleted build from the full-text search index"""
+    get_search_backend().remove_build(instance.pk)
+
+
+@receiver(post_save, sender=Build)
+@receiver(post_delete, sender=Build)
+def invalidate_build_fragments(sender, instance, **kwargs):
+    """Drop cached fragments of a saved or deleted build"""
+    fragment_cache.bump_versions_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=BuildImage)
+@receiver(post_delete, sender=BuildImage)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_parent_build_fragments(sender, instance, **kwargs):
+    """Drop cached fragments of the build an image or comment belongs to"""
+    fragment_cache.bump_versions_on_commit([instance.build_id])
+
+
+@receiver(post_save, sender=CommentVote)
+@receiver(post_delete, sender=CommentVote)
+def invalidate_voted_build_fragments(sender, instance, **kwargs):
+    """Drop cached fragments of the build whose comment was voted on"""
+    build_id = Comment.objects.filter(
+        pk=instance.comment_id).values_list('build_id', flat=True).first()
+    fragment_cache.bump_versions_on_commit([build_id])
+
+
+@receiver(m2m_changed, sender=Build.liked_by.through)
+def invalidate_liked_build_fragments(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    """Drop cached fragments of builds whose like count changed"""
+    if action in ('post_add', 'post_remove'):
+        build_ids = pk_set if reverse else [instance.pk]
+    elif action == 'post_clear':
+        build_ids = (
+            getattr(instance, '_cleared_build_ids', []) if reverse
+            else [instance.pk]
+        )
+    else:
+        return
+    fragment_cache.bump_versions_on_commit(list(build_ids))
+
+
+# Site total updated for each model
+SITE_TOTALS = {Build: 'builds', User: 'users', Comment: 'comments'}
+
+
+# Profile fields shown next to a build in cached fragments
+PROFILE_FRAGMENT_FIELDS = ('display_name', 'profile_picture')
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_profile_fragment_fields(sender, instance, **kwargs):
+    """Note whether a profile edit changes what build fragments show"""
+    if instance.pk is None:
+        instance._fragment_fields_changed = False
+        return
+    previous = UserProfile.objects.filter(pk=instance.pk).values(
+        *PROFILE_FRAGMENT_FIELDS).first()
+    instance._fragment_fields_changed = previous is None or any(
+        str(previous[field] or '') != str(getattr(instance, field) or '')
+        for field in PROFILE_FRAGMENT_FIELDS
+    )
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_author_build_fragments(sender, instance, **kwargs):
+    """Drop cached fragments of every build by a renamed author"""
+    if getattr(instance, '_fragment_fields_changed', False):
+        fragment_cache.bump_versions_on_commit(list(
+            Build.objects.filter(user_id=instance.user_id)
+            .values_list('pk', flat=True)
+        ))
+
+
+@receiver(post_save, sender=Build)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Comment)
+def count_created_object(sender, instance, created, **kwargs):
+    """Add a new build, user or comment to the site totals"""
+    if created:
+        site_stats.adjust_total(SITE_TOTALS[sender], 1)
+
+
+@receiver(post_delete, sender=Build)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Comment)
+def count_deleted_object(sender, instance, **kwargs):
+    """Remove a deleted build, user or comment from the site totals"""
+    site_stats.adjust_total(SITE_TOTALS[sender], -1)
+
+
+@receiver(post_save, sender=Build)
+@receiver(post_delete, sender=Build)
+def invalidate_home_build_lists(sender, instance, **kwargs):
+    """Reload the home page build lists after a build changes"""
+    site_stats.invalidate_build_lists()
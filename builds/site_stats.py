@@ -0,0 +1,92 @@
+"""
+Site-wide statistics for the home page
+
+Totals are cached and kept current by builds.signals, which add or
+subtract one as builds, users and comments come and go. They expire
+after SITE_STATS_TOTALS_TIMEOUT seconds so any drift is corrected by a
+fresh COUNT. The recent and popular build lists are cached for
+SITE_STATS_LIST_TIMEOUT seconds and dropped whenever a build changes.
+
+A per-process cache only sees the changes made in its own process, so
+there both are kept for LOCAL_CACHE_TIMEOUT seconds at most.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from utils.cache_utils import get_cache_timeout
+
+TOTAL_KEY = 'site_stats:total:{}'
+LIST_KEY = 'site_stats:list:{}'
+BUILD_LISTS = ('recent_builds', 'popular_builds')
+
+
+def get_totals_timeout():
+    """Seconds cached totals live before being recounted"""
+    return get_cache_timeout(
+        getattr(settings, 'SITE_STATS_TOTALS_TIMEOUT', 3600))
+
+
+def get_list_timeout():
+    """Seconds the cached build lists live"""
+    return get_cache_timeout(
+        getattr(settings, 'SITE_STATS_LIST_TIMEOUT', 60))
+
+
+def _total_querysets():
+    from .models import Build, Comment
+
+    return {
+        'builds': Build.objects.all(),
+        'users': User.objects.all(),
+        'comments': Comment.objects.all(),
+    }
+
+
+def _build_lists():
+    from .models import Build
+
+    builds = Build.objects.select_related(
+        'user', 'user__profile'
+    ).prefetch_related('images')
+    return {
+        'recent_builds': builds.order_by('-created_at', '-id'),
+        'popular_builds': builds.order_by(
+            '-like_count', '-created_at', '-id'),
+    }
+
+
+def get_totals():
+    """Return {'builds': n, 'users': n, 'comments': n}"""
+    querysets = _total_querysets()
+    keys = {TOTAL_KEY.format(name): name for name in querysets}
+    cached = cache.get_many(keys.keys())
+
+    totals = {keys[key]: value for key, value in cached.items()}
+    for key, name in keys.items():
+        if name not in totals:
+            totals[name] = querysets[name].count()
+            cache.set(key, totals[name], timeout=get_totals_timeout())
+    return totals
+
+
+def adjust_total(name, delta):
+    """Add delta to a cached total; a missing total is recounted later"""
+    try:
+        cache.incr(TOTAL_KEY.format(name), delta)
+    except ValueError:
+        pass
+
+
+def get_build_list(name, limit=3):
+    """Return a cached list of builds for the home page"""
+    key = LIST_KEY.format(name)
+    builds = cache.get(key)
+    if builds is None:
+        builds = list(_build_lists()[name][:limit])
+        cache.set(key, builds, timeout=get_list_timeout())
+    return builds
+
+
+def invalidate_build_lists():
+    """Drop the cached build lists so the next request reloads them"""
+    cache.delete_many([LIST_KEY.format(name) for name in BUILD_LISTS])
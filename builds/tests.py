@@ -1,7 +1,33 @@
-from django.test import TestCase, Client
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature
+)
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Build, Comment, CommentVote
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from concurrent.futures import ThreadPoolExecutor
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+import base64
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from cloudinary import CloudinaryResource
+from cloudinary.exceptions import Error as CloudinaryError
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from users.models import UserProfile
+from utils import cache_utils, cloudinary_utils
+from .models import Build, BuildImage, Comment, CommentVote
+from .views import BuildListView
+from . import fragment_cache, site_stats, uploads, view_counts
 
 
 class CommentTestCase(TestCase):
@@ -417,3 +443,1554 @@ class BuildSortingTestCase(TestCase):
 
         self.assertEqual(response.context['current_sort'], 'popular')
         self.assertEqual(response.context['current_category'], 'PVE')
+
+
+class BuildListQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.user)
+        self.client = Client()
+
+    def create_builds(self, count):
+        """Create builds with an image, a like and a comment each"""
+        for i in range(count):
+            build = Build.objects.create(
+                user=self.user,
+                title=f'Build {i}',
+                description='A test build',
+                weapons='Sword',
+                armor='Armor',
+                talismans='Talisman',
+                category='PVE'
+            )
+            BuildImage.objects.create(build=build, image='sample')
+            build.liked_by.add(self.user)
+            Comment.objects.create(
+                build=build, user=self.user, content='Comment')
+
+    def count_list_queries(self):
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            return_value=('https://example.com/image.jpg', {})
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('build-list'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_builds(self):
+        """Test that the build list runs a constant number of queries"""
+        self.create_builds(2)
+        few_builds_queries = self.count_list_queries()
+
+        self.create_builds(6)
+        many_builds_queries = self.count_list_queries()
+
+        self.assertEqual(few_builds_queries, many_builds_queries)
+
+    def test_build_list_query_count(self):
+        """Test the build list query budget for anonymous visitors"""
+        self.create_builds(5)
+
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            return_value=('https://example.com/image.jpg', {})
+        ):
+            # Page count, builds with user/profile/counts, their images
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('build-list'))
+
+        self.assertContains(response, '⚡ 1 Grace')
+        self.assertContains(response, 'https://example.com/image.jpg')
+
+
+def make_cursor(values):
+    """Encode sort key values the way pagination.encode_cursor does"""
+    payload = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+class BuildPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+
+        self.builds = []
+        for i in range(15):
+            self.builds.append(Build.objects.create(
+                user=self.user1,
+                title=f'Build {i:02d}',
+                description='A test build',
+                weapons='Sword',
+                armor='Armor',
+                talismans='Talisman',
+                category='PVE'
+            ))
+
+        # Give a few builds likes so the popular sort has ties to break
+        for build in self.builds[3:6]:
+            build.liked_by.add(self.user1)
+        self.builds[4].liked_by.add(self.user2)
+
+        self.client = Client()
+
+    def walk_cursor_pages(self, sort):
+        """Follow next_cursor links and return every build id seen"""
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(
+                reverse('build-list'), {'sort': sort, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            seen.extend(build.pk for build in response.context['builds'])
+            cursor = response.context['next_cursor']
+        return seen
+
+    def test_list_is_paginated(self):
+        """Test that the build list only loads one page of builds"""
+        response = self.client.get(reverse('build-list'))
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['builds']), 12)
+
+        response = self.client.get(reverse('build-list') + '?page=2')
+        self.assertEqual(len(response.context['builds']), 3)
+
+    def test_cursor_pages_match_offset_order(self):
+        """Test that cursor paging visits every build once, in order"""
+        for sort in BuildListView.CURSOR_SORTS:
+            expected = list(Build.objects.order_by(
+                *BuildListView.SORT_ORDERINGS[sort]
+            ).values_list('pk', flat=True))
+            self.assertEqual(self.walk_cursor_pages(sort), expected)
+
+    def test_popular_cursor_order(self):
+        """Test that the popular sort keeps most liked builds first"""
+        seen = self.walk_cursor_pages('popular')
+        self.assertEqual(seen[0], self.builds[4].pk)
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 15)
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor returns 404"""
+        response = self.client.get(
+            reverse('build-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_wrongly_typed_cursor(self):
+        """Test that a cursor decoding to the wrong types returns 404"""
+        for sort, values in (
+                ('newest', ['yesterday', 5]),
+                ('newest', ['2024-01-01T00:00:00+00:00', 'five']),
+                ('popular', ['many', '2024-01-01T00:00:00+00:00', 5]),
+                ('popular', [None, '2024-01-01T00:00:00+00:00', 5])):
+            response = self.client.get(
+                reverse('build-list'),
+                {'sort': sort, 'cursor': make_cursor(values)})
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_cursor_page_skips_count_query(self):
+        """Test that cursor pages don't run a COUNT over all builds"""
+        # Builds with user/profile/counts, then their images
+        with self.assertNumQueries(2):
+            self.client.get(reverse('build-list') + '?cursor=')
+
+
+class BuildCounterTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.user1)
+        UserProfile.objects.get_or_create(user=self.user2)
+
+        self.build = Build.objects.create(
+            user=self.user1,
+            title='Test Build',
+            description='A test build for testing',
+            weapons='Test Sword',
+            armor='Test Armor',
+            talismans='Test Talisman',
+            category='PVE'
+        )
+
+        self.client = Client()
+
+    def test_like_view_maintains_like_count(self):
+        """Test that liking and unliking keeps like_count accurate"""
+        self.client.login(username='testuser2', password='testpass123')
+        url = reverse('build-like', kwargs={'pk': self.build.pk})
+
+        response = self.client.post(
+            url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['total_likes'], 1)
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.like_count, 1)
+
+        response = self.client.post(
+            url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['total_likes'], 0)
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.like_count, 0)
+
+    def test_like_count_ignores_duplicate_adds_and_missing_removes(self):
+        """Test that no-op m2m changes don't move the counter"""
+        self.build.liked_by.add(self.user1, self.user2)
+        self.build.liked_by.add(self.user2)
+        self.build.liked_by.remove(self.user2)
+        self.build.liked_by.remove(self.user2)
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.like_count, 1)
+
+        self.user1.liked_builds.clear()
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.like_count, 0)
+
+    def test_deleting_a_user_recounts_their_likes(self):
+        """Test that likes removed by the user cascade leave the counter"""
+        other_build = Build.objects.create(
+            user=self.user1, title='Other Build', category='PVP')
+        fan = User.objects.create_user(username='fan')
+        for user in (self.user2, fan):
+            self.build.liked_by.add(user)
+        other_build.liked_by.add(fan)
+
+        old_version = fragment_cache.get_version(self.build.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            fan.delete()
+
+        self.build.refresh_from_db()
+        other_build.refresh_from_db()
+        self.assertEqual(self.build.like_count, 1)
+        self.assertEqual(other_build.like_count, 0)
+        self.assertNotEqual(
+            fragment_cache.get_version(self.build.pk), old_version)
+
+    def test_comment_views_maintain_comment_count(self):
+        """Test that creating and deleting comments keeps comment_count"""
+        self.client.login(username='testuser2', password='testpass123')
+        self.client.post(
+            reverse('comment-create', kwargs={'pk': self.build.pk}),
+            {'content': 'A comment'}
+        )
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.comment_count, 1)
+
+        comment = Comment.objects.get(build=self.build)
+        self.client.post(
+            reverse('comment-delete', kwargs={'pk': comment.pk}))
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.comment_count, 0)
+
+    def test_recount_command_repairs_drift(self):
+        """Test that recount_build_stats fixes drifted counters"""
+        self.build.liked_by.add(self.user2)
+        Comment.objects.create(
+            build=self.build, user=self.user2, content='Comment')
+        Build.objects.filter(pk=self.build.pk).update(
+            like_count=7, comment_count=0)
+
+        out = StringIO()
+        call_command('recount_build_stats', stdout=out)
+
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.like_count, 1)
+        self.assertEqual(self.build.comment_count, 1)
+        self.assertIn('repaired counters on 1 builds', out.getvalue())
+
+
+class BuildSearchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='moonlightsorcerer',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.title_match = Build.objects.create(
+            user=self.user,
+            title='Moonveil Samurai',
+            description='Fast katana build',
+            weapons='Uchigatana',
+            armor='Land of Reeds',
+            talismans='Shard of Alexander',
+            category='PVE'
+        )
+        self.description_match = Build.objects.create(
+            user=self.user,
+            title='Bleed Build',
+            description='Swap to moonveil for bosses',
+            weapons='Rivers of Blood',
+            armor='White Mask',
+            talismans="Lord of Blood's Exultation",
+            category='PVP'
+        )
+        self.no_match = Build.objects.create(
+            user=self.user,
+            title='Faith Knight',
+            description='Lightning incantations',
+            weapons='Golden Order Seal',
+            armor='Crucible Knight',
+            talismans='Flock Canvas',
+            category='BOTH'
+        )
+        self.client = Client()
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('build-list'), {'search': query, **params})
+        return list(response.context['builds'])
+
+    def test_search_ranks_title_matches_first(self):
+        """Test that search results default to relevance order"""
+        builds = self.search('moonveil')
+        self.assertEqual(builds, [self.title_match, self.description_match])
+
+    def test_search_matches_prefixes_and_usernames(self):
+        """Test that partially typed words and authors match"""
+        self.assertEqual(self.search('uchiga'), [self.title_match])
+        self.assertEqual(len(self.search('moonlightsorc')), 3)
+
+    def test_search_index_follows_saves_and_deletes(self):
+        """Test that edited and deleted builds are reindexed"""
+        self.no_match.weapons = 'Moonveil'
+        self.no_match.save()
+        self.assertIn(self.no_match, self.search('moonveil'))
+
+        self.title_match.delete()
+        self.assertNotIn(self.title_match, self.search('moonveil'))
+
+    def test_search_with_explicit_sort(self):
+        """Test that an explicit sort overrides relevance ordering"""
+        builds = self.search('moonveil', sort='alphabetical')
+        self.assertEqual(builds, [self.description_match, self.title_match])
+
+    def test_search_ignores_fts_syntax(self):
+        """Test that FTS operators in user input don't cause errors"""
+        response = self.client.get(
+            reverse('build-list'), {'search': '"moon* OR NEAR('})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHE_SHARED=True)
+class BuildViewCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.user)
+        self.build = Build.objects.create(
+            user=self.user,
+            title='Test Build',
+            description='A test build for testing',
+            weapons='Test Sword',
+            armor='Test Armor',
+            talismans='Test Talisman',
+            category='PVE',
+            views=10
+        )
+        # Hold off automatic flushes unless a test asks for one
+        cache.add(view_counts.FLUSH_LOCK_KEY, 1, timeout=None)
+        self.client = Client()
+
+    def tearDown(self):
+        cache.clear()
+
+    def view_detail(self):
+        return self.client.get(
+            reverse('build-detail', kwargs={'pk': self.build.pk}))
+
+    def test_views_are_buffered_not_written(self):
+        """Test that detail hits don't update the Build row"""
+        self.view_detail()
+        response = self.view_detail()
+
+        self.assertEqual(response.context['object'].views, 12)
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.views, 10)
+
+    def test_build_list_shows_buffered_views(self):
+        """Test that listings include views that aren't flushed yet"""
+        self.view_detail()
+        response = self.client.get(reverse('build-list'))
+        self.assertEqual(response.context['builds'][0].views, 11)
+
+    def test_flush_writes_buffered_views(self):
+        """Test that flushing moves buffered views to the database"""
+        self.view_detail()
+        self.view_detail()
+
+        out = StringIO()
+        call_command('flush_build_views', stdout=out)
+
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.views, 12)
+        self.assertEqual(
+            view_counts.get_pending_views([self.build.pk]),
+            {self.build.pk: 0})
+        self.assertIn('Flushed view counts for 1 builds', out.getvalue())
+
+        # Nothing left to flush, and later hits still count
+        self.assertEqual(view_counts.flush_view_counts(), 0)
+        response = self.view_detail()
+        self.assertEqual(response.context['object'].views, 13)
+
+    def test_flush_runs_when_due(self):
+        """Test that a hit flushes the buffer once the interval passes"""
+        self.view_detail()
+        cache.delete(view_counts.FLUSH_LOCK_KEY)
+
+        self.view_detail()
+
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.views, 12)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_per_process_cache_writes_views(self):
+        """Test that views go straight to the row without a shared cache"""
+        self.view_detail()
+        response = self.view_detail()
+
+        self.assertEqual(response.context['object'].views, 12)
+        self.build.refresh_from_db()
+        self.assertEqual(self.build.views, 12)
+        self.assertEqual(view_counts.get_pending_views([self.build.pk]), {})
+
+
+class BuildDetailCommentQueryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(
+                username=f'testuser{i}',
+                email=f'test{i}@example.com',
+                password='testpass123'
+            )
+            UserProfile.objects.get_or_create(user=user)
+            self.users.append(user)
+
+        self.build = Build.objects.create(
+            user=self.users[0],
+            title='Test Build',
+            description='A test build for testing',
+            weapons='Test Sword',
+            armor='Test Armor',
+            talismans='Test Talisman',
+            category='PVE'
+        )
+        # Keep buffered view flushes out of the query counts
+        cache.add(view_counts.FLUSH_LOCK_KEY, 1, timeout=None)
+        self.client = Client()
+        self.client.login(username='testuser1', password='testpass123')
+
+    def tearDown(self):
+        cache.clear()
+
+    def add_comments(self, count):
+        """Add comments, each upvoted and downvoted by other users"""
+        for i in range(count):
+            comment = Comment.objects.create(
+                build=self.build, user=self.users[i % 3], content='Hi')
+            CommentVote.objects.create(
+                comment=comment, user=self.users[1], vote_type='upvote')
+            CommentVote.objects.create(
+                comment=comment, user=self.users[2], vote_type='downvote')
+
+    def count_detail_queries(self, sort):
+        url = reverse('build-detail', kwargs={'pk': self.build.pk})
+        # Warm the per-request caches so only comment queries can differ
+        self.client.get(url, {'comment_sort': sort})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'comment_sort': sort})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_comments(self):
+        """Test that every comment sort uses a constant number of queries"""
+        for sort in ('newest', 'oldest', 'popular'):
+            self.add_comments(2)
+            few_comments = self.count_detail_queries(sort)
+            self.add_comments(5)
+            many_comments = self.count_detail_queries(sort)
+            self.assertEqual(few_comments, many_comments, sort)
+
+    def test_vote_tallies_and_current_user_vote(self):
+        """Test that annotated tallies and the user's vote are shown"""
+        self.add_comments(1)
+        comment = Comment.objects.get()
+        CommentVote.objects.create(
+            comment=comment, user=self.users[0], vote_type='upvote')
+
+        response = self.client.get(
+            reverse('build-detail', kwargs={'pk': self.build.pk}),
+            {'comment_sort': 'popular'})
+        shown = response.context['comments'][0]
+
+        self.assertEqual(shown.upvote_count, 2)
+        self.assertEqual(shown.downvote_count, 1)
+        self.assertEqual(shown.score, 1)
+        self.assertEqual(shown.current_user_vote, 'upvote')
+
+
+class CommentPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.voter = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.user)
+        UserProfile.objects.get_or_create(user=self.voter)
+
+        self.build = Build.objects.create(
+            user=self.user,
+            title='Test Build',
+            description='A test build for testing',
+            weapons='Test Sword',
+            armor='Test Armor',
+            talismans='Test Talisman',
+            category='PVE'
+        )
+        self.comments = [
+            Comment.objects.create(
+                build=self.build, user=self.user, content=f'Comment {i}')
+            for i in range(45)
+        ]
+        # Give some comments the same score so ties need the tiebreaker
+        for comment in self.comments[::3]:
+            CommentVote.objects.create(
+                comment=comment, user=self.voter, vote_type='upvote')
+        self.client = Client()
+        self.url = reverse('comment-list', kwargs={'pk': self.build.pk})
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_detail_shows_first_page(self):
+        """Test that the detail page renders one page and a cursor"""
+        response = self.client.get(
+            reverse('build-detail', kwargs={'pk': self.build.pk}))
+
+        self.assertEqual(len(response.context['comments']), 20)
+        self.assertIsNotNone(response.context['next_comment_cursor'])
+        self.assertContains(response, 'Load more comments')
+        self.assertContains(response, 'Comments (45)')
+
+    def test_load_more_pages_through_every_comment(self):
+        """Test that following cursors returns each comment exactly once"""
+        for sort in ('newest', 'oldest', 'popular'):
+            detail = self.client.get(
+                reverse('build-detail', kwargs={'pk': self.build.pk}),
+                {'comment_sort': sort})
+            seen = [comment.pk for comment in detail.context['comments']]
+            cursor = detail.context['next_comment_cursor']
+
+            pages = 0
+            while cursor:
+                response = self.client.get(
+                    self.url, {'sort': sort, 'cursor': cursor},
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                seen += [
+                    int(pk) for pk in
+                    re.findall(r'id="comment-(\d+)"', data['html'])
+                ]
+                cursor = data['next_cursor']
+                pages += 1
+
+            self.assertEqual(pages, 2, sort)
+            self.assertEqual(len(seen), 45, sort)
+            self.assertEqual(
+                set(seen), {comment.pk for comment in self.comments}, sort)
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test that a tampered cursor or sort returns a 400"""
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(self.url, {'sort': 'random'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(
+            reverse('build-detail', kwargs={'pk': self.build.pk}),
+            {'comment_cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_wrongly_typed_cursor_is_rejected(self):
+        """Test that a cursor decoding to the wrong types returns a 400"""
+        for sort, values in (
+                ('newest', ['yesterday', 5]),
+                ('popular', ['high', '2024-01-01T00:00:00+00:00', 5])):
+            response = self.client.get(
+                self.url, {'sort': sort, 'cursor': make_cursor(values)})
+            self.assertEqual(response.status_code, 400, values)
+
+
+class BuildFragmentCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.fan = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        self.profile, _ = UserProfile.objects.get_or_create(user=self.user)
+        UserProfile.objects.get_or_create(user=self.fan)
+
+        self.build = Build.objects.create(
+            user=self.user,
+            title='Test Build',
+            description='A test build for testing',
+            weapons='Test Sword',
+            armor='Test Armor',
+            talismans='Test Talisman',
+            category='PVE'
+        )
+        cache.add(view_counts.FLUSH_LOCK_KEY, 1, timeout=None)
+        self.client = Client()
+        self.detail_url = reverse('build-detail', kwargs={'pk': self.build.pk})
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_detail(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_cached_detail_skips_fragment_queries(self):
+        """Test that a warm detail page doesn't load the build's images"""
+        first, first_queries = self.get_detail()
+        second, second_queries = self.get_detail()
+
+        image_table = BuildImage._meta.db_table
+        self.assertTrue(any(image_table in sql for sql in first_queries))
+        self.assertFalse(any(image_table in sql for sql in second_queries))
+        self.assertContains(second, 'Test Sword')
+
+    def test_build_edit_invalidates(self):
+        """Test that saving a build re-renders its fragments"""
+        self.get_detail()
+        self.build.weapons = 'Moonveil'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.build.save()
+
+        response, _ = self.get_detail()
+        self.assertContains(response, 'Moonveil')
+        self.assertNotContains(response, 'Test Sword')
+
+    def test_likes_and_comments_invalidate(self):
+        """Test that cached stats follow likes and comments"""
+        old_version = fragment_cache.get_version(self.build.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.build.liked_by.add(self.fan)
+        self.assertNotEqual(
+            fragment_cache.get_version(self.build.pk), old_version)
+
+        old_version = fragment_cache.get_version(self.build.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(
+                build=self.build, user=self.fan, content='Nice')
+        self.assertNotEqual(
+            fragment_cache.get_version(self.build.pk), old_version)
+
+        old_version = fragment_cache.get_version(self.build.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            CommentVote.objects.create(
+                comment=comment, user=self.user, vote_type='upvote')
+        self.assertNotEqual(
+            fragment_cache.get_version(self.build.pk), old_version)
+
+        response, _ = self.get_detail()
+        self.assertContains(
+            response,
+            '<span class="badge bg-warning text-dark" data-grace-count>1</span>',
+            html=True)
+
+    def test_profile_display_name_invalidates(self):
+        """Test that renaming the author updates cached build cards"""
+        response = self.client.get(reverse('build-list'))
+        self.assertContains(response, 'testuser1')
+
+        self.profile.display_name = 'Tarnished'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+
+        response = self.client.get(reverse('build-list'))
+        self.assertContains(response, 'Tarnished')
+
+    def test_invalidation_waits_for_commit(self):
+        """Test that fragments stay cached until the change commits"""
+        old_version = fragment_cache.get_version(self.build.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.build.weapons = 'Moonveil'
+            self.build.save()
+            self.assertEqual(
+                fragment_cache.get_version(self.build.pk), old_version)
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        self.assertNotEqual(
+            fragment_cache.get_version(self.build.pk), old_version)
+
+    def test_per_process_cache_keeps_fragments_briefly(self):
+        """Test that other processes' bumps are picked up soon"""
+        with self.settings(
+                CACHE_SHARED=False, BUILD_FRAGMENT_CACHE_TIMEOUT=3600):
+            self.assertEqual(
+                fragment_cache.get_fragment_timeout(),
+                cache_utils.LOCAL_CACHE_TIMEOUT)
+        with self.settings(
+                CACHE_SHARED=True, BUILD_FRAGMENT_CACHE_TIMEOUT=3600):
+            self.assertEqual(fragment_cache.get_fragment_timeout(), 3600)
+
+    def test_unrelated_profile_edit_keeps_fragments(self):
+        """Test that profile fields not shown on builds keep the cache"""
+        old_version = fragment_cache.get_version(self.build.pk)
+        self.profile.bio = 'Praise the sun'
+        self.profile.save()
+        self.assertEqual(
+            fragment_cache.get_version(self.build.pk), old_version)
+
+
+class SiteStatsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.user)
+        self.build = Build.objects.create(
+            user=self.user,
+            title='Test Build',
+            description='A test build for testing',
+            weapons='Test Sword',
+            armor='Test Armor',
+            talismans='Test Talisman',
+            category='PVE'
+        )
+        self.client = Client()
+
+    def tearDown(self):
+        cache.clear()
+
+    @mock.patch(
+        'utils.cloudinary_utils.cloudinary_url',
+        return_value=('https://example.com/image.jpg', {}))
+    def test_warm_home_page_runs_no_queries(self, mock_url):
+        """Test that the home page is served from cache once warm"""
+        BuildImage.objects.create(
+            build=self.build, image='sample', is_primary=True)
+        self.client.get(reverse('home'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_builds'], 1)
+        self.assertEqual(
+            response.context['recent_builds'][0].get_image_url(),
+            'https://example.com/image.jpg')
+
+    def test_totals_follow_creates_and_deletes(self):
+        """Test that signals keep the cached totals current"""
+        self.assertEqual(
+            site_stats.get_totals(),
+            {'builds': 1, 'users': 1, 'comments': 0})
+
+        other = User.objects.create_user(username='testuser2')
+        comment = Comment.objects.create(
+            build=self.build, user=other, content='Nice')
+        Build.objects.create(user=other, title='Second', category='PVP')
+
+        with self.assertNumQueries(0):
+            totals = site_stats.get_totals()
+        self.assertEqual(totals, {'builds': 2, 'users': 2, 'comments': 1})
+
+        comment.delete()
+        self.assertEqual(site_stats.get_totals()['comments'], 0)
+
+    def test_per_process_cache_recounts_soon(self):
+        """Test that totals other processes changed are recounted soon"""
+        with self.settings(
+                CACHE_SHARED=False, SITE_STATS_TOTALS_TIMEOUT=3600,
+                SITE_STATS_LIST_TIMEOUT=60):
+            self.assertEqual(
+                site_stats.get_totals_timeout(),
+                cache_utils.LOCAL_CACHE_TIMEOUT)
+            self.assertEqual(
+                site_stats.get_list_timeout(),
+                cache_utils.LOCAL_CACHE_TIMEOUT)
+        with self.settings(
+                CACHE_SHARED=True, SITE_STATS_TOTALS_TIMEOUT=3600):
+            self.assertEqual(site_stats.get_totals_timeout(), 3600)
+
+    def test_new_build_refreshes_lists(self):
+        """Test that a new build shows up in the cached recent list"""
+        site_stats.get_build_list('recent_builds')
+        newer = Build.objects.create(
+            user=self.user, title='Newer', category='PVP')
+
+        recent = site_stats.get_build_list('recent_builds')
+        self.assertEqual(recent[0].pk, newer.pk)
+
+
+class BuildLikeToggleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='testpass123'
+        )
+        self.fan = User.objects.create_user(
+            username='fan',
+            email='fan@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.owner)
+        UserProfile.objects.get_or_create(user=self.fan)
+        self.build = Build.objects.create(
+            user=self.owner,
+            title='Test Build',
+            description='A test build for testing',
+            category='PVE'
+        )
+        self.client = Client()
+        self.client.login(username='fan', password='testpass123')
+        self.url = reverse('build-like', kwargs={'pk': self.build.pk})
+
+    def tearDown(self):
+        cache.clear()
+
+    def toggle(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return response.json(), len(queries)
+
+    def test_toggle_cost_does_not_grow_with_likes(self):
+        """Test that toggling never loads the build's likers"""
+        liked, _ = self.toggle()
+        unliked, few_likes = self.toggle()
+
+        others = [
+            User.objects.create_user(username=f'liker{i}') for i in range(30)
+        ]
+        self.build.liked_by.add(*others)
+        liked_again, _ = self.toggle()
+        unliked_again, many_likes = self.toggle()
+
+        self.assertEqual(few_likes, many_likes)
+        self.assertEqual(
+            (liked['is_liked'], liked['total_likes']), (True, 1))
+        self.assertEqual(
+            (unliked['is_liked'], unliked['total_likes']), (False, 0))
+        self.assertEqual(liked_again['total_likes'], 31)
+        self.assertEqual(unliked_again['total_likes'], 30)
+
+    def test_detail_shows_like_state_without_loading_likers(self):
+        """Test that the grace button reflects the viewer's like"""
+        detail_url = reverse('build-detail', kwargs={'pk': self.build.pk})
+        self.assertContains(self.client.get(detail_url), 'Grace Build')
+
+        self.toggle()
+        response = self.client.get(detail_url)
+        self.assertTrue(response.context['user_has_liked'])
+        self.assertContains(response, 'Remove Grace')
+
+    def test_repeated_toggles_keep_count_exact(self):
+        """Test the locked toggle path sequentially, on any database"""
+        Like = Build.liked_by.through
+        clients = [self.client]
+        for i in range(3):
+            User.objects.create_user(
+                username=f'toggler{i}', password='testpass123')
+            client = Client()
+            client.login(username=f'toggler{i}', password='testpass123')
+            clients.append(client)
+
+        for round_number in range(5):
+            for i, client in enumerate(clients):
+                # Each client toggles a different number of times
+                for _ in range(i + 1):
+                    response = client.post(
+                        self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                    likes = Like.objects.filter(build=self.build).count()
+                    self.assertEqual(response.json()['total_likes'], likes)
+                self.build.refresh_from_db()
+                self.assertEqual(
+                    self.build.like_count,
+                    Like.objects.filter(build=self.build).count())
+
+        # Odd toggle counts end liked after five rounds
+        self.assertEqual(
+            set(self.build.liked_by.values_list('username', flat=True)),
+            {'fan', 'toggler1'})
+        self.assertEqual(self.build.like_count, 2)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class BuildLikeConcurrencyTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner')
+        UserProfile.objects.get_or_create(user=self.owner)
+        self.build = Build.objects.create(
+            user=self.owner, title='Test Build', category='PVE')
+        self.users = []
+        for i in range(8):
+            user = User.objects.create_user(
+                username=f'fan{i}', password='testpass123')
+            UserProfile.objects.get_or_create(user=user)
+            self.users.append(user)
+        self.url = reverse('build-like', kwargs={'pk': self.build.pk})
+
+    def tearDown(self):
+        cache.clear()
+
+    def toggle_likes(self, user, times):
+        """Log in as a user and toggle their like several times"""
+        try:
+            client = Client()
+            client.login(username=user.username, password='testpass123')
+            for _ in range(times):
+                response = client.post(
+                    self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                self.assertEqual(response.status_code, 200)
+        finally:
+            connection.close()
+
+    def test_parallel_toggles_converge(self):
+        """Test that racing like/unlike requests leave an exact count"""
+        # Odd numbers of toggles end liked, even numbers end unliked
+        toggles = {user: 3 if i % 2 else 4 for i, user in
+                   enumerate(self.users)}
+        with ThreadPoolExecutor(max_workers=len(self.users)) as executor:
+            futures = [
+                executor.submit(self.toggle_likes, user, times)
+                for user, times in toggles.items()
+            ]
+            for future in futures:
+                future.result()
+
+        expected = {user.pk for user, times in toggles.items() if times % 2}
+        self.build.refresh_from_db()
+        self.assertEqual(
+            set(self.build.liked_by.values_list('pk', flat=True)), expected)
+        self.assertEqual(self.build.like_count, len(expected))
+
+
+def fake_cloudinary_url(public_id, **options):
+    """Stand-in for cloudinary_url that shows the size in the URL"""
+    return (
+        f"https://example.com/{public_id}/{options.get('width')}.jpg",
+        options)
+
+
+class CloudinaryUrlCacheTestCase(TestCase):
+    def setUp(self):
+        cloudinary_utils.clear_url_cache()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.build = Build.objects.create(
+            user=self.user,
+            title='Test Build',
+            description='A test build for testing',
+            category='PVE'
+        )
+
+    def tearDown(self):
+        cloudinary_utils.clear_url_cache()
+
+    def test_urls_are_memoized(self):
+        """Test that each image and preset is generated only once"""
+        BuildImage.objects.create(build=self.build, image='sample')
+        build = Build.objects.get(pk=self.build.pk)
+
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            side_effect=fake_cloudinary_url
+        ) as mock_url:
+            for _ in range(3):
+                medium = build.get_image_url()
+                large = build.get_image_url('large')
+        self.assertEqual(mock_url.call_count, 2)
+        self.assertEqual(medium, 'https://example.com/sample/600.jpg')
+        self.assertEqual(large, 'https://example.com/sample/1200.jpg')
+
+    @override_settings(CLOUDINARY_STORE_IMAGE_URLS=True)
+    def test_preset_urls_are_stored_on_upload(self):
+        """Test that stored URLs are served without generating any"""
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            side_effect=fake_cloudinary_url
+        ):
+            image = BuildImage.objects.create(build=self.build, image='sample')
+        image.refresh_from_db()
+        self.assertEqual(set(image.image_urls), set(
+            cloudinary_utils.BUILD_SIZES))
+
+        cloudinary_utils.clear_url_cache()
+        build = Build.objects.get(pk=self.build.pk)
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url'
+        ) as mock_url:
+            url = build.get_image_url('thumbnail')
+        mock_url.assert_not_called()
+        self.assertEqual(url, 'https://example.com/sample/300.jpg')
+
+    @override_settings(CLOUDINARY_STORE_IMAGE_URLS=True)
+    def test_refresh_command_fills_existing_rows(self):
+        """Test that refresh_image_urls stores URLs on older rows"""
+        with override_settings(CLOUDINARY_STORE_IMAGE_URLS=False):
+            image = BuildImage.objects.create(build=self.build, image='sample')
+            profile, _ = UserProfile.objects.get_or_create(user=self.user)
+            profile.profile_picture = 'avatar'
+            profile.save()
+
+        out = StringIO()
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            side_effect=fake_cloudinary_url
+        ):
+            call_command('refresh_image_urls', stdout=out)
+        self.assertIn('1 build images and 1 profile pictures', out.getvalue())
+
+        image.refresh_from_db()
+        profile.refresh_from_db()
+        self.assertEqual(
+            image.image_urls['large'], 'https://example.com/sample/1200.jpg')
+        self.assertEqual(
+            profile.get_profile_picture_url('small'),
+            'https://example.com/avatar/50.jpg')
+
+
+class ResponsiveImageTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        cloudinary_utils.clear_url_cache()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.build = Build.objects.create(
+            user=self.user,
+            title='Test Build',
+            description='A test build for testing',
+            category='PVE'
+        )
+
+    def tearDown(self):
+        cache.clear()
+        cloudinary_utils.clear_url_cache()
+
+    def render(self, source, **context):
+        from django.template import Context, Template
+
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            side_effect=fake_cloudinary_url
+        ):
+            return Template(
+                '{% load cloudinary_tags %}' + source).render(Context(context))
+
+    def test_cloudinary_image_has_srcset_and_dimensions(self):
+        """Test that the tag lists every preset with width descriptors"""
+        image = BuildImage.objects.create(build=self.build, image='sample')
+        image.refresh_from_db()
+
+        html = self.render(
+            "{% cloudinary_image image.image 'medium' 'img-fluid' alt %}",
+            image=image, alt='A <build>')
+        self.assertIn('src="https://example.com/sample/600.jpg"', html)
+        self.assertIn(
+            'srcset="https://example.com/sample/300.jpg 300w, '
+            'https://example.com/sample/600.jpg 600w, '
+            'https://example.com/sample/1200.jpg 1200w"', html)
+        self.assertIn('sizes="(max-width: 600px) 100vw, 600px"', html)
+        self.assertIn('width="600" height="400"', html)
+        self.assertIn('alt="A &lt;build&gt;"', html)
+
+    def test_build_cards_get_srcset_only_for_uploads(self):
+        """Test that emblem builds render without a srcset"""
+        emblem_build = Build.objects.create(
+            user=self.user, title='No Image', category='PVP')
+        BuildImage.objects.create(build=self.build, image='sample')
+
+        source = '{% build_image_srcset build %}'
+        self.assertIn(
+            'https://example.com/sample/1200.jpg 1200w',
+            self.render(source, build=self.build))
+        self.assertEqual(self.render(source, build=emblem_build), '')
+
+        with mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            side_effect=fake_cloudinary_url
+        ):
+            response = self.client.get(reverse('build-list'))
+        self.assertContains(response, 'sample/300.jpg 300w', count=1)
+        self.assertContains(response, 'width="600" height="400"', count=2)
+
+    def test_build_cards_use_preset_dimensions(self):
+        """Test that card images take their size from BUILD_SIZES"""
+        source = '{% build_image_dimensions %}'
+        self.assertEqual(self.render(source), ' width="600" height="400"')
+        with mock.patch.dict(
+                'utils.cloudinary_utils.BUILD_SIZES',
+                {'medium': {'width': 640, 'height': 360}}):
+            self.assertEqual(
+                self.render(source), ' width="640" height="360"')
+            self.assertEqual(
+                self.render("{% build_image_dimensions 'large' %}"),
+                ' width="1200" height="800"')
+
+
+class DirectUploadTestCase(TestCase):
+    def setUp(self):
+        self.upload_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_root)
+        backend_settings = override_settings(
+            BUILD_IMAGE_UPLOAD_BACKEND='builds.uploads.LocalUploadBackend',
+            BUILD_IMAGE_LOCAL_UPLOAD_ROOT=self.upload_root,
+        )
+        backend_settings.enable()
+        self.addCleanup(backend_settings.disable)
+
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def upload(self, name='shot.png'):
+        """Do what the browser does: fetch parameters, post the file"""
+        params = self.client.get(
+            reverse('build-image-upload-params')).json()
+        response = self.client.post(params['url'], {
+            **params['fields'],
+            'file': SimpleUploadedFile(name, b'image bytes'),
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def build_data(self, results):
+        return {
+            'title': 'Direct Build',
+            'description': 'Uploaded straight to storage',
+            'weapons': 'Moonveil',
+            'armor': 'Raging Wolf Set',
+            'talismans': 'Shard of Alexander',
+            'category': 'PVE',
+            'images-TOTAL_FORMS': '0',
+            'images-INITIAL_FORMS': '0',
+            'uploaded_images': [json.dumps(result) for result in results],
+        }
+
+    def test_create_records_direct_uploads(self):
+        """Test that the view stores the public ids it was given"""
+        first, second = self.upload(), self.upload('second.jpg')
+        self.assertTrue(first['public_id'].startswith('build_images/'))
+
+        response = self.client.post(
+            reverse('build-create'), self.build_data([first, second]))
+        self.assertEqual(response.status_code, 302)
+
+        build = Build.objects.get(title='Direct Build')
+        images = list(build.images.all())
+        self.assertEqual(
+            [image.image.public_id for image in images],
+            [first['public_id'], second['public_id']])
+        self.assertTrue(images[0].is_primary)
+        self.assertEqual(images[1].image.format, 'jpg')
+        self.assertTrue(os.path.exists(
+            os.path.join(self.upload_root, first['public_id'] + '.png')))
+
+    def test_tampered_upload_is_rejected(self):
+        """Test that results not signed by the backend are not recorded"""
+        result = self.upload()
+        result['public_id'] = 'build_images/someone_elses_image'
+
+        response = self.client.post(
+            reverse('build-create'), self.build_data([result]), follow=True)
+        build = Build.objects.get(title='Direct Build')
+        self.assertFalse(build.images.exists())
+        self.assertContains(response, 'could not be verified')
+
+    def test_update_adds_direct_uploads(self):
+        """Test that direct uploads are added after the kept images"""
+        build = Build.objects.create(
+            user=self.user, title='Old', description='Old', category='PVE')
+        BuildImage.objects.create(build=build, image='build_images/old')
+        result = self.upload()
+
+        response = self.client.post(
+            reverse('build-update', args=[build.pk]),
+            self.build_data([result]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            [image.image.public_id for image in build.images.all()],
+            ['build_images/old', result['public_id']])
+
+    def test_local_upload_checks_parameters(self):
+        """Test that the stand-in rejects bad and expired parameters"""
+        backend = uploads.get_backend()
+        fields = backend.get_upload_params(self.user)['fields']
+        url = reverse('build-image-local-upload')
+
+        forged = dict(fields, folder='profile_pics')
+        response = self.client.post(url, {
+            **forged, 'file': SimpleUploadedFile('a.png', b'x')})
+        self.assertEqual(response.status_code, 400)
+
+        expired = {
+            'folder': 'build_images',
+            'timestamp': int(time.time()) - uploads.SIGNATURE_MAX_AGE - 1,
+            'user_id': self.user.pk,
+            'nonce': 'expired',
+        }
+        expired['signature'] = backend.sign(expired)
+        response = self.client.post(url, {
+            **expired, 'file': SimpleUploadedFile('a.png', b'x')})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(url, {
+            **fields, 'file': SimpleUploadedFile('a.exe', b'x')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(os.listdir(self.upload_root), [])
+
+    def test_local_upload_parameters_are_single_use(self):
+        """Test that parameters upload one file, for their user only"""
+        other = User.objects.create_user(
+            username='otheruser', password='testpass123')
+        backend = uploads.get_backend()
+        url = reverse('build-image-local-upload')
+
+        fields = backend.get_upload_params(other)['fields']
+        response = self.client.post(url, {
+            **fields, 'file': SimpleUploadedFile('a.png', b'x')})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('another user', response.json()['error'])
+
+        fields = backend.get_upload_params(self.user)['fields']
+        response = self.client.post(url, {
+            **fields, 'file': SimpleUploadedFile('a.png', b'x')})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, {
+            **fields, 'file': SimpleUploadedFile('b.png', b'x')})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already been used', response.json()['error'])
+
+        self.client.logout()
+        fields = backend.get_upload_params(self.user)['fields']
+        response = self.client.post(url, {
+            **fields, 'file': SimpleUploadedFile('c.png', b'x')})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(os.listdir(
+            os.path.join(self.upload_root, 'build_images'))), 1)
+
+    @override_settings(
+        BUILD_IMAGE_UPLOAD_BACKEND='builds.uploads.CloudinaryUploadBackend')
+    def test_cloudinary_parameters_match_field_upload(self):
+        """Test that browser uploads get the field's folder and transform"""
+        import cloudinary
+        from cloudinary.utils import api_sign_request
+
+        config = cloudinary.config()
+        with mock.patch.multiple(
+                config, create=True, cloud_name='demo', api_key='key',
+                api_secret='secret'):
+            params = self.client.get(
+                reverse('build-image-upload-params')).json()
+            signature = api_sign_request(
+                {'public_id': 'build_images/abc', 'version': '5'}, 'secret',
+                signature_version=1)
+            backend = uploads.get_backend()
+            self.assertTrue(
+                backend.verify('build_images/abc', '5', signature))
+            self.assertFalse(
+                backend.verify('build_images/xyz', '5', signature))
+
+        self.assertEqual(
+            params['url'], 'https://api.cloudinary.com/v1_1/demo/image/upload')
+        fields = params['fields']
+        self.assertEqual(fields['folder'], 'build_images/')
+        self.assertEqual(
+            fields['transformation'], 'c_limit,f_auto,h_800,q_auto:good,w_1200')
+        self.assertEqual(fields['api_key'], 'key')
+        self.assertIn('signature', fields)
+
+
+class ServerUploadTestCase(TestCase):
+    def setUp(self):
+        cloudinary_utils.clear_url_cache()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def tearDown(self):
+        cloudinary_utils.clear_url_cache()
+
+    def build_data(self, *names):
+        return {
+            'title': 'Uploaded Build',
+            'description': 'Images posted with the form',
+            'weapons': 'Moonveil',
+            'armor': 'Raging Wolf Set',
+            'talismans': 'Shard of Alexander',
+            'category': 'PVE',
+            'images-TOTAL_FORMS': '0',
+            'images-INITIAL_FORMS': '0',
+            'images-0-image': [
+                SimpleUploadedFile(name, b'image bytes') for name in names],
+        }
+
+    def test_files_upload_concurrently_then_insert_once(self):
+        """Test that uploads overlap and the rows take one INSERT"""
+        # Each upload waits until all three are in flight
+        barrier = threading.Barrier(3, timeout=5)
+
+        def upload_resource(file, **options):
+            barrier.wait()
+            self.assertEqual(options['folder'], 'build_images/')
+            return CloudinaryResource(
+                'build_images/' + file.name.split('.')[0],
+                type='upload', resource_type='image')
+
+        with mock.patch(
+            'builds.uploads.uploader.upload_resource',
+            side_effect=upload_resource
+        ), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('build-create'),
+                self.build_data('one.png', 'two.png', 'three.png'))
+        self.assertEqual(response.status_code, 302)
+
+        image_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'builds_buildimage' in query['sql']]
+        self.assertEqual(len(image_queries), 1)
+        self.assertTrue(image_queries[0].startswith('INSERT'))
+
+        build = Build.objects.get(title='Uploaded Build')
+        images = list(build.images.all())
+        self.assertEqual(
+            [image.image.public_id for image in images],
+            ['build_images/one', 'build_images/two', 'build_images/three'])
+        self.assertEqual(
+            [image.is_primary for image in images], [True, False, False])
+
+    @override_settings(CLOUDINARY_STORE_IMAGE_URLS=True)
+    def test_bulk_created_images_store_urls(self):
+        """Test that rows inserted together still get their preset URLs"""
+        with mock.patch(
+            'builds.uploads.uploader.upload_resource',
+            return_value=CloudinaryResource(
+                'build_images/one', type='upload', resource_type='image')
+        ), mock.patch(
+            'utils.cloudinary_utils.cloudinary_url',
+            side_effect=fake_cloudinary_url
+        ):
+            self.client.post(
+                reverse('build-create'), self.build_data('one.png'))
+
+        image = BuildImage.objects.get()
+        self.assertEqual(
+            image.get_stored_url('medium'),
+            'https://example.com/build_images/one/600.jpg')
+
+    def test_failed_upload_is_skipped(self):
+        """Test that one failed upload doesn't lose the build or others"""
+        def upload_resource(file, **options):
+            if file.name == 'bad.png':
+                raise CloudinaryError('Upload failed')
+            return CloudinaryResource(
+                'build_images/good', type='upload', resource_type='image')
+
+        build = Build.objects.create(
+            user=self.user, title='Old', description='Old', category='PVE')
+        BuildImage.objects.create(build=build, image='build_images/old')
+
+        with mock.patch(
+            'builds.uploads.uploader.upload_resource',
+            side_effect=upload_resource
+        ):
+            response = self.client.post(
+                reverse('build-update', args=[build.pk]),
+                self.build_data('bad.png', 'good.png'))
+        self.assertIn(
+            'These images could not be uploaded: bad.png. '
+            'Please try adding them again.',
+            [str(message) for message in get_messages(response.wsgi_request)])
+        self.assertEqual(
+            [image.image.public_id for image in build.images.all()],
+            ['build_images/old', 'build_images/good'])
+
+
+class BuildImageEditTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.login(username='testuser', password='testpass123')
+        self.build = Build.objects.create(
+            user=self.user,
+            title='Test Build',
+            description='A test build for testing',
+            category='PVE'
+        )
+        self.images = [
+            BuildImage.objects.create(
+                build=self.build, image=f'build_images/{name}',
+                position=position, is_primary=(position == 0))
+            for position, name in enumerate(['first', 'second', 'third'])
+        ]
+
+    def edit(self, order, remove=(), files=()):
+        """Post the edit form, returning the image writes it made"""
+        data = {
+            'title': 'Test Build',
+            'description': 'A test build for testing',
+            'weapons': 'Moonveil',
+            'armor': 'Raging Wolf Set',
+            'talismans': 'Shard of Alexander',
+            'category': 'PVE',
+            'image_order': [image.pk for image in order],
+            'remove_images': [image.pk for image in remove],
+        }
+        if files:
+            data['images-0-image'] = [
+                SimpleUploadedFile(name, b'image bytes') for name in files]
+
+        def upload_resource(file, **options):
+            return CloudinaryResource(
+                'build_images/' + file.name.split('.')[0],
+                type='upload', resource_type='image')
+
+        with mock.patch(
+            'builds.uploads.uploader.upload_resource',
+            side_effect=upload_resource
+        ), CaptureQueriesContext(connection) as queries:
+            self.response = self.client.post(
+                reverse('build-update', args=[self.build.pk]), data)
+        self.assertEqual(self.response.status_code, 302)
+        return [
+            query['sql'].split()[0] for query in queries.captured_queries
+            if 'builds_buildimage' in query['sql']
+            and not query['sql'].startswith('SELECT')
+        ]
+
+    def public_ids(self):
+        return [image.image.public_id for image in self.build.images.all()]
+
+    def test_unchanged_images_are_not_written(self):
+        """Test that saving the form as-is leaves the images alone"""
+        self.assertEqual(self.edit(self.images), [])
+        self.assertEqual(self.public_ids(), [
+            'build_images/first', 'build_images/second',
+            'build_images/third'])
+
+    def test_reorder_reassigns_primary_in_one_update(self):
+        """Test that moving an image to the front is a single UPDATE"""
+        first, second, third = self.images
+        self.assertEqual(self.edit([third, first, second]), ['UPDATE'])
+        self.assertEqual(self.public_ids(), [
+            'build_images/third', 'build_images/first',
+            'build_images/second'])
+        self.assertEqual(
+            list(self.build.images.filter(is_primary=True)), [third])
+
+    def test_add_and_remove_touch_only_those_images(self):
+        """Test that one removal and one upload keep the other images"""
+        first, second, third = self.images
+        writes = self.edit(
+            [first, second, third], remove=[second], files=['new.png'])
+        self.assertEqual(writes, ['DELETE', 'UPDATE', 'INSERT'])
+        self.assertEqual(self.public_ids(), [
+            'build_images/first', 'build_images/third', 'build_images/new'])
+        self.assertEqual(
+            BuildImage.objects.get(pk=first.pk).image_urls, first.image_urls)
+
+    def test_removed_images_are_destroyed_after_commit(self):
+        """Test that removed images leave Cloudinary once the edit commits"""
+        first, second, third = self.images
+        with mock.patch('builds.uploads.uploader.destroy') as destroy:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.edit([first, second, third], remove=[second, third])
+            destroy.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+        self.assertEqual(
+            sorted(call.args[0] for call in destroy.call_args_list),
+            ['build_images/second', 'build_images/third'])
+
+        with mock.patch(
+            'builds.uploads.uploader.destroy',
+            side_effect=CloudinaryError('Not found')
+        ), self.assertLogs('builds.uploads', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.edit([second], remove=[first])
+        self.assertFalse(self.build.images.exists())
+
+    def test_removing_primary_promotes_next_image(self):
+        """Test that the first kept image becomes primary"""
+        first, second, third = self.images
+        self.edit([first, second, third], remove=[first])
+        self.assertEqual(
+            list(self.build.images.filter(is_primary=True)), [second])
+        self.assertEqual(self.build.images.count(), 2)
+
+    def test_new_images_beyond_limit_are_skipped(self):
+        """Test that a full build doesn't take more images"""
+        self.assertEqual(self.edit(self.images, files=['extra.png']), [])
+        self.assertEqual(self.build.images.count(), 3)
+        self.assertIn(
+            'A build can have at most 3 images, so 1 new image(s) were '
+            'not added.',
+            [str(message)
+             for message in get_messages(self.response.wsgi_request)])
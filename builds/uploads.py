@@ -0,0 +1,399 @@
+"""
+Direct-to-storage build image uploads
+
+The build form asks the server for signed upload parameters, the browser
+sends each image straight to the storage backend, and the form posts
+back only what the backend returned: public id, version, format and the
+backend's signature over them. The view verifies that signature and
+records the public ids, so image bytes never pass through a web worker
+or a database transaction.
+
+The backend class is set by BUILD_IMAGE_UPLOAD_BACKEND (a dotted path).
+CloudinaryUploadBackend signs uploads exactly like the server-side
+CloudinaryField upload, with the same folder and incoming
+transformation. LocalUploadBackend keeps files on disk behind the
+build-image-local-upload view and stands in for Cloudinary in tests and
+local development; its parameters are signed for one user and one
+upload.
+
+Files posted with the form when direct upload isn't available are sent to
+Cloudinary by upload_files, concurrently and before the view opens its
+transaction. Either way record_images then inserts the image rows in one
+query, and on the edit form sync_images writes only the images that were
+added, removed or moved. Removed images are destroyed on Cloudinary once
+the edit commits.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import cloudinary
+from cloudinary import CloudinaryResource, uploader
+from cloudinary.exceptions import Error as CloudinaryError
+from cloudinary.utils import (
+    build_upload_params, cloudinary_api_url, sign_request,
+    verify_api_response_signature
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+from utils.cloudinary_utils import get_build_image_urls, store_image_urls
+from .models import BuildImage, validate_image_size
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGES = 3
+ALLOWED_FORMATS = ('jpg', 'jpeg', 'png', 'webp')
+# Cloudinary rejects signed requests older than an hour
+SIGNATURE_MAX_AGE = 3600
+# Local upload parameters already used, kept until they expire
+USED_NONCE_KEY = 'build_uploads:nonce:{}'
+
+
+class UploadError(ValueError):
+    """A direct upload that is malformed or fails verification"""
+
+
+class BaseUploadBackend:
+    """Interface every upload backend implements"""
+
+    @property
+    def options(self):
+        """Upload options of BuildImage.image (folder, transformation)"""
+        return BuildImage._meta.get_field('image').options
+
+    @property
+    def folder(self):
+        return self.options['folder'].strip('/')
+
+    def get_upload_params(self, user):
+        """
+        Return what the browser needs to upload one image for `user`
+
+        A dict with the ``url`` to POST the file to (as ``file``) and
+        the signed form ``fields`` to send with it.
+        """
+        raise NotImplementedError
+
+    def verify(self, public_id, version, signature):
+        """Whether the backend signed this upload result"""
+        raise NotImplementedError
+
+
+class CloudinaryUploadBackend(BaseUploadBackend):
+    """Signed uploads straight to the Cloudinary upload API"""
+
+    def get_upload_params(self, user):
+        params = build_upload_params(
+            **self.options, allowed_formats=','.join(ALLOWED_FORMATS))
+        return {
+            'url': cloudinary_api_url(
+                'upload', resource_type=BuildImage._meta.get_field(
+                    'image').resource_type),
+            'fields': sign_request(params, {}),
+        }
+
+    def verify(self, public_id, version, signature):
+        if not cloudinary.config().api_secret:
+            return False
+        return verify_api_response_signature(public_id, version, signature)
+
+
+class LocalUploadBackend(BaseUploadBackend):
+    """
+    Uploads stored on the local filesystem
+
+    Files go to BUILD_IMAGE_LOCAL_UPLOAD_ROOT. Parameters and results
+    are signed with SECRET_KEY the way Cloudinary signs them with the
+    API secret. The parameters also carry the id of the user they were
+    issued to and a nonce, so they only authorize one upload by that
+    user.
+    """
+
+    def __init__(self):
+        self.storage = FileSystemStorage(location=getattr(
+            settings, 'BUILD_IMAGE_LOCAL_UPLOAD_ROOT',
+            settings.BASE_DIR / 'local_uploads'))
+
+    def sign(self, params):
+        payload = '&'.join(
+            f'{key}={params[key]}' for key in sorted(params))
+        return salted_hmac('builds.uploads', payload).hexdigest()
+
+    def get_upload_params(self, user):
+        fields = {
+            'folder': self.folder,
+            'timestamp': int(time.time()),
+            'user_id': user.pk,
+            'nonce': uuid.uuid4().hex,
+        }
+        fields['signature'] = self.sign(fields)
+        return {
+            'url': reverse('build-image-local-upload'),
+            'fields': fields,
+        }
+
+    def verify(self, public_id, version, signature):
+        expected = self.sign({'public_id': public_id, 'version': version})
+        return constant_time_compare(signature, expected)
+
+    def upload(self, fields, file, user):
+        """
+        Store a file posted by `user` with signed parameters
+
+        Returns the upload result the browser posts back to the form.
+        Raises UploadError for bad, expired or already used parameters,
+        parameters issued to another user, and files that are too large
+        or not an allowed format.
+        """
+        try:
+            params = {
+                'folder': fields['folder'],
+                'timestamp': int(fields['timestamp']),
+                'user_id': int(fields['user_id']),
+                'nonce': fields['nonce'],
+            }
+        except (KeyError, TypeError, ValueError):
+            raise UploadError('Missing upload parameters.')
+        if not constant_time_compare(
+                fields.get('signature', ''), self.sign(params)):
+            raise UploadError('Invalid upload signature.')
+        if params['user_id'] != user.pk:
+            raise UploadError('Upload parameters belong to another user.')
+        if time.time() - params['timestamp'] > SIGNATURE_MAX_AGE:
+            raise UploadError('Upload parameters have expired.')
+
+        try:
+            validate_image_size(file)
+        except ValidationError as error:
+            raise UploadError(error.messages[0])
+        image_format = os.path.splitext(file.name)[1].lstrip('.').lower()
+        if image_format not in ALLOWED_FORMATS:
+            raise UploadError('Unsupported image format.')
+        if not cache.add(
+                USED_NONCE_KEY.format(params['nonce']), 1,
+                timeout=SIGNATURE_MAX_AGE):
+            raise UploadError('Upload parameters have already been used.')
+
+        name = self.storage.save(
+            f'{params["folder"]}/{uuid.uuid4().hex}.{image_format}', file)
+        public_id = os.path.splitext(name)[0]
+        version = str(int(time.time()))
+        return {
+            'public_id': public_id,
+            'version': version,
+            'format': image_format,
+            'signature': self.sign(
+                {'public_id': public_id, 'version': version}),
+        }
+
+
+def get_backend():
+    """Return the upload backend configured in settings"""
+    backend = getattr(
+        settings,
+        'BUILD_IMAGE_UPLOAD_BACKEND',
+        'builds.uploads.CloudinaryUploadBackend')
+    return import_string(backend)()
+
+
+def parse_uploads(values, backend=None):
+    """
+    Verify upload results posted by the build form
+
+    Args:
+        values: JSON upload results, one per image, in display order
+        backend: Upload backend (default from settings)
+
+    Returns:
+        list: CloudinaryResource for each image, at most MAX_IMAGES
+
+    Raises:
+        UploadError: If any result is malformed or wasn't signed by the
+            backend
+    """
+    if backend is None:
+        backend = get_backend()
+
+    resources = []
+    for value in values[:MAX_IMAGES]:
+        try:
+            upload = json.loads(value)
+            public_id = str(upload['public_id'])
+            version = str(upload['version'])
+            image_format = str(upload.get('format') or '').lower()
+            signature = str(upload['signature'])
+        except (KeyError, TypeError, ValueError):
+            raise UploadError('Malformed upload result.')
+        if (not version.isdigit()
+                or not public_id.startswith(backend.folder + '/')
+                or (image_format and image_format not in ALLOWED_FORMATS)
+                or not backend.verify(public_id, version, signature)):
+            raise UploadError('Upload could not be verified.')
+        resources.append(CloudinaryResource(
+            public_id,
+            format=image_format or None,
+            version=version,
+            type='upload',
+            resource_type='image',
+        ))
+    return resources
+
+
+def upload_files(files):
+    """
+    Upload image files posted with the form to Cloudinary in parallel
+
+    Each file is uploaded with the options of BuildImage.image, as if
+    the row were saved with it, on its own thread.
+
+    Args:
+        files: Uploaded files, at most MAX_IMAGES are used
+
+    Returns:
+        tuple: (CloudinaryResource for each successful upload in the
+            order given, names of the files that failed)
+    """
+    files = files[:MAX_IMAGES]
+    if not files:
+        return [], []
+    field = BuildImage._meta.get_field('image')
+    options = {
+        'type': field.type,
+        'resource_type': field.resource_type,
+        **field.options,
+    }
+
+    def upload(file):
+        if file.seekable():
+            file.seek(0)
+        return uploader.upload_resource(file, **options)
+
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        futures = [executor.submit(upload, file) for file in files]
+
+    images, failed = [], []
+    for file, future in zip(files, futures):
+        try:
+            images.append(future.result())
+        except CloudinaryError:
+            failed.append(file.name)
+    return images, failed
+
+
+def destroy_images(public_ids):
+    """
+    Delete images from Cloudinary in parallel
+
+    Failures are logged rather than raised: the rows are already gone,
+    and an asset left behind only costs storage.
+    """
+    if not public_ids:
+        return
+    field = BuildImage._meta.get_field('image')
+
+    def destroy(public_id):
+        return uploader.destroy(
+            public_id, type=field.type, resource_type=field.resource_type,
+            invalidate=True)
+
+    with ThreadPoolExecutor(max_workers=len(public_ids)) as executor:
+        futures = [
+            executor.submit(destroy, public_id) for public_id in public_ids]
+
+    for public_id, future in zip(public_ids, futures):
+        try:
+            future.result()
+        except (CloudinaryError, ValueError):
+            logger.exception('Could not destroy image %s', public_id)
+
+
+def record_images(build, images, start=0):
+    """
+    Create a build's image rows with one INSERT
+
+    Images take the positions from `start` on, and the one at position 0
+    is primary. BuildImage.save's image limit and primary checks don't
+    run, so the caller makes sure the build has room.
+
+    Returns:
+        list: The created BuildImage rows
+    """
+    store = store_image_urls()
+    return BuildImage.objects.bulk_create([
+        BuildImage(
+            build=build,
+            image=image,
+            position=position,
+            is_primary=(position == 0),
+            image_urls=get_build_image_urls(image) if store else {},
+        )
+        for position, image in enumerate(
+            images[:MAX_IMAGES - start], start=start)
+    ])
+
+
+def sync_images(build, kept_ids, new_images=()):
+    """
+    Bring a build's images in line with the edit form
+
+    The kept images come first in the order given, then the new ones;
+    every other image is removed. Only changes are written: one DELETE
+    for removed images, one UPDATE for images that move or gain or lose
+    the primary flag, and one INSERT for new images. The removed images'
+    Cloudinary assets are destroyed after the transaction commits.
+
+    Args:
+        build: The build being edited
+        kept_ids: Primary keys of the existing images to keep, in order
+        new_images: CloudinaryResource for each newly uploaded image
+
+    Returns:
+        int: Number of new images left out because the build was full
+    """
+    existing = {image.pk: image for image in build.images.all()}
+    kept = []
+    for pk in kept_ids:
+        image = existing.get(pk)
+        if image is not None and image not in kept:
+            kept.append(image)
+    kept = kept[:MAX_IMAGES]
+
+    removed = existing.keys() - {image.pk for image in kept}
+    if removed:
+        BuildImage.objects.filter(pk__in=removed).delete()
+        public_ids = [
+            existing[pk].image.public_id for pk in removed
+            if existing[pk].image]
+        transaction.on_commit(partial(destroy_images, public_ids))
+
+    changed = [
+        image for position, image in enumerate(kept)
+        if image.position != position or image.is_primary != (position == 0)
+    ]
+    if changed:
+        BuildImage.objects.filter(
+            pk__in=[image.pk for image in changed]).update(
+            position=Case(*[
+                When(pk=image.pk, then=Value(kept.index(image)))
+                for image in changed
+            ]),
+            is_primary=Case(
+                When(pk=kept[0].pk, then=Value(True)),
+                default=Value(False)
+            ),
+        )
+
+    room = MAX_IMAGES - len(kept)
+    record_images(build, list(new_images[:room]), start=len(kept))
+    return max(len(new_images) - room, 0)
@@ -6,8 +6,11 @@ from .views import (
     BuildCreateView,
     BuildUpdateView,
     BuildDeleteView,
+    BuildImageUploadParamsView,
+    LocalImageUploadView,
     BuildLikeView,
     CommentCreateView,
+    CommentListView,
     CommentUpdateView,
     CommentDeleteView,
     CommentVoteView,
@@ -38,6 +41,14 @@ urlpatterns = [
         'build/<int:pk>/delete/',
         BuildDeleteView.as_view(),
         name='build-delete'),
+    path(
+        'build/upload-params/',
+        BuildImageUploadParamsView.as_view(),
+        name='build-image-upload-params'),
+    path(
+        'build/local-upload/',
+        LocalImageUploadView.as_view(),
+        name='build-image-local-upload'),
     path(
         'build/<int:pk>/like/',
         BuildLikeView.as_view(),
@@ -46,6 +57,10 @@ urlpatterns = [
         'build/<int:pk>/comment/',
         CommentCreateView.as_view(),
         name='comment-create'),
+    path(
+        'build/<int:pk>/comments/',
+        CommentListView.as_view(),
+        name='comment-list'),
     path(
         'comment/<int:pk>/edit/',
         CommentUpdateView.as_view(),
@@ -0,0 +1,112 @@
+"""
+Buffered build view counting
+
+Detail page hits are counted in the cache instead of updating the Build
+row on every request. Buffered counts are written to Build.views in one
+batch by flush_view_counts(), which runs from the flush_build_views
+management command and, at most once per BUILD_VIEW_FLUSH_INTERVAL
+seconds, from the request that notices a flush is due.
+
+Buffering needs a shared cache backend (Memcached, Redis) so every
+worker and the management command see the same buffer. A per-process
+cache would keep each worker's hits where no flush can reach them, so
+without one record_view writes each hit to the Build row directly.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from utils.cache_utils import is_shared_cache
+
+VIEW_KEY = 'build_views:{}'
+PENDING_KEY = 'build_views:pending'
+FLUSH_LOCK_KEY = 'build_views:flush_lock'
+
+
+def get_flush_interval():
+    """Seconds between automatic flushes of the view buffer"""
+    return getattr(settings, 'BUILD_VIEW_FLUSH_INTERVAL', 60)
+
+
+def record_view(build_id):
+    """
+    Count a view of a build in the buffer
+
+    Without a shared cache the view is added to Build.views right away.
+
+    Returns:
+        int: Views of the build that a row loaded before the call
+            doesn't include
+    """
+    if not is_shared_cache():
+        from .models import Build
+
+        Build.objects.filter(pk=build_id).update(views=F('views') + 1)
+        return 1
+
+    key = VIEW_KEY.format(build_id)
+    if cache.add(key, 1, timeout=None):
+        pending = 1
+    else:
+        try:
+            pending = cache.incr(key)
+        except ValueError:
+            # The key expired or was flushed between add() and incr()
+            cache.set(key, 1, timeout=None)
+            pending = 1
+
+    # Re-register on every hit so a lost update heals itself
+    pending_ids = cache.get(PENDING_KEY) or set()
+    if build_id not in pending_ids:
+        pending_ids.add(build_id)
+        cache.set(PENDING_KEY, pending_ids, timeout=None)
+    return pending
+
+
+def get_pending_views(build_ids):
+    """Return {build_id: buffered views} for the given builds"""
+    keys = {VIEW_KEY.format(build_id): build_id for build_id in build_ids}
+    buffered = cache.get_many(keys.keys())
+    return {keys[key]: count for key, count in buffered.items()}
+
+
+def flush_view_counts():
+    """
+    Write buffered views to Build.views
+
+    Returns:
+        int: Number of builds whose view count was updated
+    """
+    from .models import Build
+
+    pending_ids = cache.get(PENDING_KEY) or set()
+    if not pending_ids:
+        return 0
+
+    # Unregister first; hits that arrive during the flush register again
+    cache.delete(PENDING_KEY)
+    counts = {
+        build_id: count
+        for build_id, count in get_pending_views(pending_ids).items()
+        if count
+    }
+
+    with transaction.atomic():
+        for build_id, count in counts.items():
+            Build.objects.filter(pk=build_id).update(
+                views=F('views') + count)
+
+    # Subtract what was written, keeping hits that arrived meanwhile
+    for build_id, count in counts.items():
+        try:
+            cache.decr(VIEW_KEY.format(build_id), count)
+        except ValueError:
+            pass
+    return len(counts)
+
+
+def flush_if_due():
+    """Flush the buffer if no flush ran in the last interval"""
+    if cache.add(FLUSH_LOCK_KEY, 1, timeout=get_flush_interval()):
+        return flush_view_counts()
+    return 0
@@ -1,5 +1,8 @@
 from django.shortcuts import get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.template.loader import render_to_string
 from django.views.generic import (
     ListView, DetailView, CreateView, UpdateView, DeleteView, View
 )
@@ -8,7 +11,14 @@ from django.urls import reverse_lazy
 from django.db import transaction
 from .models import Build, BuildImage, Comment, CommentVote
 from .forms import BuildForm, BuildImageFormSet, CommentForm
-from django.db.models import Count, Q, F
+from .pagination import paginate_by_cursor
+from .uploads import (
+    MAX_IMAGES, LocalUploadBackend, UploadError, get_backend, parse_uploads,
+    record_images, sync_images, upload_files
+)
+from .search import search_builds
+from . import fragment_cache, view_counts
+from django.db.models import F
 from django.contrib import messages
 from users.notifications import NotificationService
 
@@ -19,58 +29,100 @@ class BuildListView(ListView):
     model = Build
     template_name = 'builds/build_list.html'
     context_object_name = 'builds'
+    paginate_by = 12
+
+    # Every ordering ends with a unique tiebreaker so pages never overlap
+    SORT_ORDERINGS = {
+        'newest': ('-created_at', '-id'),
+        'oldest': ('created_at', 'id'),
+        'popular': ('-like_count', '-created_at', '-id'),
+        'most_commented': ('-comment_count', '-created_at', '-id'),
+        'alphabetical': ('title', 'id'),
+        'relevance': ('-search_rank', '-created_at', '-id'),
+    }
+    # Sorts that support keyset paging through the ``cursor`` parameter
+    CURSOR_SORTS = ('newest', 'oldest', 'popular', 'most_commented')
+
+    def get_sort(self):
+        """Default to relevance when searching, newest otherwise"""
+        default = 'relevance' if self.request.GET.get('search') else 'newest'
+        sort = self.request.GET.get('sort', default)
+        if sort == 'relevance' and not self.request.GET.get('search'):
+            return 'newest'
+        return sort if sort in self.SORT_ORDERINGS else 'newest'
+
+    def get_ordering(self):
+        return self.SORT_ORDERINGS[self.get_sort()]
 
     def get_queryset(self):
-        queryset = Build.objects.all()
+        # Load everything the build cards render up front so the page
+        # runs a fixed number of queries regardless of how many it shows
+        queryset = Build.objects.select_related(
+            'user', 'user__profile'
+        ).prefetch_related('images')
         category = self.request.GET.get('category')
         search = self.request.GET.get('search')
-        sort = self.request.GET.get('sort', 'newest')
 
         # Apply search filter
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search) |
-                Q(weapons__icontains=search) |
-                Q(armor__icontains=search) |
-                Q(talismans__icontains=search) |
-                Q(spells__icontains=search) |
-                Q(user__username__icontains=search)
-            )
+            queryset = search_builds(queryset, search)
 
         # Apply category filter
         if category:
             queryset = queryset.filter(category=category)
 
         # Apply sorting
-        if sort == 'popular':
-            queryset = queryset.annotate(
-                like_count=Count('liked_by')
-            ).order_by('-like_count', '-created_at')
-        elif sort == 'oldest':
-            queryset = queryset.order_by('created_at')
-        elif sort == 'most_commented':
-            queryset = queryset.annotate(
-                comment_count=Count('comments')
-            ).order_by('-comment_count', '-created_at')
-        elif sort == 'alphabetical':
-            queryset = queryset.order_by('title')
-        else:  # newest (default)
-            queryset = queryset.order_by('-created_at')
-
-        return queryset
+        return queryset.order_by(*self.get_ordering())
+
+    def is_cursor_request(self):
+        """Check if this request pages by cursor instead of page number"""
+        return (
+            'cursor' in self.request.GET and
+            self.get_sort() in self.CURSOR_SORTS
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        """Use keyset paging when a cursor is given to avoid OFFSET scans"""
+        self.next_cursor = None
+        if not self.is_cursor_request():
+            return super().paginate_queryset(queryset, page_size)
+
+        try:
+            builds, self.next_cursor = paginate_by_cursor(
+                queryset,
+                self.get_ordering(),
+                self.request.GET.get('cursor'),
+                page_size
+            )
+        except ValueError:
+            raise Http404('Invalid cursor.')
+        return (None, None, builds, False)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['current_sort'] = self.request.GET.get('sort', 'newest')
+        context['next_cursor'] = self.next_cursor
+        context['is_cursor_paginated'] = self.is_cursor_request()
+        context['current_sort'] = self.get_sort()
         context['current_category'] = self.request.GET.get('category', '')
         context['current_search'] = self.request.GET.get('search', '')
 
+        # Include views that are still buffered in the cache
+        pending_views = view_counts.get_pending_views(
+            [build.pk for build in context['builds']])
+        for build in context['builds']:
+            build.views += pending_views.get(build.pk, 0)
+
+        # Versions key the cached card fragments
+        fragment_cache.attach_versions(context['builds'])
+        context['fragment_timeout'] = fragment_cache.get_fragment_timeout()
+
         # Add user_has_liked information for authenticated users
         if self.request.user.is_authenticated:
             builds = context['builds']
             user_liked_builds = set(
-                self.request.user.liked_builds.values_list('id', flat=True)
+                self.request.user.liked_builds.filter(
+                    id__in=[build.id for build in builds]
+                ).values_list('id', flat=True)
             )
             for build in builds:
                 build.user_has_liked = build.id in user_liked_builds
@@ -78,21 +130,69 @@ class BuildListView(ListView):
         return context
 
 
+COMMENT_SORT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'popular': ('-score', '-created_at', '-id'),
+}
+COMMENTS_PER_PAGE = 20
+
+
+def get_comment_page(build, user, sort, cursor, page_size=COMMENTS_PER_PAGE):
+    """
+    Load one page of a build's comments, ready for rendering
+
+    Comments come with their authors, vote tallies and, for signed-in
+    users, ``current_user_vote``.
+
+    Returns:
+        tuple: (list of comments, cursor for the next page or None)
+
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    # Load comments with their authors and vote tallies in one query
+    ordering = COMMENT_SORT_ORDERINGS[sort]
+    comments, next_cursor = paginate_by_cursor(
+        build.comments.select_related('user', 'user__profile')
+        .with_vote_counts()
+        .order_by(*ordering),
+        ordering,
+        cursor,
+        page_size
+    )
+
+    # Add the current user's votes, fetched in a single query
+    if user.is_authenticated:
+        user_votes = dict(
+            CommentVote.objects.filter(
+                user=user,
+                comment__in=[comment.pk for comment in comments]
+            ).values_list('comment_id', 'vote_type')
+        )
+        for comment in comments:
+            comment.current_user_vote = user_votes.get(comment.pk)
+
+    return comments, next_cursor
+
+
 class BuildDetailView(DetailView):
     model = Build
     template_name = 'builds/build_detail.html'
 
+    def get_queryset(self):
+        # Images are loaded by the template only when the cached
+        # fragment that shows them has to be rendered
+        return Build.objects.select_related('user', 'user__profile')
+
     def get_object(self, queryset=None):
-        """Override to increment view count"""
+        """Override to count the view in the buffer"""
         obj = super().get_object(queryset=queryset)
-        
-        # Increment view count
-        # Use F() to avoid race conditions
-        from django.db.models import F
-        Build.objects.filter(pk=obj.pk).update(views=F('views') + 1)
-        
-        # Refresh the object to get updated view count
-        obj.refresh_from_db()
+
+        # Buffer the hit instead of writing to the row on every view;
+        # show the stored count plus whatever hasn't been flushed yet
+        obj.views += view_counts.record_view(obj.pk)
+        view_counts.flush_if_due()
         return obj
 
     def get_context_data(self, **kwargs):
@@ -100,40 +200,147 @@ class BuildDetailView(DetailView):
 
         # Get sort parameter
         sort = self.request.GET.get('comment_sort', 'newest')
+        if sort not in COMMENT_SORT_ORDERINGS:
+            sort = 'newest'
 
-        # Get comments with different sorting options
-        comments = self.object.comments.all()
-
-        if sort == 'popular':
-            # Sort by vote score (upvotes - downvotes)
-            comments = comments.annotate(
-                upvote_count=Count(
-                    'votes', filter=Q(votes__vote_type='upvote')
-                ),
-                downvote_count=Count(
-                    'votes', filter=Q(votes__vote_type='downvote')
-                )
-            ).annotate(
-                vote_score=F('upvote_count') - F('downvote_count')
-            ).order_by('-vote_score', '-created_at')
-        elif sort == 'oldest':
-            comments = comments.order_by('created_at')
-        else:  # newest (default)
-            comments = comments.order_by('-created_at')
-
-        # Add user vote information to each comment
-        if self.request.user.is_authenticated:
-            for comment in comments:
-                comment.current_user_vote = comment.user_vote(
-                    self.request.user
-                )
+        # Only the first page of comments is rendered; the rest are
+        # fetched on demand from CommentListView
+        try:
+            comments, next_cursor = get_comment_page(
+                self.object,
+                self.request.user,
+                sort,
+                self.request.GET.get('comment_cursor'),
+            )
+        except ValueError:
+            raise Http404('Invalid cursor.')
 
         context['comments'] = comments
+        context['next_comment_cursor'] = next_cursor
+        context['user_has_liked'] = (
+            self.request.user.is_authenticated and
+            Build.liked_by.through.objects.filter(
+                build_id=self.object.pk, user_id=self.request.user.pk
+            ).exists()
+        )
+        context['fragment_version'] = fragment_cache.get_version(
+            self.object.pk)
+        context['fragment_timeout'] = fragment_cache.get_fragment_timeout()
         context['comment_form'] = CommentForm()
         context['current_sort'] = sort
         return context
 
 
+class CommentListView(View):
+    """Return a page of a build's comments as JSON for "Load more"."""
+
+    def get(self, request, pk):
+        build = get_object_or_404(Build, pk=pk)
+        sort = request.GET.get('sort', 'newest')
+        if sort not in COMMENT_SORT_ORDERINGS:
+            return JsonResponse({'error': 'Invalid sort'}, status=400)
+
+        try:
+            comments, next_cursor = get_comment_page(
+                build, request.user, sort, request.GET.get('cursor'))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+        html = ''.join(
+            render_to_string(
+                'builds/includes/comment.html',
+                {'comment': comment},
+                request=request
+            )
+            for comment in comments
+        )
+        return JsonResponse({
+            'success': True,
+            'html': html,
+            'count': len(comments),
+            'next_cursor': next_cursor,
+        })
+
+
+def get_direct_uploads(request):
+    """
+    Images the browser uploaded straight to storage, verified
+
+    Returns a list of CloudinaryResource, empty when the form carried no
+    direct uploads or they failed verification (the user is warned).
+    """
+    values = request.POST.getlist('uploaded_images')
+    if not values:
+        return []
+    try:
+        return parse_uploads(values)
+    except UploadError:
+        messages.warning(
+            request,
+            'Your images could not be verified and were not added. '
+            'Please try uploading them again.'
+        )
+        return []
+
+
+def get_new_images(request):
+    """
+    Upload the images posted with a build form
+
+    Direct uploads are only verified; files are uploaded to Cloudinary in
+    parallel. Call it before opening a transaction so no database
+    connection waits on the uploads.
+
+    Returns None when no images were posted, otherwise a list of
+    CloudinaryResource in display order (the user is warned about any
+    image that couldn't be added).
+    """
+    images = get_direct_uploads(request)
+    if images:
+        return images
+    files = request.FILES.getlist('images-0-image')
+    if not files:
+        return None
+    images, failed = upload_files(files)
+    if failed:
+        messages.warning(
+            request,
+            f'These images could not be uploaded: {", ".join(failed)}. '
+            'Please try adding them again.'
+        )
+    return images
+
+
+class BuildImageUploadParamsView(LoginRequiredMixin, View):
+    """Signed parameters for uploading one build image to storage"""
+
+    def get(self, request):
+        return JsonResponse(get_backend().get_upload_params(request.user))
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LocalImageUploadView(LoginRequiredMixin, View):
+    """
+    Upload endpoint of LocalUploadBackend
+
+    Like the Cloudinary upload API it takes no CSRF token; instead the
+    signed parameters must have been issued to the logged-in user.
+    """
+
+    def post(self, request):
+        backend = get_backend()
+        if not isinstance(backend, LocalUploadBackend):
+            raise Http404
+        file = request.FILES.get('file')
+        if file is None:
+            return JsonResponse({'error': 'No file uploaded.'}, status=400)
+        try:
+            result = backend.upload(request.POST, file, request.user)
+        except UploadError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        return JsonResponse(result)
+
+
 class BuildCreateView(LoginRequiredMixin, CreateView):
     model = Build
     form_class = BuildForm
@@ -157,31 +364,26 @@ class BuildCreateView(LoginRequiredMixin, CreateView):
         return data
 
     def form_valid(self, form):
+        # Upload images first so the transaction only covers the rows
+        new_images = get_new_images(self.request)
+
         # Save the main build form first
         with transaction.atomic():
             form.instance.user = self.request.user
             self.object = form.save()
 
             # Handle multiple image uploads
-            self.handle_image_uploads()
+            self.handle_image_uploads(new_images)
 
             # Always succeed if the main form is valid - images are optional
             messages.success(self.request, 'Build created successfully!')
             return super().form_valid(form)
 
-    def handle_image_uploads(self):
+    def handle_image_uploads(self, new_images):
         """Handle multiple image uploads from the simplified interface"""
-        # Check for multiple file uploads in the first form
-        first_form_files = self.request.FILES.getlist('images-0-image')
-        
-        if first_form_files:
-            # Handle multiple files uploaded at once
-            for i, uploaded_file in enumerate(first_form_files[:3]):  # Limit to 3
-                image = BuildImage.objects.create(
-                    build=self.object,
-                    image=uploaded_file,
-                    is_primary=(i == 0)  # First image is primary
-                )
+        if new_images is not None:
+            # Already uploaded; the first image is primary
+            record_images(self.object, new_images)
         else:
             # Handle traditional formset submission
             context = self.get_context_data()
@@ -229,77 +431,52 @@ class BuildUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
-        if self.request.POST:
-            data['image_formset'] = BuildImageFormSet(
-                self.request.POST, self.request.FILES, instance=self.object
-            )
-        else:
-            data['image_formset'] = BuildImageFormSet(instance=self.object)
+        # Only displays the existing images; edits come from image_order
+        # and remove_images
+        data['image_formset'] = BuildImageFormSet(instance=self.object)
         return data
 
     def form_valid(self, form):
+        # Upload images first so the transaction only covers the rows
+        new_images = get_new_images(self.request)
+
         # Save the main build form first
         with transaction.atomic():
             form.instance.user = self.request.user
             self.object = form.save()
 
             # Handle image uploads (including new multiple uploads)
-            self.handle_image_updates()
+            self.handle_image_updates(new_images)
 
             # Always succeed if the main form is valid - images are optional
             messages.success(self.request, 'Build updated successfully!')
             return super().form_valid(form)
 
-    def handle_image_updates(self):
-        """Handle image updates including multiple new uploads"""
-        # Check for new multiple file uploads
-        first_form_files = self.request.FILES.getlist('images-0-image')
-        
-        if first_form_files:
-            # When user uploads new images, clear all existing images first
-            self.object.images.all().delete()
-            
-            # Add new images
-            for i, uploaded_file in enumerate(first_form_files[:3]):  # Limit to 3
-                image = BuildImage.objects.create(
-                    build=self.object,
-                    image=uploaded_file,
-                    is_primary=(i == 0)  # First image is primary
-                )
-        
-        # Always handle traditional formset submission for deletions (when no new files)
-        if not first_form_files:
-            context = self.get_context_data()
-            image_formset = context['image_formset']
-
-            if image_formset.is_valid():
-                image_formset.save()
-
-                # Ensure first remaining image is primary after deletions
-                if self.object.images.exists():
-                    if not self.object.images.filter(is_primary=True).exists():
-                        first_image = self.object.images.first()
-                        first_image.is_primary = True
-                        first_image.save()
-            else:
-                # If formset is invalid, show errors
-                for form in image_formset:
-                    if form.errors:
-                        messages.warning(
-                            self.request,
-                            f'Image form errors: {form.errors}'
-                        )
+    def get_kept_image_ids(self):
+        """Existing images the form keeps, in their new order"""
+        def ids(name):
+            return [
+                int(value) for value in self.request.POST.getlist(name)
+                if value.isdigit()
+            ]
 
-    def form_invalid(self, form):
-        # Add image formset errors to context  
-        context = self.get_context_data()
-        image_formset = context['image_formset']
-        if not image_formset.is_valid():
-            messages.error(
+        if 'image_order' in self.request.POST:
+            order = ids('image_order')
+        else:
+            order = list(self.object.images.values_list('pk', flat=True))
+        removed = set(ids('remove_images'))
+        return [pk for pk in order if pk not in removed]
+
+    def handle_image_updates(self, new_images):
+        """Add, remove and reorder images, writing only what changed"""
+        skipped = sync_images(
+            self.object, self.get_kept_image_ids(), new_images or [])
+        if skipped:
+            messages.warning(
                 self.request,
-                'Please fix the errors in the form and image uploads.'
+                f'A build can have at most {MAX_IMAGES} images, so '
+                f'{skipped} new image(s) were not added.'
             )
-        return super().form_invalid(form)
 
     def test_func(self):
         build = self.get_object()
@@ -320,17 +497,34 @@ class BuildDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 class BuildLikeView(LoginRequiredMixin, View):
     def post(self, request, pk):
-        build = get_object_or_404(Build, pk=pk)
-
-        # Check if user is already liked the build
-        is_liked = request.user in build.liked_by.all()
+        Like = Build.liked_by.through
 
+        with transaction.atomic():
+            # Lock the build row so concurrent toggles on it run one at a
+            # time and the counter can't drift
+            build = get_object_or_404(
+                Build.objects.select_for_update(), pk=pk)
+
+            # Deleting is the existence check: it hits the unique
+            # (build, user) index and removes the like if there was one
+            deleted, _ = Like.objects.filter(
+                build_id=build.pk, user_id=request.user.pk).delete()
+            if deleted:
+                action = 'unliked'
+            else:
+                Like.objects.create(build_id=build.pk, user_id=request.user.pk)
+                action = 'liked'
+
+            # Going through the through model skips m2m_changed, so keep
+            # the counter and cached fragments in step here
+            Build.objects.filter(pk=build.pk).update(
+                like_count=F('like_count') + (-1 if deleted else 1))
+            build.like_count = Build.objects.filter(
+                pk=build.pk).values_list('like_count', flat=True).get()
+            fragment_cache.bump_versions_on_commit([build.pk])
+
+        is_liked = action == 'liked'
         if is_liked:
-            build.liked_by.remove(request.user)
-            action = 'unliked'
-        else:
-            build.liked_by.add(request.user)
-            action = 'liked'
             # Create notification for build like
             NotificationService.create_build_like_notification(
                 build, request.user
@@ -341,8 +535,8 @@ class BuildLikeView(LoginRequiredMixin, View):
             return JsonResponse({
                 'success': True,
                 'action': action,
-                'total_likes': build.total_likes(),
-                'is_liked': not is_liked
+                'total_likes': build.like_count,
+                'is_liked': is_liked
             })
 
         # Redirect for non-AJAX requests
@@ -363,7 +557,9 @@ class CommentCreateView(LoginRequiredMixin, View):
             comment = form.save(commit=False)
             comment.build = build
             comment.user = request.user
-            comment.save()
+            # The comment row and Build.comment_count change together
+            with transaction.atomic():
+                comment.save()
 
             # Create notification for build comment
             NotificationService.create_build_comment_notification(
@@ -410,6 +606,11 @@ class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         comment = self.get_object()
         return self.request.user == comment.user
 
+    def form_valid(self, form):
+        # The comment row and Build.comment_count change together
+        with transaction.atomic():
+            return super().form_valid(form)
+
     def get_success_url(self):
         messages.success(
             self.request, 'Your comment has been deleted successfully!'
@@ -130,6 +130,85 @@ else:
         }
     }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Defaults to a per-process memory cache; point CACHE_BACKEND and
+# CACHE_LOCATION at a shared cache (Memcached, Redis, the database cache)
+# in production so buffered counters are visible to every worker. Without
+# one, notifications are delivered during requests instead of by the
+# process_notifications worker, and `check --deploy` warns about it. Whether the cache is shared is worked out
+# from the backend; set CACHE_SHARED to override it.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'eldenring-cache'),
+    }
+}
+
+# Seconds between writes of buffered build view counts to the database.
+# Views are only buffered in a shared cache; with a per-process cache each
+# hit updates the build row directly.
+BUILD_VIEW_FLUSH_INTERVAL = int(
+    os.environ.get('BUILD_VIEW_FLUSH_INTERVAL', '60'))
+
+# Seconds rendered build cards and detail sections stay cached; they are
+# invalidated on change, so this only bounds how long unused ones linger
+# (at most 30 when the cache isn't shared between processes)
+BUILD_FRAGMENT_CACHE_TIMEOUT = int(
+    os.environ.get('BUILD_FRAGMENT_CACHE_TIMEOUT', '3600'))
+
+# Home page statistics: totals are kept current by signals and recounted
+# after SITE_STATS_TOTALS_TIMEOUT; build lists are reloaded after
+# SITE_STATS_LIST_TIMEOUT (both at most 30 when the cache isn't shared)
+SITE_STATS_TOTALS_TIMEOUT = int(
+    os.environ.get('SITE_STATS_TOTALS_TIMEOUT', '3600'))
+SITE_STATS_LIST_TIMEOUT = int(
+    os.environ.get('SITE_STATS_LIST_TIMEOUT', '60'))
+
+# Seconds a cached notification profile (preferences and display name) lives
+NOTIFICATION_PROFILE_CACHE_TIMEOUT = int(
+    os.environ.get('NOTIFICATION_PROFILE_CACHE_TIMEOUT', '3600'))
+
+# Seconds a cached unread notification count lives before being recounted
+# (at most 30 when the cache isn't shared between processes)
+NOTIFICATION_UNREAD_COUNT_TIMEOUT = int(
+    os.environ.get('NOTIFICATION_UNREAD_COUNT_TIMEOUT', '3600'))
+
+# Notifications are queued and delivered by `manage.py
+# process_notifications`; set NOTIFICATION_QUEUE_EAGER to deliver them
+# during the request instead (handy without a worker running). Without a
+# shared cache they are always delivered during the request.
+NOTIFICATION_QUEUE_EAGER = os.environ.get(
+    'NOTIFICATION_QUEUE_EAGER', 'False').lower() == 'true'
+
+# Seconds during which likes, comments and votes on the same build or
+# comment are merged into one unread notification
+NOTIFICATION_COALESCE_WINDOW = int(
+    os.environ.get('NOTIFICATION_COALESCE_WINDOW', '86400'))
+
+# Live notification streams (served by the ASGI application). Unless set,
+# the broker is users.broker.CacheBroker, which polls the shared cache
+# once per process every NOTIFICATION_BROKER_POLL_INTERVAL seconds, for
+# all open streams, so events published by the worker reach every web
+# process, or users.broker.InProcessBroker
+# when notifications are delivered eagerly
+NOTIFICATION_BROKER_BACKEND = os.environ.get('NOTIFICATION_BROKER_BACKEND')
+NOTIFICATION_BROKER_POLL_INTERVAL = float(
+    os.environ.get('NOTIFICATION_BROKER_POLL_INTERVAL', '1'))
+NOTIFICATION_STREAM_KEEPALIVE = int(
+    os.environ.get('NOTIFICATION_STREAM_KEEPALIVE', '15'))
+
+# Retention applied by `manage.py prune_notifications`: read
+# notifications older than NOTIFICATION_RETENTION_DAYS are deleted and
+# each user keeps at most NOTIFICATION_MAX_PER_USER (0 disables either)
+NOTIFICATION_RETENTION_DAYS = int(
+    os.environ.get('NOTIFICATION_RETENTION_DAYS', '90'))
+NOTIFICATION_MAX_PER_USER = int(
+    os.environ.get('NOTIFICATION_MAX_PER_USER', '1000'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -203,6 +282,23 @@ cloudinary.config(
     secure=True
 )
 
+# Generated image URLs are memoized per process (LRU, this many entries).
+# Set CLOUDINARY_STORE_IMAGE_URLS to also store each size preset's URL on
+# the image row at upload (fill existing rows with `manage.py
+# refresh_image_urls`)
+CLOUDINARY_URL_CACHE_SIZE = int(
+    os.environ.get('CLOUDINARY_URL_CACHE_SIZE', '4096'))
+CLOUDINARY_STORE_IMAGE_URLS = os.environ.get(
+    'CLOUDINARY_STORE_IMAGE_URLS', 'False').lower() == 'true'
+
+# Build images are uploaded by the browser straight to this backend with
+# signed parameters; builds.uploads.LocalUploadBackend keeps them in
+# BUILD_IMAGE_LOCAL_UPLOAD_ROOT instead of Cloudinary
+BUILD_IMAGE_UPLOAD_BACKEND = os.environ.get(
+    'BUILD_IMAGE_UPLOAD_BACKEND', 'builds.uploads.CloudinaryUploadBackend')
+BUILD_IMAGE_LOCAL_UPLOAD_ROOT = os.environ.get(
+    'BUILD_IMAGE_LOCAL_UPLOAD_ROOT', str(BASE_DIR / 'local_uploads'))
+
 # Use Cloudinary for media files
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
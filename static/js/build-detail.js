@@ -113,52 +113,91 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   }
 
-  // Voting functionality
-  const voteForms = document.querySelectorAll('.vote-form');
-  
-  voteForms.forEach(form => {
-    form.addEventListener('submit', function(e) {
+  // Voting functionality, delegated so comments added by "Load more"
+  // are handled too
+  document.addEventListener('submit', function(e) {
+    const form = e.target.closest('.vote-form');
+    if (!form) {
+      return;
+    }
+    e.preventDefault();
+
+    const formData = new FormData(form);
+
+    fetch(form.action, {
+      method: 'POST',
+      body: formData,
+      headers: {
+        'X-Requested-With': 'XMLHttpRequest',
+        'X-CSRFToken': formData.get('csrfmiddlewaretoken')
+      }
+    })
+    .then(response => response.json())
+    .then(data => {
+      if (data.success) {
+        // Update vote counts
+        const comment = form.closest('.comment');
+        const upvoteCount = comment.querySelector('.upvote-count');
+        const downvoteCount = comment.querySelector('.downvote-count');
+        const scoreValue = comment.querySelector('.score-value');
+        const upvoteBtn = comment.querySelector('.upvote-btn');
+        const downvoteBtn = comment.querySelector('.downvote-btn');
+        
+        upvoteCount.textContent = data.upvotes;
+        downvoteCount.textContent = data.downvotes;
+        scoreValue.textContent = data.score;
+        
+        // Update button styles based on user vote
+        upvoteBtn.className = 'btn btn-sm upvote-btn ' + 
+          (data.user_vote === 'upvote' ? 'btn-success' : 'btn-outline-success');
+        downvoteBtn.className = 'btn btn-sm downvote-btn ' + 
+          (data.user_vote === 'downvote' ? 'btn-danger' : 'btn-outline-danger');
+      }
+    })
+    .catch(error => {
+      console.error('Error:', error);
+    });
+  });
+
+  // Load more comments
+  const loadMoreBtn = document.querySelector('.load-more-comments');
+  const commentsList = document.querySelector('.comments-list');
+  if (loadMoreBtn && commentsList) {
+    loadMoreBtn.addEventListener('click', function(e) {
       e.preventDefault();
-      
-      const commentId = this.dataset.commentId;
-      const voteType = this.dataset.voteType;
-      const formData = new FormData(this);
-      
-      fetch(this.action, {
-        method: 'POST',
-        body: formData,
+
+      const url = new URL(this.dataset.commentsUrl, window.location.origin);
+      url.searchParams.set('sort', this.dataset.sort);
+      url.searchParams.set('cursor', this.dataset.cursor);
+
+      loadMoreBtn.classList.add('disabled');
+
+      fetch(url, {
         headers: {
-          'X-Requested-With': 'XMLHttpRequest',
-          'X-CSRFToken': formData.get('csrfmiddlewaretoken')
+          'X-Requested-With': 'XMLHttpRequest'
+        }
+      })
+      .then(response => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
         }
+        return response.json();
       })
-      .then(response => response.json())
       .then(data => {
-        if (data.success) {
-          // Update vote counts
-          const comment = document.querySelector(`[data-comment-id="${commentId}"]`).closest('.comment');
-          const upvoteCount = comment.querySelector('.upvote-count');
-          const downvoteCount = comment.querySelector('.downvote-count');
-          const scoreValue = comment.querySelector('.score-value');
-          const upvoteBtn = comment.querySelector('.upvote-btn');
-          const downvoteBtn = comment.querySelector('.downvote-btn');
-          
-          upvoteCount.textContent = data.upvotes;
-          downvoteCount.textContent = data.downvotes;
-          scoreValue.textContent = data.score;
-          
-          // Update button styles based on user vote
-          upvoteBtn.className = 'btn btn-sm upvote-btn ' + 
-            (data.user_vote === 'upvote' ? 'btn-success' : 'btn-outline-success');
-          downvoteBtn.className = 'btn btn-sm downvote-btn ' + 
-            (data.user_vote === 'downvote' ? 'btn-danger' : 'btn-outline-danger');
+        commentsList.insertAdjacentHTML('beforeend', data.html);
+        if (data.next_cursor) {
+          loadMoreBtn.dataset.cursor = data.next_cursor;
+          loadMoreBtn.classList.remove('disabled');
+        } else {
+          loadMoreBtn.closest('.load-more-wrapper').remove();
         }
       })
       .catch(error => {
-        console.error('Error:', error);
+        console.error('Error loading comments:', error);
+        loadMoreBtn.classList.remove('disabled');
       });
     });
-  });
+  }
 
   // Comment sorting functionality
   const sortSelect = document.getElementById('comment-sort-select');
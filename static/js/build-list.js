@@ -32,8 +32,9 @@ document.addEventListener('DOMContentLoaded', function () {
             currentUrl.searchParams.delete('search');
         }
 
-        // Remove page parameter when filtering
+        // Remove page and cursor parameters when filtering
         currentUrl.searchParams.delete('page');
+        currentUrl.searchParams.delete('cursor');
 
         window.location.href = currentUrl.toString();
     }
@@ -58,9 +59,9 @@ document.addEventListener('DOMContentLoaded', function () {
         const sortParam = urlParams.get('sort');
         if (sortParam) {
             sortSelect.value = sortParam;
-        } else {
-            sortSelect.value = 'newest'; // Default value
         }
+        // Otherwise keep the server's default (newest, or best match
+        // when searching)
     }
 
     // Search with debouncing
@@ -0,0 +1,68 @@
+// Direct-to-storage image uploads
+// Images are sent straight to the storage backend with signed parameters
+// from the server; the form only submits the returned upload results.
+// If anything fails, the form is submitted with the files as before.
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('build-form');
+    const fileInput = document.getElementById('multiple-images');
+
+    if (!form || !fileInput || !form.dataset.uploadParamsUrl) return;
+
+    const submitButton = form.querySelector('button[type="submit"]');
+
+    // Upload one file and resolve with the storage backend's result
+    async function uploadFile(file) {
+        const paramsResponse = await fetch(form.dataset.uploadParamsUrl, {
+            credentials: 'same-origin'
+        });
+        if (!paramsResponse.ok) throw new Error('Could not get upload parameters');
+        const params = await paramsResponse.json();
+
+        const data = new FormData();
+        Object.entries(params.fields).forEach(([name, value]) => data.append(name, value));
+        data.append('file', file);
+
+        const response = await fetch(params.url, { method: 'POST', body: data });
+        if (!response.ok) throw new Error(`Upload of ${file.name} failed`);
+        const result = await response.json();
+        return {
+            public_id: result.public_id,
+            version: result.version,
+            format: result.format,
+            signature: result.signature
+        };
+    }
+
+    // Record each result in a hidden input, in the order the files were chosen
+    function addResults(results) {
+        form.querySelectorAll('input[name="uploaded_images"]').forEach(input => input.remove());
+        results.forEach(result => {
+            const input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = 'uploaded_images';
+            input.value = JSON.stringify(result);
+            form.appendChild(input);
+        });
+    }
+
+    form.addEventListener('submit', async function(e) {
+        // Validation in image-upload.js may already have stopped the submit
+        if (e.defaultPrevented) return;
+
+        const files = Array.from(fileInput.files).slice(0, 3);
+        if (files.length === 0) return;
+
+        e.preventDefault();
+        if (submitButton) submitButton.disabled = true;
+
+        try {
+            addResults(await Promise.all(files.map(uploadFile)));
+            // The bytes are already stored, so don't send them again
+            fileInput.disabled = true;
+        } catch (error) {
+            console.warn('Direct upload failed, sending images with the form:', error);
+            addResults([]);
+        }
+        form.submit();
+    });
+});
@@ -135,7 +135,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Handle existing image deletions
     const existingImages = document.querySelectorAll('.existing-image');
     existingImages.forEach(imageDiv => {
-        const deleteCheckbox = imageDiv.querySelector('input[type="checkbox"][name*="DELETE"]');
+        const deleteCheckbox = imageDiv.querySelector('input[type="checkbox"][name="remove_images"]');
         if (deleteCheckbox) {
             deleteCheckbox.addEventListener('change', function() {
                 if (this.checked) {
@@ -147,5 +147,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             });
         }
+
+        // Reorder: the first image kept becomes primary
+        const moveUpButton = imageDiv.querySelector('.move-image-up');
+        if (moveUpButton) {
+            moveUpButton.addEventListener('click', function() {
+                const previous = imageDiv.previousElementSibling;
+                if (previous && previous.classList.contains('existing-image')) {
+                    imageDiv.parentNode.insertBefore(imageDiv, previous);
+                }
+            });
+        }
     });
 });
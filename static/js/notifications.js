@@ -0,0 +1,31 @@
+document.addEventListener('DOMContentLoaded', function() {
+  // Live unread notification count over Server-Sent Events
+  const badge = document.querySelector('.notification-badge');
+  if (!badge || !window.EventSource) {
+    return;
+  }
+
+  function updateBadge(count) {
+    badge.textContent = count > 0 ? count : '';
+    badge.style.display = count > 0 ? '' : 'none';
+  }
+
+  // The browser reconnects on its own if the stream drops; a 204 from
+  // the server (no streaming available) stops it for good
+  const source = new EventSource(badge.dataset.streamUrl);
+
+  source.addEventListener('unread_count', function(e) {
+    updateBadge(JSON.parse(e.data).count);
+  });
+
+  source.addEventListener('notification', function(e) {
+    const data = JSON.parse(e.data);
+    document.dispatchEvent(new CustomEvent('notification:received', {
+      detail: data
+    }));
+  });
+
+  window.addEventListener('beforeunload', function() {
+    source.close();
+  });
+});
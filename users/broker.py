@@ -0,0 +1,294 @@
+"""
+Publish/subscribe for live notification events
+
+NotificationService and the unread counters publish per-user events, and
+the notification stream view relays them to connected browsers. The
+broker class is set by NOTIFICATION_BROKER_BACKEND (a dotted path).
+
+InProcessBroker only reaches subscribers in the process that published
+the event, which covers notifications delivered eagerly by a single web
+process. CacheBroker relays events through the shared cache, so events
+published by the process_notifications worker or another web process
+reach every stream; it is the default unless notifications are
+delivered during the request (see notifications.delivers_eagerly). A
+broker backed by Redis pub/sub or PostgreSQL LISTEN/NOTIFY can replace
+it by implementing the same interface.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BaseBroker:
+    """Interface every broker backend implements"""
+
+    def publish(self, user_id, event):
+        """
+        Send an event to every subscriber of a user
+
+        Safe to call from synchronous code in any thread.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, user_id):
+        """
+        Return a Subscription receiving the user's events
+
+        Must be called from the event loop that will read them.
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        """Stop delivering events to a subscription"""
+        raise NotImplementedError
+
+
+class Subscription:
+    """A subscriber's queue of events, read from async code"""
+
+    def __init__(self, broker, user_id, max_pending=100):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def put(self, event):
+        """Queue an event from any thread, dropping it if the queue is full"""
+        def enqueue():
+            if not self.queue.full():
+                self.queue.put_nowait(event)
+        self.loop.call_soon_threadsafe(enqueue)
+
+    async def start(self):
+        """Prepare to receive events; called once before reading"""
+
+    async def get(self, timeout=None):
+        """Wait for the next event; return None if the timeout passes"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker(BaseBroker):
+    """Broker that delivers events to subscribers in the same process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put(event)
+            except RuntimeError:
+                # The subscriber's event loop has already closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def subscriber_count(self, user_id):
+        """Number of open subscriptions for a user"""
+        with self._lock:
+            return len(self._subscriptions.get(user_id, ()))
+
+
+class CacheSubscription(Subscription):
+    """Subscription to a CacheBroker, fed by the process's poller"""
+
+    async def start(self):
+        # Only events published from now on are delivered
+        await sync_to_async(self.broker.track, thread_sensitive=False)(
+            self.user_id)
+
+
+class CacheBroker(InProcessBroker):
+    """
+    Broker that relays events through the default cache
+
+    Each user's events are numbered by a counter in the cache and kept
+    for EVENT_TIMEOUT seconds, so events reach every process sharing the
+    cache. Streams don't poll the cache themselves: one poller thread per
+    process reads the counters of every subscribed user with a single
+    get_many every NOTIFICATION_BROKER_POLL_INTERVAL seconds, fetches the
+    new events with one more, and hands them to the subscribers' queues
+    like InProcessBroker. An idle process costs one cache round trip per
+    interval however many streams it holds.
+    """
+
+    SEQUENCE_KEY = 'notifications:events:{}'
+    EVENT_KEY = 'notifications:events:{}:{}'
+    EVENT_TIMEOUT = 60
+    SEQUENCE_TIMEOUT = 86400
+
+    def __init__(self):
+        super().__init__()
+        # Latest event number delivered, per subscribed user
+        self._last_seen = {}
+        self._poller = None
+
+    def get_poll_interval(self):
+        return getattr(settings, 'NOTIFICATION_BROKER_POLL_INTERVAL', 1)
+
+    def publish(self, user_id, event):
+        key = self.SEQUENCE_KEY.format(user_id)
+        cache.add(key, 0, timeout=self.SEQUENCE_TIMEOUT)
+        try:
+            sequence = cache.incr(key)
+        except ValueError:
+            # The counter expired in between; start it again
+            sequence = 1
+            cache.set(key, sequence, timeout=self.SEQUENCE_TIMEOUT)
+        cache.set(
+            self.EVENT_KEY.format(user_id, sequence), event,
+            timeout=self.EVENT_TIMEOUT)
+
+    def read(self, after, limit=100):
+        """
+        Read the events of several users in two cache round trips
+
+        Args:
+            after: {user_id: latest event number already seen}
+            limit: Most events returned per user, the newest ones
+
+        Returns:
+            dict: {user_id: (latest event number, new events)}
+        """
+        latest = cache.get_many(
+            [self.SEQUENCE_KEY.format(user_id) for user_id in after])
+        keys = {}
+        results = {}
+        for user_id, seen in after.items():
+            sequence = latest.get(self.SEQUENCE_KEY.format(user_id)) or 0
+            if sequence < seen:
+                # The counter expired and started again
+                seen = 0
+            keys[user_id] = [
+                self.EVENT_KEY.format(user_id, number)
+                for number in range(
+                    max(seen, sequence - limit) + 1, sequence + 1)
+            ]
+            results[user_id] = sequence
+        found = cache.get_many(
+            [key for user_keys in keys.values() for key in user_keys])
+        return {
+            user_id: (sequence, [
+                found[key] for key in keys[user_id] if key in found])
+            for user_id, sequence in results.items()
+        }
+
+    def subscribe(self, user_id):
+        subscription = CacheSubscription(self, user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        super().unsubscribe(subscription)
+        with self._lock:
+            if subscription.user_id not in self._subscriptions:
+                self._last_seen.pop(subscription.user_id, None)
+
+    def track(self, user_id):
+        """Start polling a user's events from the latest one on"""
+        with self._lock:
+            if user_id in self._last_seen:
+                return
+        latest, _ = self.read({user_id: 0}, limit=0)[user_id]
+        with self._lock:
+            if user_id in self._subscriptions:
+                self._last_seen.setdefault(user_id, latest)
+            if self._poller is None:
+                self._poller = threading.Thread(
+                    target=self._poll, name='notification-broker',
+                    daemon=True)
+                self._poller.start()
+
+    def _poll(self):
+        """Relay new events to subscribers until none are left"""
+        while True:
+            with self._lock:
+                if not self._subscriptions:
+                    self._poller = None
+                    return
+                after = dict(self._last_seen)
+            if after:
+                try:
+                    results = self.read(after)
+                except Exception:
+                    logger.exception('Reading notification events failed')
+                    results = {}
+                for user_id, (latest, events) in results.items():
+                    with self._lock:
+                        if user_id not in self._last_seen:
+                            continue
+                        self._last_seen[user_id] = latest
+                    for event in events:
+                        super().publish(user_id, event)
+            time.sleep(self.get_poll_interval())
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker_backend():
+    """Dotted path of the broker class configured in settings"""
+    from .notifications import delivers_eagerly
+
+    default = (
+        'users.broker.InProcessBroker' if delivers_eagerly()
+        else 'users.broker.CacheBroker')
+    return getattr(settings, 'NOTIFICATION_BROKER_BACKEND', None) or default
+
+
+def get_broker():
+    """Return the process-wide broker configured in settings"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(get_broker_backend())()
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    """Pick up a changed broker setting, e.g. in tests"""
+    global _broker
+    if setting in (
+            'NOTIFICATION_BROKER_BACKEND', 'NOTIFICATION_QUEUE_EAGER',
+            'CACHES', 'CACHE_SHARED'):
+        _broker = None
+
+
+def publish(user_id, event):
+    """Publish an event to a user's subscribers through the broker"""
+    get_broker().publish(user_id, event)
@@ -0,0 +1,23 @@
+"""
+Deployment checks for notification delivery
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from utils.cache_utils import is_shared_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_worker_cache(app_configs, **kwargs):
+    """The notification worker needs a cache shared with the web processes"""
+    if getattr(settings, 'NOTIFICATION_QUEUE_EAGER', False):
+        return []
+    if is_shared_cache():
+        return []
+    return [Warning(
+        'The default cache is per-process, so notifications are delivered '
+        'during requests instead of by the process_notifications worker, '
+        'and live events only reach streams in the same process.',
+        hint='Point CACHE_BACKEND and CACHE_LOCATION at a shared cache '
+             '(Redis, Memcached or the database cache).',
+        id='users.W001',
+    )]
@@ -1,17 +1,16 @@
-from users.models import Notification
+from users.unread_counts import get_unread_count
 
 
 def notification_context(request):
     """
     Context processor to add notification count to all templates
+
+    The count comes from the cached counter, not a COUNT query.
     """
     context = {}
 
     if request.user.is_authenticated:
-        context['unread_count'] = Notification.objects.filter(
-            recipient=request.user,
-            is_read=False
-        ).count()
+        context['unread_count'] = get_unread_count(request.user.pk)
     else:
         context['unread_count'] = 0
 
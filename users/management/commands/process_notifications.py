@@ -0,0 +1,59 @@
+"""
+Management command to deliver queued notifications
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from users.notifications import NotificationService, delivers_eagerly
+
+
+class Command(BaseCommand):
+    help = 'Drain the notification outbox into notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of events to deliver per batch (default: 500)')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the outbox is empty instead of polling')
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the outbox is empty (default: 2)')
+
+    def handle(self, *args, **options):
+        # Without a shared cache the web processes deliver notifications
+        # themselves; only drain what was queued before
+        once = options['once']
+        if delivers_eagerly() and not once:
+            self.stdout.write(self.style.WARNING(
+                'Notifications are delivered by the web processes (the '
+                'cache is per-process or NOTIFICATION_QUEUE_EAGER is set); '
+                'delivering queued events and exiting.'))
+            once = True
+
+        batch_size = options['batch_size']
+        delivered = 0
+
+        try:
+            while True:
+                processed = NotificationService.process_pending(batch_size)
+                delivered += processed
+                if processed:
+                    self.stdout.write(f'Processed {processed} events')
+
+                # A short batch means the outbox has been drained
+                if processed < batch_size:
+                    if once:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully processed {delivered} notification events'))
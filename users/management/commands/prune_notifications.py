@@ -0,0 +1,60 @@
+"""
+Management command to delete old notifications
+"""
+import gzip
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from users.retention import prune_notifications, prune_orphaned_receipts
+
+
+class Command(BaseCommand):
+    help = 'Delete read notifications past the retention period, ' \
+        'notifications beyond the per-user limit and receipts of ' \
+        'deleted builds and comments (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Delete read notifications older than DAYS '
+                 '(default: NOTIFICATION_RETENTION_DAYS, 0 to skip)')
+        parser.add_argument(
+            '--max-per-user',
+            type=int,
+            help='Keep at most this many notifications per user '
+                 '(default: NOTIFICATION_MAX_PER_USER, 0 to skip)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Notifications or receipts deleted per transaction '
+                 '(default: 1000)')
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to wait between batches (default: 0.1)')
+        parser.add_argument(
+            '--archive',
+            help='Append deleted notifications to this gzipped JSONL file')
+
+    def handle(self, *args, **options):
+        archive = (
+            gzip.open(options['archive'], 'at', encoding='utf-8')
+            if options['archive'] else nullcontext()
+        )
+        with archive as archive_file:
+            expired, over_limit = prune_notifications(
+                days=options['days'],
+                max_per_user=options['max_per_user'],
+                batch_size=options['batch_size'],
+                archive=archive_file,
+                pause=options['sleep'],
+            )
+        receipts = prune_orphaned_receipts(
+            batch_size=options['batch_size'], pause=options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {expired} expired and {over_limit} over-limit '
+            f'notifications and {receipts} orphaned receipts'))
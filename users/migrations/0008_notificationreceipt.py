@@ -0,0 +1,76 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_existing_receipts(apps, schema_editor):
+    """Record likes and votes that were notified before receipts existed"""
+    Notification = apps.get_model('users', 'Notification')
+    NotificationReceipt = apps.get_model('users', 'NotificationReceipt')
+
+    receipts = set()
+    for notification in Notification.objects.filter(
+            notification_type__in=('build_like', 'comment_vote')
+    ).values(
+        'sender_id', 'notification_type', 'build_id', 'comment_id',
+        'recent_actor_ids',
+    ).iterator():
+        target_id = (
+            notification['comment_id']
+            if notification['notification_type'] == 'comment_vote'
+            else notification['build_id']
+        )
+        if target_id is None:
+            continue
+        for sender_id in (
+                notification['recent_actor_ids'] or
+                [notification['sender_id']]):
+            receipts.add(
+                (sender_id, notification['notification_type'], target_id))
+
+    # Recent actors may have deleted their accounts since
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    existing = set(User.objects.filter(
+        pk__in={receipt[0] for receipt in receipts}
+    ).values_list('pk', flat=True))
+
+    NotificationReceipt.objects.bulk_create(
+        [
+            NotificationReceipt(
+                sender_id=sender_id,
+                notification_type=notification_type,
+                target_id=target_id,
+            )
+            for sender_id, notification_type, target_id in receipts
+            if sender_id in existing
+        ],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_notification_retention_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('build_like', 'Build Like'), ('build_comment', 'Build Comment'), ('comment_reply', 'Comment Reply'), ('comment_vote', 'Comment Vote')], max_length=20)),
+                ('target_id', models.PositiveBigIntegerField()),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sender', 'notification_type', 'target_id'), name='unique_notification_receipt')],
+            },
+        ),
+        migrations.RunPython(
+            record_existing_receipts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+MESSAGES = {
+    'build_like': "{actors} liked your build '{title}'",
+    'build_comment': "{actors} commented on your build '{title}'",
+    'comment_reply': "{actors} replied to your comment on '{title}'",
+    'comment_vote': "{actors} upvoted your comment on '{title}'",
+}
+
+
+def restore_messages(apps, schema_editor):
+    """Render the stored message again when unapplying the removal"""
+    Notification = apps.get_model('users', 'Notification')
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    display_names = dict(
+        UserProfile.objects.exclude(display_name='').values_list(
+            'user_id', 'display_name'))
+    notifications = Notification.objects.select_related(
+        'sender', 'build', 'comment__build').iterator()
+
+    batch = []
+    for notification in notifications:
+        sender_name = display_names.get(
+            notification.sender_id, notification.sender.username)
+        others = notification.actor_count - 1
+        if others > 0:
+            actors = (
+                f"{sender_name} and {others} "
+                f"other{'s' if others > 1 else ''}")
+        else:
+            actors = sender_name
+        build = notification.build or notification.comment.build
+        notification.message = MESSAGES[
+            notification.notification_type].format(
+            actors=actors, title=build.title)
+        batch.append(notification)
+        if len(batch) == 1000:
+            Notification.objects.bulk_update(batch, ['message'])
+            batch = []
+    Notification.objects.bulk_update(batch, ['message'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_notificationreceipt'),
+    ]
+
+    operations = [
+        # The default lets the column be added back to existing rows
+        # before restore_messages fills it in
+        migrations.AlterField(
+            model_name='notification',
+            name='message',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, restore_messages),
+        migrations.RemoveField(
+            model_name='notification',
+            name='message',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_notification_message_at_read_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_picture_urls',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -26,6 +26,10 @@ class UserProfile(models.Model):
         folder='profile_pics/',
         help_text="Profile picture"
     )
+    # {size: URL} for each PROFILE_SIZES preset, stored on upload when
+    # CLOUDINARY_STORE_IMAGE_URLS is set
+    profile_picture_urls = models.JSONField(
+        default=dict, blank=True, editable=False)
     location = models.CharField(
         max_length=100,
         blank=True,
@@ -76,7 +80,15 @@ class UserProfile(models.Model):
     def get_profile_picture_url(self, size='medium'):
         """Return optimized profile picture URL or a default placeholder"""
         if self.profile_picture:
-            from utils.cloudinary_utils import get_profile_picture_url, PROFILE_SIZES
+            from utils.cloudinary_utils import (
+                get_profile_picture_url, store_image_urls, PROFILE_SIZES
+            )
+            stored_url = (
+                self.profile_picture_urls.get(size)
+                if store_image_urls() else None
+            )
+            if stored_url:
+                return stored_url
             size_config = PROFILE_SIZES.get(size, PROFILE_SIZES['medium'])
             return get_profile_picture_url(
                 self.profile_picture, size_config['width'])
@@ -87,10 +99,41 @@ class UserProfile(models.Model):
             return f"https://ui-avatars.com/api/?name={
                 self.get_display_name()}&background=6c757d&color=ffffff&size={size_px}"
 
+    def get_profile_picture_srcset(self):
+        """Return a srcset of the profile picture's sizes, or '' if none"""
+        if not self.profile_picture:
+            return ''
+        from utils.cloudinary_utils import (
+            build_srcset, get_profile_picture_urls, store_image_urls,
+            PROFILE_SIZES
+        )
+        urls = self.profile_picture_urls if store_image_urls() else {}
+        if not set(urls) >= set(PROFILE_SIZES):
+            urls = get_profile_picture_urls(self.profile_picture)
+        return build_srcset(urls, PROFILE_SIZES)
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         # Cloudinary handles image optimization automatically
         # No need for manual image processing
+        self.store_profile_picture_urls()
+
+    def store_profile_picture_urls(self):
+        """Save the URL of every size preset once the picture is uploaded"""
+        from utils.cloudinary_utils import (
+            get_profile_picture_urls, store_image_urls
+        )
+
+        if not store_image_urls():
+            return
+        # Uploads only become Cloudinary resources while the row is saved
+        picture = self._meta.get_field('profile_picture').to_python(
+            self.profile_picture)
+        urls = get_profile_picture_urls(picture)
+        if urls != self.profile_picture_urls:
+            self.profile_picture_urls = urls
+            UserProfile.objects.filter(pk=self.pk).update(
+                profile_picture_urls=urls)
 
     def total_builds(self):
         return self.user.build_set.count()
@@ -127,29 +170,55 @@ class Notification(models.Model):
         on_delete=models.CASCADE,
         null=True,
         blank=True)
+    # The latest comment of a coalesced notification; deleting it keeps
+    # the notification, which still stands for the other comments
     comment = models.ForeignKey(
         'builds.Comment',
-        on_delete=models.CASCADE,
+        on_delete=models.SET_NULL,
         null=True,
         blank=True)
 
-    message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Coalesced notifications stand for several actions; sender is the
+    # latest actor and recent_actor_ids the distinct actors so far, newest
+    # first (up to notifications.TRACKED_ACTORS)
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actor_ids = models.JSONField(default=list, blank=True)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['recipient', '-created_at']),
             models.Index(fields=['recipient', 'is_read']),
+            # Finds read notifications past retention (users.retention)
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(is_read=True),
+                name='users_notif_read_created_idx'),
         ]
 
     def __str__(self):
         return f"Notification for {self.recipient.username}: {self.message[:50]}"
 
+    @property
+    def message(self):
+        """Text of the notification, rendered from current names"""
+        from .notifications import render_message
+
+        return render_message(self)
+
     def mark_as_read(self):
+        from .unread_counts import adjust_unread_count
+
+        if self.is_read:
+            return
+        # Only count the change if this call is the one that made it
+        updated = Notification.objects.filter(
+            pk=self.pk, is_read=False).update(is_read=True)
         self.is_read = True
-        self.save()
+        adjust_unread_count(self.recipient_id, -updated)
 
     def get_absolute_url(self):
         """Return the URL this notification links to"""
@@ -158,3 +227,71 @@ class Notification(models.Model):
         elif self.comment:
             return self.comment.build.get_absolute_url()
         return '#'
+
+
+class NotificationEvent(models.Model):
+    """
+    Outbox entry for a notification that hasn't been delivered yet
+
+    Request handlers only insert these rows. The process_notifications
+    command applies preferences and duplicate checks and turns them into
+    Notification rows in batches.
+    """
+    notification_type = models.CharField(
+        max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+')
+    sender = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+')
+    build = models.ForeignKey(
+        'builds.Build',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+')
+    comment = models.ForeignKey(
+        'builds.Comment',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.notification_type} for user #{self.recipient_id}"
+
+
+class NotificationReceipt(models.Model):
+    """
+    Record that a sender has notified about a build or comment
+
+    Likes and comment votes notify at most once per sender and target,
+    however often they are toggled. The unique constraint enforces that;
+    target_id is the build for likes and the comment for votes.
+    """
+    sender = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+')
+    notification_type = models.CharField(
+        max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    target_id = models.PositiveBigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['sender', 'notification_type', 'target_id'],
+                name='unique_notification_receipt'),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.notification_type} of #{self.target_id} "
+            f"by user #{self.sender_id}")
@@ -1,25 +1,78 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import (
+    Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+)
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from .models import Notification
 from .notifications import NotificationService
+from .broker import get_broker
+from .unread_counts import get_unread_count as get_cached_unread_count
 
 
 @login_required
 def notification_list(request):
-    """Display user's notifications"""
-    notifications = Notification.objects.filter(recipient=request.user)
-    unread_count = NotificationService.get_unread_count(request.user)
+    """Display one page of the user's notifications"""
+    try:
+        notifications, next_cursor = NotificationService.get_notification_page(
+            request.user, request.GET.get('cursor'))
+    except ValueError:
+        raise Http404('Invalid cursor.')
 
     context = {
         'notifications': notifications,
-        'unread_count': unread_count,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
     return render(request, 'users/notifications.html', context)
 
 
+def _serialize_notification(notification):
+    """Return the JSON representation of a notification for the feed"""
+    profile = notification.sender.profile
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'message': notification.message,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+        'actor_count': notification.actor_count,
+        'url': notification.get_absolute_url(),
+        'sender': {
+            'username': notification.sender.username,
+            'display_name': profile.get_display_name(),
+            'avatar_url': profile.get_profile_picture_url(),
+        },
+    }
+
+
+@login_required
+def notification_feed(request):
+    """Return one page of the user's notifications as JSON"""
+    try:
+        notifications, next_cursor = NotificationService.get_notification_page(
+            request.user, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse(
+            {'success': False, 'error': 'Invalid cursor'}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'notifications': [
+            _serialize_notification(notification)
+            for notification in notifications
+        ],
+        'next_cursor': next_cursor,
+        'unread_count': NotificationService.get_unread_count(request.user),
+    })
+
+
 @login_required
 @require_http_methods(["POST"])
 def mark_notification_read(request, notification_id):
@@ -43,19 +96,78 @@ def mark_notification_read(request, notification_id):
         return redirect('notification-list')
 
 
+def _bulk_selection(request):
+    """
+    Read the notifications a bulk action applies to
+
+    Accepts form fields or a JSON body with ``notification_ids`` (a list)
+    and/or ``up_to`` (a notification id; it and everything older).
+
+    Returns:
+        tuple: (list of ids, up_to id or None)
+
+    Raises:
+        ValueError: If the body, the id list or an id is invalid
+    """
+    if request.content_type == 'application/json':
+        data = json.loads(request.body or '{}')
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        notification_ids = data.get('notification_ids')
+        if notification_ids is None:
+            notification_ids = []
+        # A string or object would be iterated as characters or keys
+        if not isinstance(notification_ids, list):
+            raise ValueError('Expected notification_ids to be a list')
+        up_to = data.get('up_to')
+    else:
+        notification_ids = request.POST.getlist('notification_ids')
+        up_to = request.POST.get('up_to') or None
+
+    notification_ids = [int(pk) for pk in notification_ids]
+    if up_to is not None:
+        up_to = int(up_to)
+    return notification_ids, up_to
+
+
 @login_required
 @require_http_methods(["POST"])
 def mark_notifications_read(request):
-    """Mark multiple notifications as read"""
+    """Mark notifications read by id or up to a notification"""
     try:
-        notification_ids = request.POST.getlist('notification_ids')
-        if notification_ids:
-            NotificationService.mark_notifications_as_read(
-                request.user, notification_ids)
+        notification_ids, up_to = _bulk_selection(request)
+    except (TypeError, ValueError):
+        return JsonResponse(
+            {'success': False, 'error': 'Invalid notification ids'},
+            status=400)
 
-        return JsonResponse({'success': True})
-    except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)})
+    if notification_ids or up_to is not None:
+        count = NotificationService.mark_notifications_as_read(
+            request.user, notification_ids, up_to)
+    else:
+        count = NotificationService.get_unread_count(request.user)
+    return JsonResponse({'success': True, 'unread_count': count})
+
+
+@login_required
+@require_http_methods(["POST"])
+def delete_notifications(request):
+    """Delete notifications by id or up to a notification"""
+    try:
+        notification_ids, up_to = _bulk_selection(request)
+    except (TypeError, ValueError):
+        return JsonResponse(
+            {'success': False, 'error': 'Invalid notification ids'},
+            status=400)
+    if not notification_ids and up_to is None:
+        return JsonResponse(
+            {'success': False, 'error': 'No notifications selected'},
+            status=400)
+
+    deleted, count = NotificationService.delete_notifications(
+        request.user, notification_ids, up_to)
+    return JsonResponse(
+        {'success': True, 'deleted': deleted, 'unread_count': count})
 
 
 @login_required
@@ -112,3 +224,46 @@ def get_unread_count(request):
     """Get unread notification count for AJAX requests"""
     count = NotificationService.get_unread_count(request.user)
     return JsonResponse({'count': count})
+
+
+def _sse(event, data):
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@login_required
+async def notification_stream(request):
+    """
+    Stream unread counts and new notifications as Server-Sent Events
+
+    Needs an ASGI server, where each open stream is an idle coroutine.
+    Under WSGI the stream would tie up a worker, so the view answers
+    204 instead, which tells EventSource not to reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    keepalive = getattr(settings, 'NOTIFICATION_STREAM_KEEPALIVE', 15)
+
+    async def events():
+        subscription = get_broker().subscribe(user.pk)
+        try:
+            await subscription.start()
+            count = await sync_to_async(get_cached_unread_count)(user.pk)
+            yield _sse('unread_count', {'count': count})
+            while True:
+                event = await subscription.get(timeout=keepalive)
+                if event is None:
+                    # Comment line that keeps proxies from closing the stream
+                    yield ': keepalive\n\n'
+                else:
+                    yield _sse(event['event'], event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(
+        events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,4 +1,109 @@
-from .models import Notification
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Subquery
+from django.urls import reverse
+from django.utils import timezone
+from builds.pagination import paginate_by_cursor
+from utils.cache_utils import is_shared_cache
+from .models import Notification, NotificationEvent, NotificationReceipt
+from . import broker, profile_cache, unread_counts
+
+# Types delivered at most once per sender and target (NotificationReceipt)
+DEDUPLICATED_TYPES = ('build_like', 'comment_vote')
+
+# Notification listing order; id breaks ties between equal timestamps
+NOTIFICATION_ORDERING = ('-created_at', '-id')
+NOTIFICATIONS_PER_PAGE = 20
+
+# Distinct actors remembered on a coalesced notification so an actor
+# who comes back isn't counted twice. Past this many actors, the oldest
+# are forgotten and one of them returning is counted again.
+TRACKED_ACTORS = 100
+
+# Messages are rendered when notifications are shown, so renamed users
+# and builds are always current. Load notifications to be shown with
+# select_related(*MESSAGE_RELATED) so rendering needs no further queries.
+MESSAGE_RELATED = ('sender__profile', 'build', 'comment__build')
+MESSAGES = {
+    'build_like': "{actors} liked your build '{title}'",
+    'build_comment': "{actors} commented on your build '{title}'",
+    'comment_reply': "{actors} replied to your comment on '{title}'",
+    'comment_vote': "{actors} upvoted your comment on '{title}'",
+}
+
+
+def delivers_eagerly():
+    """
+    Whether queued notifications are delivered during the request
+
+    NOTIFICATION_QUEUE_EAGER asks for it. Without a shared cache it is
+    always the case: the process_notifications worker couldn't update
+    the web processes' unread counts or live streams, so it doesn't run.
+    """
+    return (
+        getattr(settings, 'NOTIFICATION_QUEUE_EAGER', False)
+        or not is_shared_cache())
+
+
+def get_coalesce_window():
+    """Seconds during which new events merge into an unread notification"""
+    return getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 86400)
+
+
+def _receipt_key(item):
+    """Identify a sender's like or vote as stored in NotificationReceipt"""
+    target_id = (
+        item.comment_id if item.notification_type == 'comment_vote'
+        else item.build_id
+    )
+    return (item.sender_id, item.notification_type, target_id)
+
+
+def _coalesce_key(item):
+    """Group events and notifications about the same build or comment"""
+    target_id = (
+        item.comment_id if item.notification_type == 'comment_vote'
+        else None
+    )
+    return (
+        item.recipient_id, item.notification_type, item.build_id, target_id)
+
+
+def _display_name(user):
+    profile = getattr(user, 'profile', None)
+    return profile.get_display_name() if profile else user.username
+
+
+def _message(notification_type, sender_name, actor_count, title):
+    """Describe a notification, e.g. 'Tarnished and 41 others liked ...'"""
+    others = actor_count - 1
+    if others > 0:
+        actors = f"{sender_name} and {others} other{'s' if others > 1 else ''}"
+    else:
+        actors = sender_name
+    return MESSAGES[notification_type].format(actors=actors, title=title)
+
+
+def render_message(notification):
+    """
+    Describe a notification with its sender's and build's current names
+
+    Load notifications with select_related(*MESSAGE_RELATED) to render
+    a list without a query per row.
+    """
+    build = (
+        notification.build if notification.build_id
+        else notification.comment.build
+    )
+    return _message(
+        notification.notification_type,
+        _display_name(notification.sender),
+        notification.actor_count,
+        build.title
+    )
 
 
 class NotificationService:
@@ -6,123 +111,341 @@ class NotificationService:
 
     @staticmethod
     def create_build_like_notification(build, liker):
-        """Create notification when someone likes a build"""
-        if build.user == liker:
+        """Queue a notification for when someone likes a build"""
+        if build.user_id == liker.pk:
             return  # Don't notify if user likes their own build
 
-        if not build.user.profile.notify_on_build_like:
-            return  # User has disabled this notification type
-
-        # Check if notification already exists to avoid duplicates
-        existing = Notification.objects.filter(
-            recipient=build.user,
+        NotificationService._enqueue(
+            'build_like',
+            recipient_id=build.user_id,
             sender=liker,
-            notification_type='build_like',
             build=build
-        ).first()
-
-        if existing:
-            return  # Notification already exists
-
-        message = f"{
-            liker.profile.get_display_name()} liked your build '{
-            build.title}'"
-
-        Notification.objects.create(
-            recipient=build.user,
-            sender=liker,
-            notification_type='build_like',
-            build=build,
-            message=message
         )
 
     @staticmethod
     def create_build_comment_notification(build, commenter, comment):
-        """Create notification when someone comments on a build"""
-        if build.user == commenter:
+        """Queue a notification for when someone comments on a build"""
+        if build.user_id == commenter.pk:
             return  # Don't notify if user comments on their own build
 
-        if not build.user.profile.notify_on_build_comment:
-            return  # User has disabled this notification type
-
-        message = f"{
-            commenter.profile.get_display_name()} commented on your build '{
-            build.title}'"
-
-        Notification.objects.create(
-            recipient=build.user,
+        NotificationService._enqueue(
+            'build_comment',
+            recipient_id=build.user_id,
             sender=commenter,
-            notification_type='build_comment',
             build=build,
-            comment=comment,
-            message=message
+            comment=comment
         )
 
     @staticmethod
     def create_comment_vote_notification(comment, voter, vote_type):
-        """Create notification when someone votes on a comment"""
-        if comment.user == voter:
+        """Queue a notification for when someone votes on a comment"""
+        if comment.user_id == voter.pk:
             return  # Don't notify if user votes on their own comment
 
-        if not comment.user.profile.notify_on_comment_vote:
-            return  # User has disabled this notification type
-
         # Only notify for upvotes to reduce spam
         if vote_type != 'upvote':
             return
 
-        # Check if notification already exists for this vote type
-        existing = Notification.objects.filter(
-            recipient=comment.user,
+        NotificationService._enqueue(
+            'comment_vote',
+            recipient_id=comment.user_id,
             sender=voter,
-            notification_type='comment_vote',
+            build_id=comment.build_id,
             comment=comment
-        ).first()
+        )
 
-        if existing:
-            return  # Notification already exists
+    @staticmethod
+    def _enqueue(notification_type, **fields):
+        """
+        Add a notification to the outbox
 
-        message = f"{
-            voter.profile.get_display_name()} upvoted your comment on '{
-            comment.build.title}'"
+        This is the only work done in the request; preferences, duplicate
+        checks and delivery happen in process_pending(). When
+        delivers_eagerly() the outbox is drained straight away.
+        """
+        NotificationEvent.objects.create(
+            notification_type=notification_type, **fields)
 
-        Notification.objects.create(
-            recipient=comment.user,
-            sender=voter,
-            notification_type='comment_vote',
-            comment=comment,
-            build=comment.build,
-            message=message
-        )
+        if delivers_eagerly():
+            NotificationService.process_pending()
 
     @staticmethod
-    def mark_notifications_as_read(user, notification_ids=None):
-        """Mark notifications as read"""
+    def process_pending(batch_size=500):
+        """
+        Turn one batch of queued events into notifications
+
+        Returns:
+            int: Number of events taken off the queue
+        """
+        with transaction.atomic():
+            events = NotificationEvent.objects.select_related(
+                'build').order_by('pk')
+            # Let several workers drain the queue without blocking
+            if connection.features.has_select_for_update_skip_locked:
+                events = events.select_for_update(
+                    skip_locked=True, of=('self',))
+            events = list(events[:batch_size])
+            if not events:
+                return 0
+
+            # Preferences and display names, mostly from the cache
+            profiles = profile_cache.get_profiles(
+                {event.recipient_id for event in events} |
+                {event.sender_id for event in events})
+
+            # Likes and votes in this batch that have notified before
+            deduplicated = [
+                event for event in events
+                if event.notification_type in DEDUPLICATED_TYPES
+            ]
+            delivered = set()
+            if deduplicated:
+                keys = [_receipt_key(event) for event in deduplicated]
+                delivered.update(
+                    NotificationReceipt.objects.filter(
+                        sender_id__in={key[0] for key in keys},
+                        notification_type__in={key[1] for key in keys},
+                        target_id__in={key[2] for key in keys},
+                    ).values_list(
+                        'sender_id', 'notification_type', 'target_id')
+                )
+            previously_delivered = set(delivered)
+
+            # Unread notifications that new events may be merged into
+            window_start = timezone.now() - timedelta(
+                seconds=get_coalesce_window())
+            open_notifications = {}
+            for notification in Notification.objects.filter(
+                recipient_id__in={event.recipient_id for event in events},
+                build_id__in={event.build_id for event in events},
+                is_read=False,
+                created_at__gte=window_start,
+            ).order_by('created_at'):
+                # Later rows win if an old duplicate exists
+                open_notifications[_coalesce_key(notification)] = notification
+
+            merged = {}
+            for event in events:
+                notification = NotificationService._deliver_event(
+                    event, profiles, delivered, open_notifications)
+                if notification is not None and notification.pk is not None:
+                    merged[notification.pk] = notification
+            created = [
+                notification for notification in open_notifications.values()
+                if notification.pk is None
+            ]
+
+            Notification.objects.bulk_create(created)
+            # A concurrent worker may have recorded the same receipt
+            NotificationReceipt.objects.bulk_create(
+                [
+                    NotificationReceipt(
+                        sender_id=sender_id,
+                        notification_type=notification_type,
+                        target_id=target_id,
+                    )
+                    for sender_id, notification_type, target_id
+                    in delivered - previously_delivered
+                ],
+                ignore_conflicts=True
+            )
+            Notification.objects.bulk_update(
+                merged.values(),
+                [
+                    'sender',
+                    'comment',
+                    'created_at',
+                    'actor_count',
+                    'recent_actor_ids',
+                ]
+            )
+            NotificationEvent.objects.filter(
+                pk__in=[event.pk for event in events]).delete()
+
+        # Push delivered notifications to the recipients' live streams
+        titles = {event.build_id: event.build.title for event in events}
+        for notification in created + list(merged.values()):
+            broker.publish(notification.recipient_id, {
+                'event': 'notification',
+                'id': notification.pk,
+                'type': notification.notification_type,
+                'message': _message(
+                    notification.notification_type,
+                    profiles[notification.sender_id]['display_name'],
+                    notification.actor_count,
+                    titles[notification.build_id]
+                ),
+                'actor_count': notification.actor_count,
+                'url': reverse(
+                    'build-detail', kwargs={'pk': notification.build_id}),
+            })
+
+        # Merged notifications were already unread
+        new_unread = Counter(
+            notification.recipient_id for notification in created)
+        for recipient_id, count in new_unread.items():
+            unread_counts.adjust_unread_count(recipient_id, count)
+        return len(events)
+
+    @staticmethod
+    def _deliver_event(event, profiles, delivered, open_notifications):
+        """
+        Apply an event to a new or open notification
+
+        Returns the notification the event went into, or None if the
+        event was dropped.
+        """
+        # Preferences are read when the event is delivered
+        recipient = profiles.get(event.recipient_id)
+        if (recipient is not None and
+                not recipient['preferences'][event.notification_type]):
+            return None  # User has disabled this notification type
+
+        deduplicated = event.notification_type in DEDUPLICATED_TYPES
+        if deduplicated:
+            key = _receipt_key(event)
+            if key in delivered:
+                return None  # Notification already exists
+            delivered.add(key)
+
+        coalesce_key = _coalesce_key(event)
+        notification = open_notifications.get(coalesce_key)
+        if notification is None:
+            notification = Notification(
+                recipient_id=event.recipient_id,
+                notification_type=event.notification_type,
+                build_id=event.build_id,
+                actor_count=0,
+                recent_actor_ids=[],
+            )
+            open_notifications[coalesce_key] = notification
+        else:
+            # Bring the merged notification back to the top of the list
+            notification.created_at = timezone.now()
+
+        # Notifications from before coalescing only know their sender
+        if notification.actor_count:
+            recent_actors = (
+                notification.recent_actor_ids or [notification.sender_id])
+        else:
+            recent_actors = []
+        if event.sender_id in recent_actors:
+            if deduplicated:
+                return None  # This actor is already counted
+        else:
+            notification.actor_count += 1
+
+        notification.sender_id = event.sender_id
+        notification.comment_id = event.comment_id
+        notification.recent_actor_ids = [event.sender_id] + [
+            actor_id for actor_id in recent_actors
+            if actor_id != event.sender_id
+        ][:TRACKED_ACTORS - 1]
+        return notification
+
+    @staticmethod
+    def _select_notifications(user, notification_ids=None, up_to=None):
+        """
+        Narrow a user's notifications to a selection
+
+        Args:
+            notification_ids: Only these notifications
+            up_to: Only this notification and everything older than it,
+                in listing order
+
+        The up_to notification is looked up in a subquery, so the
+        selection is still a single statement.
+        """
         queryset = Notification.objects.filter(recipient=user)
 
         if notification_ids:
             queryset = queryset.filter(id__in=notification_ids)
+        if up_to is not None:
+            boundary = Subquery(Notification.objects.filter(
+                pk=up_to, recipient=user).values('created_at'))
+            queryset = queryset.filter(
+                Q(created_at__lt=boundary) |
+                Q(created_at=boundary, id__lte=up_to))
+        return queryset
+
+    @staticmethod
+    def mark_notifications_as_read(user, notification_ids=None, up_to=None):
+        """
+        Mark notifications as read with one UPDATE
+
+        Marks every notification unless ids or up_to narrow it down.
+
+        Returns:
+            int: The user's new unread count
+        """
+        queryset = NotificationService._select_notifications(
+            user, notification_ids, up_to)
 
-        queryset.update(is_read=True)
+        # Only unread rows change, so the update count is what to subtract
+        updated = queryset.filter(is_read=False).update(is_read=True)
+        if notification_ids or up_to is not None:
+            unread_counts.adjust_unread_count(user.pk, -updated)
+        else:
+            unread_counts.reset_unread_count(user.pk)
+        return unread_counts.get_unread_count(user.pk)
+
+    @staticmethod
+    def delete_notifications(user, notification_ids=None, up_to=None):
+        """
+        Delete notifications with one DELETE
+
+        Deletes every notification unless ids or up_to narrow it down.
+
+        Returns:
+            tuple: (number deleted, the user's new unread count)
+        """
+        queryset = NotificationService._select_notifications(
+            user, notification_ids, up_to)
+        deleted, _ = queryset.delete()
+
+        # DELETE doesn't say how many were unread; recount on the index
+        if deleted:
+            return deleted, unread_counts.refresh_unread_count(user.pk)
+        return deleted, unread_counts.get_unread_count(user.pk)
 
     @staticmethod
     def get_unread_count(user):
         """Get count of unread notifications for a user"""
-        return Notification.objects.filter(
-            recipient=user, is_read=False).count()
+        return unread_counts.get_unread_count(user.pk)
+
+    @staticmethod
+    def get_notification_page(user, cursor=None,
+                              page_size=NOTIFICATIONS_PER_PAGE):
+        """
+        Get one page of a user's notifications, newest first
+
+        Pages are keyed on (created_at, id) so they are served from the
+        (recipient, -created_at) index. Senders' profiles and the linked
+        build or comment are loaded in the same query.
+
+        Returns:
+            tuple: (list of notifications, cursor for the next page or None)
+
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        queryset = Notification.objects.filter(
+            recipient=user
+        ).select_related(
+            *MESSAGE_RELATED
+        ).order_by(*NOTIFICATION_ORDERING)
+        return paginate_by_cursor(
+            queryset, NOTIFICATION_ORDERING, cursor, page_size)
 
     @staticmethod
     def get_recent_notifications(user, limit=10):
-        """Get recent notifications for a user"""
-        return Notification.objects.filter(recipient=user)[:limit]
+        """Get recent notifications for a user, ready to render"""
+        return Notification.objects.filter(
+            recipient=user).select_related(*MESSAGE_RELATED)[:limit]
 
     @staticmethod
     def delete_notification(notification_id, user):
         """Delete a specific notification if it belongs to the user"""
-        try:
-            notification = Notification.objects.get(
-                id=notification_id, recipient=user)
-            notification.delete()
-            return True
-        except Notification.DoesNotExist:
-            return False
+        deleted, _ = NotificationService.delete_notifications(
+            user, [notification_id])
+        return bool(deleted)
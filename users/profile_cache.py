@@ -0,0 +1,67 @@
+"""
+Cached notification profiles
+
+Delivering a notification needs the recipient's notification preferences
+and the sender's display name. Both are cached per user id, so a batch of
+events loads them with one cache round trip instead of joining or
+querying each profile. users.signals drops a user's entry whenever their
+User or UserProfile is saved or deleted.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+PROFILE_KEY = 'notification_profile:{}'
+
+# Profile preference that enables each notification type
+PREFERENCE_FIELDS = {
+    'build_like': 'notify_on_build_like',
+    'build_comment': 'notify_on_build_comment',
+    'comment_reply': 'notify_on_comment_reply',
+    'comment_vote': 'notify_on_comment_vote',
+}
+
+
+def get_timeout():
+    """Seconds a cached notification profile lives"""
+    return getattr(settings, 'NOTIFICATION_PROFILE_CACHE_TIMEOUT', 3600)
+
+
+def get_profiles(user_ids):
+    """
+    Return {user_id: profile} for the given users
+
+    Each profile is a dict with the user's ``display_name`` and a
+    ``preferences`` dict of notification type to bool. Users without a
+    UserProfile get every notification, as before profiles existed.
+    """
+    keys = {PROFILE_KEY.format(user_id): user_id for user_id in user_ids}
+    cached = cache.get_many(keys.keys())
+    profiles = {keys[key]: profile for key, profile in cached.items()}
+
+    missing = set(keys.values()) - set(profiles)
+    if missing:
+        fields = ['profile__' + field for field in PREFERENCE_FIELDS.values()]
+        loaded = {}
+        for row in User.objects.filter(pk__in=missing).values(
+                'pk', 'username', 'profile__display_name', *fields):
+            loaded[row['pk']] = {
+                'display_name': (
+                    row['profile__display_name'] or row['username']),
+                'preferences': {
+                    notification_type: row['profile__' + field] is not False
+                    for notification_type, field in PREFERENCE_FIELDS.items()
+                },
+            }
+        cache.set_many(
+            {PROFILE_KEY.format(user_id): profile
+             for user_id, profile in loaded.items()},
+            timeout=get_timeout()
+        )
+        profiles.update(loaded)
+    return profiles
+
+
+def invalidate_profile(user_id):
+    """Drop a user's cached profile after it changes"""
+    cache.delete(PROFILE_KEY.format(user_id))
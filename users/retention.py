@@ -0,0 +1,163 @@
+"""
+Notification retention
+
+Read notifications are deleted once they are older than
+NOTIFICATION_RETENTION_DAYS, and each user keeps at most
+NOTIFICATION_MAX_PER_USER notifications, newest first. Either limit is
+disabled by setting it to 0. Receipts of likes and votes
+(NotificationReceipt) have no foreign key to the build or comment, so
+receipts whose target was deleted are removed as well.
+
+Rows are deleted in batches of primary keys, each in its own short
+transaction, so pruning a large backlog never holds long locks. Deleted
+rows can be written to an archive file as JSON lines first. Run it with
+`manage.py prune_notifications`, e.g. daily from a scheduler.
+"""
+import json
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from builds.models import Build, Comment
+from .models import Notification, NotificationReceipt
+from .notifications import NOTIFICATION_ORDERING
+from .unread_counts import adjust_unread_count
+
+ARCHIVE_FIELDS = (
+    'id', 'recipient_id', 'sender_id', 'notification_type', 'build_id',
+    'comment_id', 'is_read', 'created_at', 'actor_count', 'recent_actor_ids',
+)
+
+# Model each deduplicated type's NotificationReceipt.target_id refers to
+RECEIPT_TARGETS = {
+    'build_like': Build,
+    'comment_vote': Comment,
+}
+
+
+def get_retention_days():
+    """Days read notifications are kept; 0 keeps them forever"""
+    return getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+
+
+def get_max_per_user():
+    """Notifications kept per user; 0 means no limit"""
+    return getattr(settings, 'NOTIFICATION_MAX_PER_USER', 1000)
+
+
+def delete_notifications(ids, archive=None):
+    """
+    Delete notifications by id, archiving them first
+
+    Args:
+        ids: Primary keys of the notifications to delete
+        archive: Optional text file the rows are written to as JSON lines
+
+    Returns:
+        int: Number of notifications deleted
+    """
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.filter(pk__in=ids).values(*ARCHIVE_FIELDS))
+        if archive is not None:
+            for row in rows:
+                archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        deleted, _ = Notification.objects.filter(
+            pk__in=[row['id'] for row in rows]).delete()
+
+    unread = Counter(row['recipient_id'] for row in rows if not row['is_read'])
+    for recipient_id, count in unread.items():
+        adjust_unread_count(recipient_id, -count)
+    return deleted
+
+
+def prune_expired(days, batch_size=1000, archive=None, pause=0):
+    """Delete read notifications created more than `days` days ago"""
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = Notification.objects.filter(
+        is_read=True, created_at__lt=cutoff).order_by('created_at')
+
+    total = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += delete_notifications(ids, archive)
+        time.sleep(pause)
+
+
+def prune_over_limit(limit, batch_size=1000, archive=None, pause=0):
+    """Delete each user's notifications beyond the newest `limit`"""
+    recipients = Notification.objects.values('recipient_id').annotate(
+        total=Count('id')).filter(total__gt=limit).values_list(
+        'recipient_id', flat=True)
+
+    total = 0
+    for recipient_id in list(recipients):
+        older = Notification.objects.filter(
+            recipient_id=recipient_id).order_by(*NOTIFICATION_ORDERING)
+        while True:
+            ids = list(older.values_list(
+                'id', flat=True)[limit:limit + batch_size])
+            if not ids:
+                break
+            total += delete_notifications(ids, archive)
+            time.sleep(pause)
+    return total
+
+
+def prune_notifications(days=None, max_per_user=None, batch_size=1000,
+                        archive=None, pause=0):
+    """
+    Apply both retention limits
+
+    Args:
+        days: Age limit for read notifications (default from settings)
+        max_per_user: Per-user limit (default from settings)
+        batch_size: Notifications deleted per transaction
+        archive: Optional text file deleted rows are written to
+        pause: Seconds to sleep between batches
+
+    Returns:
+        tuple: (expired notifications deleted, over-limit ones deleted)
+    """
+    if days is None:
+        days = get_retention_days()
+    if max_per_user is None:
+        max_per_user = get_max_per_user()
+
+    expired = over_limit = 0
+    if days:
+        expired = prune_expired(days, batch_size, archive, pause)
+    if max_per_user:
+        over_limit = prune_over_limit(
+            max_per_user, batch_size, archive, pause)
+    return expired, over_limit
+
+
+def prune_orphaned_receipts(batch_size=1000, pause=0):
+    """
+    Delete receipts whose build or comment no longer exists
+
+    Returns:
+        int: Number of receipts deleted
+    """
+    total = 0
+    for notification_type, model in RECEIPT_TARGETS.items():
+        orphaned = NotificationReceipt.objects.filter(
+            notification_type=notification_type
+        ).exclude(target_id__in=model.objects.values('pk')).order_by('pk')
+        while True:
+            ids = list(orphaned.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted, _ = NotificationReceipt.objects.filter(
+                pk__in=ids).delete()
+            total += deleted
+            time.sleep(pause)
+    return total
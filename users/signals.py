@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 from .models import UserProfile
+from .profile_cache import invalidate_profile
 
 
 @receiver(post_save, sender=User)
@@ -18,3 +19,17 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
     else:
         UserProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_notification_profile(sender, instance, **kwargs):
+    """Drop the cached notification profile of a changed user"""
+    invalidate_profile(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_notification_profile(sender, instance, **kwargs):
+    """Drop the cached notification profile when preferences change"""
+    invalidate_profile(instance.user_id)
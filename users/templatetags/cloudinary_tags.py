@@ -1,56 +1,120 @@
 from django import template
-from django.utils.safestring import mark_safe
+from django.utils.html import format_html
 
 register = template.Library()
 
 
+# Slot the build card grid (col-12 col-sm-6 col-lg-4) gives an image
+BUILD_CARD_SIZES = (
+    '(max-width: 575.98px) 100vw, (max-width: 991.98px) 50vw, 33vw')
+
+
+def _is_profile_picture(image_field):
+    if hasattr(image_field, 'folder') and 'profile' in str(image_field.folder):
+        return True
+    return str(getattr(image_field, 'public_id', '')).startswith(
+        'profile_pics/')
+
+
 @register.simple_tag
-def cloudinary_image(image_field, size='medium', css_class='', alt_text=''):
+def cloudinary_image(image_field, size='medium', css_class='', alt_text='',
+                     sizes=''):
     """
-    Template tag for rendering optimized Cloudinary images
+    Template tag for rendering responsive Cloudinary images
+
+    The srcset lists every preset of the image's kind (BUILD_SIZES or
+    PROFILE_SIZES) so the browser picks the smallest one that's sharp on
+    its screen. ``size`` sets the src and the width/height attributes;
+    ``sizes`` defaults to that preset's width.
 
     Usage:
     {% cloudinary_image build.image 'large' 'img-fluid' 'Build image' %}
     {% cloudinary_image user.profile.profile_picture 'small' 'rounded-circle' 'Profile picture' %}
+    {% cloudinary_image image.image 'medium' 'w-100' sizes='100vw' %}
     """
     if not image_field:
         return ''
 
-    # Determine if this is a profile picture or build image
-    if hasattr(image_field, 'folder') and 'profile' in str(image_field.folder):
-        # This is a profile picture
-        if hasattr(
-                image_field,
-                '_meta') and hasattr(
-                image_field._meta,
-                'model'):
-            # Get URL from the model method
-            url = image_field._meta.model.get_profile_picture_url(size)
-        else:
-            from utils.cloudinary_utils import get_profile_picture_url, PROFILE_SIZES
-            size_config = PROFILE_SIZES.get(size, PROFILE_SIZES['medium'])
-            url = get_profile_picture_url(image_field, size_config['width'])
+    from utils.cloudinary_utils import (
+        build_srcset, get_build_image_urls, get_profile_picture_urls,
+        BUILD_SIZES, PROFILE_SIZES
+    )
+    if _is_profile_picture(image_field):
+        presets = PROFILE_SIZES
+        urls = get_profile_picture_urls(image_field)
     else:
-        # This is a build image
-        from utils.cloudinary_utils import get_build_image_url, get_thumbnail_url, BUILD_SIZES
-        if size == 'thumbnail':
-            url = get_thumbnail_url(image_field)
-        else:
-            size_config = BUILD_SIZES.get(size, BUILD_SIZES['medium'])
-            url = get_build_image_url(
-                image_field,
-                size_config['width'],
-                size_config['height'])
+        presets = BUILD_SIZES
+        urls = get_build_image_urls(image_field)
 
+    if size not in presets:
+        size = 'medium'
+    url = urls.get(size)
     if not url:
         return ''
 
-    # Build the img tag
-    css_class = f'class="{css_class}"' if css_class else ''
-    alt_text = f'alt="{alt_text}"' if alt_text else 'alt=""'
+    width = presets[size]['width']
+    height = presets[size]['height']
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}"{} '
+        'alt="{}" loading="lazy">',
+        url,
+        build_srcset(urls, presets),
+        sizes or f'(max-width: {width}px) 100vw, {width}px',
+        width,
+        height,
+        format_html(' class="{}"', css_class) if css_class else '',
+        alt_text,
+    )
+
+
+@register.simple_tag
+def build_image_srcset(build, sizes=BUILD_CARD_SIZES):
+    """
+    Template tag adding srcset and sizes to a build image
+
+    Renders nothing for builds showing a default emblem.
 
-    img_tag = f'<img src="{url}" {css_class} {alt_text} loading="lazy">'
-    return mark_safe(img_tag)
+    Usage:
+    <img src="{{ build.get_image_url }}"{% build_image_srcset build %}>
+    """
+    srcset = build.get_image_srcset()
+    if not srcset:
+        return ''
+    return format_html(' srcset="{}" sizes="{}"', srcset, sizes)
+
+
+@register.simple_tag
+def build_image_dimensions(size='medium'):
+    """
+    Template tag adding the width and height of a BUILD_SIZES preset
+
+    Build.get_image_url serves the 'medium' preset by default, so cards
+    reserve that preset's aspect ratio before the image loads.
+
+    Usage:
+    <img src="{{ build.get_image_url }}"{% build_image_dimensions %}>
+    """
+    from utils.cloudinary_utils import BUILD_SIZES
+
+    preset = BUILD_SIZES.get(size, BUILD_SIZES['medium'])
+    return format_html(
+        ' width="{}" height="{}"', preset['width'], preset['height'])
+
+
+@register.simple_tag
+def profile_picture_srcset(profile, sizes):
+    """
+    Template tag adding srcset and sizes to a profile picture
+
+    Renders nothing for users without an uploaded picture.
+
+    Usage:
+    <img src="{{ profile.get_profile_picture_url }}"{% profile_picture_srcset profile '24px' %}>
+    """
+    srcset = profile.get_profile_picture_srcset() if profile else ''
+    if not srcset:
+        return ''
+    return format_html(' srcset="{}" sizes="{}"', srcset, sizes)
 
 
 @register.simple_tag
@@ -1,14 +1,38 @@
-from django.test import TestCase, Client
+from django.test import AsyncClient, TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from builds.models import Build, Comment
-from users.models import Notification
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+import asyncio
+import base64
+import gzip
+import json
+import os
+import tempfile
+from asgiref.sync import sync_to_async
+from users import profile_cache, unread_counts
+from users.broker import CacheBroker, InProcessBroker, get_broker
+from users.checks import check_worker_cache
+from users.models import (
+    Notification, NotificationEvent, NotificationReceipt, UserProfile
+)
 from users.notifications import NotificationService
+from users.retention import prune_notifications, prune_orphaned_receipts
 
 
+# Deliver queued notifications during the request so tests can check them
+@override_settings(NOTIFICATION_QUEUE_EAGER=True)
 class NotificationSystemTestCase(TestCase):
     def setUp(self):
         """Set up test data"""
+        cache.clear()
         self.client = Client()
 
         # Create test users
@@ -284,3 +308,994 @@ class NotificationSystemTestCase(TestCase):
         self.assertTrue(self.profile1.notify_on_build_comment)
         self.assertFalse(self.profile1.notify_on_comment_reply)
         self.assertTrue(self.profile1.notify_on_comment_vote)
+
+
+@override_settings(NOTIFICATION_QUEUE_EAGER=True)
+class UnreadCountCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.update_or_create(
+            user=self.user1, defaults={'notify_on_comment_vote': True})
+        UserProfile.objects.get_or_create(user=self.user2)
+        self.build = Build.objects.create(
+            user=self.user1,
+            title="Test Build for Notifications",
+            description="A test build for notification testing",
+            category="PVE"
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_notifications(self):
+        """Create one notification of each type for user1"""
+        NotificationService.create_build_like_notification(
+            self.build, self.user2)
+        NotificationService.create_build_comment_notification(
+            self.build, self.user2, Comment.objects.create(
+                build=self.build, user=self.user2, content="Test"))
+        NotificationService.create_comment_vote_notification(
+            Comment.objects.create(
+                build=self.build, user=self.user1, content="Mine"),
+            self.user2,
+            'upvote'
+        )
+
+    def test_counter_tracks_service_calls(self):
+        """Test that create, read and delete keep the counter exact"""
+        NotificationService.get_unread_count(self.user1)
+        self.create_notifications()
+
+        with self.assertNumQueries(0):
+            count = NotificationService.get_unread_count(self.user1)
+        self.assertEqual(count, 3)
+
+        first, second, third = Notification.objects.filter(
+            recipient=self.user1)
+        first.mark_as_read()
+        first.mark_as_read()
+        self.assertEqual(NotificationService.get_unread_count(self.user1), 2)
+
+        NotificationService.mark_notifications_as_read(
+            self.user1, [first.pk, second.pk])
+        self.assertEqual(NotificationService.get_unread_count(self.user1), 1)
+
+        NotificationService.delete_notification(first.pk, self.user1)
+        self.assertEqual(NotificationService.get_unread_count(self.user1), 1)
+        NotificationService.delete_notification(third.pk, self.user1)
+        self.assertEqual(NotificationService.get_unread_count(self.user1), 0)
+
+    def test_mark_all_resets_counter(self):
+        """Test that marking everything read zeroes the counter"""
+        self.create_notifications()
+        NotificationService.mark_notifications_as_read(self.user1)
+
+        with self.assertNumQueries(0):
+            count = NotificationService.get_unread_count(self.user1)
+        self.assertEqual(count, 0)
+
+    def test_context_processor_uses_cached_count(self):
+        """Test that page renders don't COUNT notifications"""
+        self.create_notifications()
+        self.client.login(username='testuser1', password='testpass123')
+        self.client.get(reverse('home'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['unread_count'], 3)
+        self.assertFalse(any(
+            Notification._meta.db_table in query['sql']
+            for query in queries
+        ))
+
+    def test_per_process_cache_recounts_soon(self):
+        """Test that counts other processes can't update expire quickly"""
+        with override_settings(
+                CACHE_SHARED=False, NOTIFICATION_UNREAD_COUNT_TIMEOUT=3600):
+            self.assertEqual(
+                unread_counts.get_timeout(), unread_counts.LOCAL_CACHE_TIMEOUT)
+        with override_settings(
+                CACHE_SHARED=True, NOTIFICATION_UNREAD_COUNT_TIMEOUT=3600):
+            self.assertEqual(unread_counts.get_timeout(), 3600)
+
+
+# The worker runs in the test process, so it shares the test cache
+@override_settings(CACHE_SHARED=True)
+class NotificationQueueTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        self.profile1, _ = UserProfile.objects.get_or_create(user=self.user1)
+        UserProfile.objects.get_or_create(user=self.user2)
+        self.build = Build.objects.create(
+            user=self.user1,
+            title="Test Build for Notifications",
+            description="A test build for notification testing",
+            category="PVE"
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def process(self):
+        out = StringIO()
+        call_command('process_notifications', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_requests_only_queue_events(self):
+        """Test that write endpoints leave delivery to the worker"""
+        self.client.login(username='testuser2', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(
+                reverse('comment-create', kwargs={'pk': self.build.pk}),
+                {'content': 'Queued comment'})
+        self.assertFalse(any(
+            f'"{Notification._meta.db_table}"' in query['sql']
+            for query in queries
+        ))
+        self.assertEqual(NotificationEvent.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+        self.assertIn('Successfully processed 1', self.process())
+        notification = Notification.objects.get()
+        self.assertEqual(notification.recipient, self.user1)
+        self.assertIn('commented on your build', notification.message)
+        self.assertFalse(NotificationEvent.objects.exists())
+        self.assertEqual(NotificationService.get_unread_count(self.user1), 1)
+
+    def test_worker_drops_duplicates_and_disabled_types(self):
+        """Test that preferences and duplicate checks run in the worker"""
+        NotificationService.create_build_like_notification(
+            self.build, self.user2)
+        NotificationService.create_build_like_notification(
+            self.build, self.user2)
+        self.process()
+        NotificationService.create_build_like_notification(
+            self.build, self.user2)
+        self.process()
+        self.assertEqual(Notification.objects.count(), 1)
+
+        self.profile1.notify_on_build_comment = False
+        self.profile1.save()
+        comment = Comment.objects.create(
+            build=self.build, user=self.user2, content="Muted")
+        NotificationService.create_build_comment_notification(
+            self.build, self.user2, comment)
+        self.process()
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertFalse(NotificationEvent.objects.exists())
+
+    def test_worker_uses_bulk_insert(self):
+        """Test that a batch is delivered with constant queries"""
+        for i in range(10):
+            build = Build.objects.create(
+                user=self.user1, title=f"Build {i}", category="PVE")
+            comment = Comment.objects.create(
+                build=build, user=self.user2, content=f"Test {i}")
+            NotificationService.create_build_comment_notification(
+                build, self.user2, comment)
+
+        # Profiles come from the cache once it's warm
+        profile_cache.get_profiles([self.user1.pk, self.user2.pk])
+        with CaptureQueriesContext(connection) as queries:
+            processed = NotificationService.process_pending()
+        # Select events, load open notifications, bulk insert, delete events
+        statements = [
+            query['sql'] for query in queries
+            if 'SAVEPOINT' not in query['sql']
+        ]
+        self.assertEqual(len(statements), 4)
+        self.assertEqual(processed, 10)
+        self.assertEqual(Notification.objects.count(), 10)
+
+    def test_likes_notify_once_per_sender(self):
+        """Test that receipts stop repeat likes after coalescing and reads"""
+        user3 = User.objects.create_user(username='testuser3')
+        for liker in (self.user2, user3, self.user2):
+            NotificationService.create_build_like_notification(
+                self.build, liker)
+            self.process()
+        NotificationService.mark_notifications_as_read(self.user1)
+
+        # The unread notification is gone and user3 is its sender now
+        NotificationService.create_build_like_notification(
+            self.build, self.user2)
+        self.process()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(NotificationReceipt.objects.count(), 2)
+
+    def test_messages_follow_renames(self):
+        """Test that messages are rendered with current names"""
+        NotificationService.create_build_like_notification(
+            self.build, self.user2)
+        self.process()
+
+        self.build.title = "Renamed Build"
+        self.build.save()
+        profile2 = self.user2.profile
+        profile2.display_name = 'Ranni'
+        profile2.save()
+
+        self.client.login(username='testuser1', password='testpass123')
+        response = self.client.get(reverse('notification-list'))
+        self.assertContains(response, "Ranni liked your build")
+        self.assertContains(response, "Renamed Build")
+
+    def test_recent_notifications_render_in_one_query(self):
+        """Test that recent notifications load what their messages show"""
+        comment = Comment.objects.create(
+            build=self.build, user=self.user1, content='Hi')
+        Notification.objects.create(
+            recipient=self.user1, sender=self.user2,
+            notification_type='build_like', build=self.build)
+        Notification.objects.create(
+            recipient=self.user1, sender=self.user2,
+            notification_type='comment_vote', comment=comment)
+
+        with self.assertNumQueries(1):
+            messages = [
+                notification.message for notification in
+                NotificationService.get_recent_notifications(self.user1)
+            ]
+        self.assertEqual(len(messages), 2)
+
+    def test_profile_changes_reach_the_worker(self):
+        """Test that cached preferences and names follow profile edits"""
+        profile_cache.get_profiles([self.user1.pk, self.user2.pk])
+        profile2 = self.user2.profile
+        profile2.display_name = 'Melina'
+        profile2.save()
+
+        NotificationService.create_build_like_notification(
+            self.build, self.user2)
+        self.process()
+        self.assertIn('Melina liked', Notification.objects.get().message)
+
+        self.profile1.notify_on_build_comment = False
+        self.profile1.save()
+        self.assertFalse(profile_cache.get_profiles(
+            [self.user1.pk])[self.user1.pk]['preferences']['build_comment'])
+
+    @override_settings(CACHE_SHARED=None)
+    def test_per_process_cache_delivers_eagerly(self):
+        """Test that likes notify at once when the worker can't run"""
+        self.client.login(username='testuser2', password='testpass123')
+        response = self.client.post(
+            reverse('build-like', kwargs={'pk': self.build.pk}))
+        self.assertEqual(response.status_code, 302)
+
+        self.assertTrue(Notification.objects.filter(
+            recipient=self.user1, sender=self.user2,
+            notification_type='build_like').exists())
+        self.assertFalse(NotificationEvent.objects.exists())
+
+        # A worker left running drains what's queued and exits
+        NotificationEvent.objects.create(
+            notification_type='build_comment', recipient_id=self.user1.pk,
+            sender=self.user2, build=self.build)
+        out = StringIO()
+        call_command('process_notifications', sleep=0, stdout=out)
+        self.assertIn('delivered by the web processes', out.getvalue())
+        self.assertFalse(NotificationEvent.objects.exists())
+
+        errors = check_worker_cache(None)
+        self.assertEqual([error.id for error in errors], ['users.W001'])
+        with override_settings(NOTIFICATION_QUEUE_EAGER=True):
+            self.assertEqual(check_worker_cache(None), [])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                'LOCATION': 'cache_table'}}):
+            self.assertEqual(check_worker_cache(None), [])
+
+
+class NotificationCoalescingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.update_or_create(
+            user=self.owner, defaults={'notify_on_comment_vote': True})
+        self.fans = []
+        for i in range(4):
+            fan = User.objects.create_user(username=f'fan{i}')
+            UserProfile.objects.get_or_create(user=fan)
+            self.fans.append(fan)
+        self.build = Build.objects.create(
+            user=self.owner,
+            title="Viral Build",
+            description="Everyone likes this one",
+            category="PVE"
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def like(self, *fans):
+        for fan in fans:
+            NotificationService.create_build_like_notification(
+                self.build, fan)
+        NotificationService.process_pending()
+
+    def test_likes_merge_into_one_notification(self):
+        """Test that likes on a build become one aggregated row"""
+        self.like(self.fans[0])
+        self.like(self.fans[1], self.fans[2], self.fans[3])
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(notification.sender, self.fans[3])
+        self.assertEqual(
+            notification.recent_actor_ids,
+            [fan.pk for fan in reversed(self.fans)])
+        self.assertEqual(
+            notification.message,
+            "fan3 and 3 others liked your build 'Viral Build'")
+        self.assertEqual(NotificationService.get_unread_count(self.owner), 1)
+
+    def test_repeat_actor_is_not_counted_twice(self):
+        """Test that liking again doesn't inflate the actor count"""
+        self.like(self.fans[0], self.fans[1])
+        self.like(self.fans[0])
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(
+            notification.message,
+            "fan1 and 1 other liked your build 'Viral Build'")
+
+    def test_read_or_old_notifications_start_a_new_row(self):
+        """Test that only recent unread notifications absorb events"""
+        self.like(self.fans[0])
+        NotificationService.mark_notifications_as_read(self.owner)
+        self.like(self.fans[1])
+        self.assertEqual(Notification.objects.count(), 2)
+
+        Notification.objects.update(
+            created_at=timezone.now() - timedelta(days=2))
+        self.like(self.fans[2])
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual(NotificationService.get_unread_count(self.owner), 2)
+
+    def test_comments_and_votes_coalesce_per_target(self):
+        """Test that comments merge per build and votes per comment"""
+        comments = [
+            Comment.objects.create(
+                build=self.build, user=fan, content="Great")
+            for fan in self.fans[:2]
+        ]
+        for comment in comments:
+            NotificationService.create_build_comment_notification(
+                self.build, comment.user, comment)
+
+        mine = [
+            Comment.objects.create(
+                build=self.build, user=self.owner, content=f"Reply {i}")
+            for i in range(2)
+        ]
+        for fan in self.fans[:2]:
+            for comment in mine:
+                NotificationService.create_comment_vote_notification(
+                    comment, fan, 'upvote')
+        NotificationService.process_pending()
+
+        comment_notification = Notification.objects.get(
+            notification_type='build_comment')
+        self.assertEqual(comment_notification.actor_count, 2)
+        self.assertEqual(comment_notification.comment, comments[1])
+        self.assertEqual(
+            Notification.objects.filter(
+                notification_type='comment_vote').count(), 2)
+
+    def test_deleting_latest_comment_keeps_digest(self):
+        """Test that a coalesced notification outlives its last comment"""
+        comments = []
+        for fan in self.fans[:2]:
+            comment = Comment.objects.create(
+                build=self.build, user=fan, content="Great")
+            NotificationService.create_build_comment_notification(
+                self.build, fan, comment)
+            comments.append(comment)
+        NotificationService.process_pending()
+
+        comments[1].delete()
+        notification = Notification.objects.get()
+        self.assertIsNone(notification.comment_id)
+        self.assertEqual(
+            notification.message,
+            "fan1 and 1 other commented on your build 'Viral Build'")
+        self.assertEqual(NotificationService.get_unread_count(self.owner), 1)
+
+    def test_returning_commenter_is_not_counted_twice(self):
+        """Test that actors are counted once, however many came between"""
+        for fan in [self.fans[0], *self.fans[1:], self.fans[0]]:
+            comment = Comment.objects.create(
+                build=self.build, user=fan, content="Great")
+            NotificationService.create_build_comment_notification(
+                self.build, fan, comment)
+        NotificationService.process_pending()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(notification.sender, self.fans[0])
+
+
+class NotificationPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.user1)
+        UserProfile.objects.get_or_create(user=self.user2)
+        self.build = Build.objects.create(
+            user=self.user1,
+            title="Test Build for Notifications",
+            description="A test build for notification testing",
+            category="PVE"
+        )
+        self.client.login(username='testuser1', password='testpass123')
+
+    def tearDown(self):
+        cache.clear()
+
+    def add_notifications(self, count):
+        comment = Comment.objects.create(
+            build=self.build, user=self.user2, content="Test")
+        Notification.objects.bulk_create(
+            Notification(
+                recipient=self.user1,
+                sender=self.user2,
+                notification_type='build_comment',
+                build=self.build if i % 2 else None,
+                comment=None if i % 2 else comment,
+            )
+            for i in range(count)
+        )
+
+    def count_feed_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('notification-feed'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_pages_through_every_notification(self):
+        """Test that following cursors returns each notification once"""
+        self.add_notifications(45)
+        seen = []
+        cursor = None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            data = self.client.get(
+                reverse('notification-feed'), params).json()
+            seen += [item['id'] for item in data['notifications']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(
+            set(seen),
+            set(Notification.objects.values_list('id', flat=True)))
+        self.assertEqual(
+            data['notifications'][0]['url'], self.build.get_absolute_url())
+
+    def test_feed_queries_do_not_grow_with_rows(self):
+        """Test that senders and links are loaded with the page"""
+        self.add_notifications(2)
+        self.count_feed_queries()  # Warm the cached unread count
+        few = self.count_feed_queries()
+        self.add_notifications(10)
+        self.assertEqual(self.count_feed_queries(), few)
+
+    def test_list_shows_first_page(self):
+        """Test that the notification page renders one page at a time"""
+        self.add_notifications(25)
+        response = self.client.get(reverse('notification-list'))
+        self.assertEqual(len(response.context['notifications']), 20)
+        self.assertContains(response, 'Older notifications')
+
+        response = self.client.get(
+            reverse('notification-list'),
+            {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(response.context['notifications']), 5)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test that a tampered cursor returns an error"""
+        response = self.client.get(
+            reverse('notification-feed'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse('notification-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_wrongly_typed_cursor_is_rejected(self):
+        """Test that a cursor decoding to the wrong types returns an error"""
+        for values in (['yesterday', 5], ['2024-01-01T00:00:00+00:00', {}]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(values).encode('utf-8')).decode('ascii')
+            response = self.client.get(
+                reverse('notification-feed'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, values)
+            self.assertEqual(response.json()['error'], 'Invalid cursor')
+            response = self.client.get(
+                reverse('notification-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, values)
+
+
+@override_settings(NOTIFICATION_BROKER_BACKEND='users.broker.InProcessBroker')
+class NotificationStreamTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=self.user1)
+        UserProfile.objects.get_or_create(user=self.user2)
+        self.build = Build.objects.create(
+            user=self.user1,
+            title="Test Build for Notifications",
+            description="A test build for notification testing",
+            category="PVE"
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    async def open_stream(self, user):
+        """
+        Read a user's notification stream in a background task
+
+        Cancelling the task stands in for the browser disconnecting.
+        """
+        client = AsyncClient()
+        await client.aforce_login(user)
+        response = await client.get(reverse('notification-stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        chunks = asyncio.Queue()
+
+        async def read():
+            async for chunk in response.streaming_content:
+                await chunks.put(chunk.decode())
+        return chunks, asyncio.create_task(read())
+
+    async def close_stream(self, reader):
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+
+    async def next_event(self, chunks):
+        """Read the next Server-Sent Event from a stream"""
+        chunk = await asyncio.wait_for(chunks.get(), timeout=5)
+        event, data = chunk.strip().split('\n')
+        return event[len('event: '):], json.loads(data[len('data: '):])
+
+    async def test_stream_pushes_counts_and_notifications(self):
+        """Test that delivered notifications reach an open stream"""
+        chunks, reader = await self.open_stream(self.user1)
+        self.assertEqual(
+            await self.next_event(chunks), ('unread_count', {'count': 0}))
+
+        def like_build():
+            NotificationService.create_build_like_notification(
+                self.build, self.user2)
+            NotificationService.process_pending()
+        await sync_to_async(like_build)()
+
+        event, data = await self.next_event(chunks)
+        self.assertEqual(event, 'notification')
+        self.assertIn('liked your build', data['message'])
+        self.assertEqual(data['url'], self.build.get_absolute_url())
+        self.assertEqual(
+            await self.next_event(chunks),
+            ('unread_count', {'event': 'unread_count', 'count': 1}))
+
+        await self.close_stream(reader)
+        self.assertEqual(get_broker().subscriber_count(self.user1.pk), 0)
+
+    async def test_stream_sends_keepalives(self):
+        """Test that idle streams send comment lines"""
+        with self.settings(NOTIFICATION_STREAM_KEEPALIVE=0.01):
+            chunks, reader = await self.open_stream(self.user1)
+            await self.next_event(chunks)
+            chunk = await asyncio.wait_for(chunks.get(), timeout=5)
+            await self.close_stream(reader)
+        self.assertEqual(chunk, ': keepalive\n\n')
+
+    def test_streams_need_login_and_asgi(self):
+        """Test that anonymous and WSGI requests don't open a stream"""
+        client = Client()
+        response = client.get(reverse('notification-stream'))
+        self.assertEqual(response.status_code, 302)
+
+        client.login(username='testuser1', password='testpass123')
+        response = client.get(reverse('notification-stream'))
+        self.assertEqual(response.status_code, 204)
+
+    def test_read_and_delete_publish_counts(self):
+        """Test that counter changes are published to subscribers"""
+        with mock.patch.object(get_broker(), 'publish') as publish:
+            unread_counts.get_unread_count(self.user1.pk)
+            unread_counts.adjust_unread_count(self.user1.pk, 2)
+            NotificationService.mark_notifications_as_read(self.user1)
+
+        self.assertEqual(publish.call_args_list, [
+            mock.call(self.user1.pk, {'event': 'unread_count', 'count': 2}),
+            mock.call(self.user1.pk, {'event': 'unread_count', 'count': 0}),
+        ])
+
+
+@override_settings(
+    NOTIFICATION_BROKER_BACKEND='users.broker.CacheBroker',
+    NOTIFICATION_BROKER_POLL_INTERVAL=0.01,
+)
+class NotificationCacheBrokerTestCase(NotificationStreamTestCase):
+    async def test_stream_pushes_counts_and_notifications(self):
+        """Test that events published through the cache reach a stream"""
+        chunks, reader = await self.open_stream(self.user1)
+        self.assertEqual(
+            await self.next_event(chunks), ('unread_count', {'count': 0}))
+
+        def like_build():
+            NotificationService.create_build_like_notification(
+                self.build, self.user2)
+            NotificationService.process_pending()
+        await sync_to_async(like_build)()
+
+        event, data = await self.next_event(chunks)
+        self.assertEqual(event, 'notification')
+        self.assertIn('liked your build', data['message'])
+        self.assertEqual(
+            await self.next_event(chunks),
+            ('unread_count', {'event': 'unread_count', 'count': 1}))
+        await self.close_stream(reader)
+
+    async def test_events_cross_broker_instances(self):
+        """Test that another process's broker reaches subscribers"""
+        # Separate instances stand in for the worker and a web process
+        worker, web = CacheBroker(), CacheBroker()
+        web.publish(self.user1.pk, {'event': 'old'})
+        subscription = web.subscribe(self.user1.pk)
+        await subscription.start()
+
+        await sync_to_async(worker.publish)(self.user1.pk, {'event': 'a'})
+        await sync_to_async(worker.publish)(self.user2.pk, {'event': 'b'})
+        await sync_to_async(worker.publish)(self.user1.pk, {'event': 'c'})
+
+        self.assertEqual(await subscription.get(timeout=5), {'event': 'a'})
+        self.assertEqual(await subscription.get(timeout=5), {'event': 'c'})
+        self.assertIsNone(await subscription.get(timeout=0.05))
+        subscription.close()
+
+    async def test_one_poller_serves_every_stream(self):
+        """Test that streams share one cache read per poll"""
+        broker = CacheBroker()
+        users = [self.user1.pk, self.user2.pk]
+        subscriptions = [broker.subscribe(user_id) for user_id in users * 3]
+        with mock.patch.object(
+                broker, 'read', wraps=broker.read) as read:
+            for subscription in subscriptions:
+                await subscription.start()
+            await sync_to_async(broker.publish)(
+                self.user2.pk, {'event': 'a'})
+            for subscription in subscriptions[1::2]:
+                self.assertEqual(
+                    await subscription.get(timeout=5), {'event': 'a'})
+
+        polls = [call.args[0] for call in read.call_args_list
+                 if len(call.args[0]) > 1]
+        self.assertTrue(polls)
+        for after in polls:
+            self.assertEqual(set(after), set(users))
+        for subscription in subscriptions:
+            subscription.close()
+        self.assertEqual(broker.subscriber_count(self.user1.pk), 0)
+
+    def test_default_broker_follows_delivery_mode(self):
+        """Test that worker delivery defaults to the cache broker"""
+        with self.settings(NOTIFICATION_BROKER_BACKEND=None):
+            with self.settings(
+                    NOTIFICATION_QUEUE_EAGER=False, CACHE_SHARED=True):
+                self.assertIsInstance(get_broker(), CacheBroker)
+            with self.settings(NOTIFICATION_QUEUE_EAGER=True):
+                self.assertIsInstance(get_broker(), InProcessBroker)
+            with self.settings(
+                    NOTIFICATION_QUEUE_EAGER=False, CACHE_SHARED=False):
+                self.assertIsInstance(get_broker(), InProcessBroker)
+
+
+class NotificationRetentionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        self.build = Build.objects.create(
+            user=self.user1,
+            title="Test Build for Notifications",
+            description="A test build for notification testing",
+            category="PVE"
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_notifications(self, count, days_ago=0, is_read=False):
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                recipient=self.user1,
+                sender=self.user2,
+                notification_type='build_comment',
+                build=self.build,
+                is_read=is_read,
+            )
+            for i in range(count)
+        ])
+        Notification.objects.filter(
+            pk__in=[n.pk for n in notifications]
+        ).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return notifications
+
+    def test_old_read_notifications_are_deleted(self):
+        """Test that only read notifications past retention go"""
+        old_read = self.create_notifications(3, days_ago=100, is_read=True)
+        old_unread = self.create_notifications(2, days_ago=100)
+        recent_read = self.create_notifications(2, days_ago=10, is_read=True)
+
+        out = StringIO()
+        call_command('prune_notifications', days=90, batch_size=2,
+                     sleep=0, stdout=out)
+
+        self.assertIn('Deleted 3 expired', out.getvalue())
+        remaining = set(Notification.objects.values_list('id', flat=True))
+        self.assertEqual(
+            remaining, {n.pk for n in old_unread + recent_read})
+        self.assertFalse(remaining & {n.pk for n in old_read})
+
+    def test_users_keep_their_newest_notifications(self):
+        """Test that notifications beyond the per-user limit go"""
+        oldest = self.create_notifications(3, days_ago=5)
+        newest = self.create_notifications(4, days_ago=1)
+        self.assertEqual(unread_counts.get_unread_count(self.user1.pk), 7)
+
+        expired, over_limit = prune_notifications(
+            days=0, max_per_user=4, batch_size=2)
+
+        self.assertEqual((expired, over_limit), (0, 3))
+        self.assertEqual(
+            set(Notification.objects.values_list('id', flat=True)),
+            {n.pk for n in newest})
+        self.assertFalse(Notification.objects.filter(
+            pk__in=[n.pk for n in oldest]).exists())
+        # Deleted unread notifications leave the cached count
+        self.assertEqual(unread_counts.get_unread_count(self.user1.pk), 4)
+
+    def test_archive_receives_deleted_rows(self):
+        """Test that pruned notifications are archived as JSON lines"""
+        old_read = self.create_notifications(2, days_ago=100, is_read=True)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'notifications.jsonl.gz')
+            call_command('prune_notifications', days=90, archive=path,
+                         sleep=0, stdout=StringIO())
+            with gzip.open(path, 'rt', encoding='utf-8') as archive:
+                rows = [json.loads(line) for line in archive]
+
+        self.assertEqual(
+            sorted(row['id'] for row in rows),
+            sorted(n.pk for n in old_read))
+        self.assertEqual(rows[0]['notification_type'], 'build_comment')
+        self.assertTrue(rows[0]['is_read'])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_orphaned_receipts_are_deleted(self):
+        """Test that receipts of deleted builds and comments go"""
+        comment = Comment.objects.create(
+            build=self.build, user=self.user1, content='Hi')
+        other_build = Build.objects.create(
+            user=self.user1, title='Other Build', category='PVE')
+        other_comment = Comment.objects.create(
+            build=other_build, user=self.user1, content='Hi')
+        kept = NotificationReceipt.objects.bulk_create([
+            NotificationReceipt(
+                sender=self.user2, notification_type='build_like',
+                target_id=self.build.pk),
+            NotificationReceipt(
+                sender=self.user2, notification_type='comment_vote',
+                target_id=comment.pk),
+        ])
+        NotificationReceipt.objects.bulk_create([
+            NotificationReceipt(
+                sender=self.user2, notification_type='build_like',
+                target_id=other_build.pk),
+            NotificationReceipt(
+                sender=self.user2, notification_type='comment_vote',
+                target_id=other_comment.pk),
+        ])
+        other_build.delete()
+
+        self.assertEqual(prune_orphaned_receipts(batch_size=1), 2)
+        self.assertEqual(
+            set(NotificationReceipt.objects.values_list('id', flat=True)),
+            {receipt.pk for receipt in kept})
+
+        out = StringIO()
+        call_command('prune_notifications', sleep=0, stdout=out)
+        self.assertIn('0 orphaned receipts', out.getvalue())
+
+
+class NotificationBulkActionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpass123'
+        )
+        self.user2 = User.objects.create_user(
+            username='testuser2',
+            email='test2@example.com',
+            password='testpass123'
+        )
+        self.build = Build.objects.create(
+            user=self.user1,
+            title="Test Build for Notifications",
+            description="A test build for notification testing",
+            category="PVE"
+        )
+        # Oldest first, one minute apart
+        now = timezone.now()
+        self.notifications = []
+        for i in range(5):
+            notification = Notification.objects.create(
+                recipient=self.user1,
+                sender=self.user2,
+                notification_type='build_comment',
+                build=self.build,
+            )
+            Notification.objects.filter(pk=notification.pk).update(
+                created_at=now - timedelta(minutes=5 - i))
+            self.notifications.append(notification)
+        self.other = Notification.objects.create(
+            recipient=self.user2,
+            sender=self.user1,
+            notification_type='build_like',
+            build=self.build,
+        )
+        self.client.login(username='testuser1', password='testpass123')
+
+    def tearDown(self):
+        cache.clear()
+
+    def unread_ids(self):
+        return set(Notification.objects.filter(
+            recipient=self.user1, is_read=False).values_list('id', flat=True))
+
+    def test_mark_read_up_to_a_notification(self):
+        """Test that up_to marks it and everything older in one UPDATE"""
+        NotificationService.get_unread_count(self.user1)
+        up_to = self.notifications[2]
+
+        with CaptureQueriesContext(connection) as queries:
+            count = NotificationService.mark_notifications_as_read(
+                self.user1, up_to=up_to.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            self.unread_ids(),
+            {n.pk for n in self.notifications[3:]})
+
+    def test_bulk_mark_read_endpoint(self):
+        """Test marking by ids and up_to through the endpoint"""
+        first, second = self.notifications[:2]
+        response = self.client.post(
+            reverse('notification-mark-read'),
+            json.dumps({'notification_ids': [first.pk, self.other.pk]}),
+            content_type='application/json')
+        self.assertEqual(response.json(),
+                         {'success': True, 'unread_count': 4})
+        self.other.refresh_from_db()
+        self.assertFalse(self.other.is_read)
+
+        response = self.client.post(reverse('notification-mark-read'), {
+            'up_to': self.notifications[3].pk})
+        self.assertEqual(response.json()['unread_count'], 1)
+
+        response = self.client.post(reverse('notification-mark-read'), {
+            'notification_ids': ['not-a-number']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_endpoints_need_an_id_list(self):
+        """Test that notification_ids other than a list are rejected"""
+        second = self.notifications[1]
+        for notification_ids in (str(second.pk), {str(second.pk): True}):
+            for url in ('notification-mark-read', 'notification-delete'):
+                response = self.client.post(
+                    reverse(url),
+                    json.dumps({'notification_ids': notification_ids}),
+                    content_type='application/json')
+                self.assertEqual(response.status_code, 400, notification_ids)
+        second.refresh_from_db()
+        self.assertFalse(second.is_read)
+
+    def test_bulk_delete_endpoint(self):
+        """Test deleting up to a notification in one DELETE"""
+        NotificationService.get_unread_count(self.user1)
+        self.notifications[0].mark_as_read()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('notification-delete'),
+                json.dumps({'up_to': self.notifications[1].pk}),
+                content_type='application/json')
+        deletes = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('DELETE')
+        ]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(response.json(), {
+            'success': True, 'deleted': 2, 'unread_count': 3})
+        self.assertEqual(
+            set(Notification.objects.filter(
+                recipient=self.user1).values_list('id', flat=True)),
+            {n.pk for n in self.notifications[2:]})
+
+    def test_bulk_delete_needs_a_selection(self):
+        """Test that deleting without ids or up_to is refused"""
+        response = self.client.post(reverse('notification-delete'))
+        self.assertEqual(response.status_code, 400)
+
+        # Another user's notification can't be used as the boundary
+        response = self.client.post(reverse('notification-delete'), {
+            'up_to': self.other.pk})
+        self.assertEqual(response.json()['deleted'], 0)
+        self.assertEqual(Notification.objects.count(), 6)
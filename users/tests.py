@@ -4,6 +4,8 @@ from django.urls import reverse
 from .models import UserProfile
 from .forms import UserRegistrationForm
 from builds.models import Build, Comment
+import base64
+import json
 
 
 class UserProfileTestCase(TestCase):
@@ -249,3 +251,77 @@ class UserProfileViewTestCase(TestCase):
                 'user-profile',
                 kwargs={
                     'username': 'user1'}))
+
+
+class UserProfilePageTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='prolific',
+            email='prolific@example.com',
+            password='password123'
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='password123'
+        )
+        self.builds = [
+            Build.objects.create(
+                user=self.user, title=f'Build {i}', category='PVE')
+            for i in range(15)
+        ]
+        other_build = Build.objects.create(
+            user=self.other, title='Liked Build', category='PVP')
+        other_build.liked_by.add(self.user)
+        for build in self.builds[:3]:
+            Comment.objects.create(
+                build=build, user=self.user, content='Nice')
+        self.url = reverse('user-profile', kwargs={'username': 'prolific'})
+
+    def test_totals_come_from_one_query(self):
+        """Test that the profile totals arrive with the user row"""
+        response = self.client.get(self.url)
+        profile_user = response.context['profile_user']
+        self.assertEqual(profile_user.total_builds, 15)
+        self.assertEqual(profile_user.total_liked_builds, 1)
+        self.assertEqual(profile_user.total_comments, 3)
+
+        with self.assertNumQueries(3):
+            # User with profile and totals, one page of builds, images
+            self.client.get(self.url)
+
+    def test_tabs_are_paginated(self):
+        """Test that only the active tab is loaded, a page at a time"""
+        response = self.client.get(self.url + '?tab=builds')
+        first_page = response.context['tab_items']
+        self.assertEqual(len(first_page), 12)
+        self.assertEqual(first_page[0], self.builds[-1])
+
+        response = self.client.get(
+            self.url + '?tab=builds&cursor=' + response.context['next_cursor'])
+        self.assertEqual(
+            response.context['tab_items'], self.builds[2::-1])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertContains(response, 'Newest')
+
+        response = self.client.get(self.url + '?tab=comments')
+        self.assertEqual(len(response.context['tab_items']), 3)
+        self.assertEqual(response.context['tab_items'][0].score, 0)
+
+    def test_invalid_tab_and_cursor(self):
+        """Test that unknown tabs fall back and bad cursors 404"""
+        response = self.client.get(self.url + '?tab=nonsense')
+        self.assertEqual(response.context['current_tab'], 'builds')
+
+        response = self.client.get(self.url + '?tab=liked&cursor=!!!')
+        self.assertEqual(response.status_code, 404)
+
+    def test_wrongly_typed_cursor(self):
+        """Test that a cursor decoding to the wrong types 404s"""
+        cursor = base64.urlsafe_b64encode(
+            json.dumps(['yesterday', 'last']).encode('utf-8')).decode('ascii')
+        for tab in ('builds', 'liked', 'comments'):
+            response = self.client.get(
+                self.url, {'tab': tab, 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, tab)
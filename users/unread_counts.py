@@ -0,0 +1,66 @@
+"""
+Cached unread notification counters
+
+Each user's unread count lives in the cache so page renders don't need a
+COUNT query. NotificationService and Notification.mark_as_read adjust
+the counter as notifications are created, read and deleted. A missing
+counter is recounted from the database on the next read, and counters
+expire after NOTIFICATION_UNREAD_COUNT_TIMEOUT seconds so changes made
+behind the service's back (cascade deletes, the admin) heal on their own.
+Every change is also published to the user's live notification streams.
+
+A per-process cache only sees the changes made in its own process, so
+there counters are recounted after LOCAL_CACHE_TIMEOUT seconds at most.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from utils.cache_utils import LOCAL_CACHE_TIMEOUT, get_cache_timeout
+from .broker import publish
+
+UNREAD_KEY = 'notifications:unread:{}'
+
+
+def get_timeout():
+    """Seconds a cached unread count lives before being recounted"""
+    return get_cache_timeout(
+        getattr(settings, 'NOTIFICATION_UNREAD_COUNT_TIMEOUT', 3600))
+
+
+def get_unread_count(user_id):
+    """Return the number of unread notifications for a user"""
+    from .models import Notification
+
+    key = UNREAD_KEY.format(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(
+            recipient_id=user_id, is_read=False).count()
+        cache.set(key, count, timeout=get_timeout())
+    return max(count, 0)
+
+
+def adjust_unread_count(user_id, delta):
+    """Add delta to a cached count and tell the user's live streams"""
+    if not delta:
+        return
+    try:
+        count = max(cache.incr(UNREAD_KEY.format(user_id), delta), 0)
+    except ValueError:
+        # Not cached, so it's recounted on the next read. Open streams
+        # cache the count when they connect, so nobody is left waiting.
+        return
+    publish(user_id, {'event': 'unread_count', 'count': count})
+
+
+def refresh_unread_count(user_id):
+    """Recount a user's unread notifications and tell their streams"""
+    cache.delete(UNREAD_KEY.format(user_id))
+    count = get_unread_count(user_id)
+    publish(user_id, {'event': 'unread_count', 'count': count})
+    return count
+
+
+def reset_unread_count(user_id):
+    """Record that a user has no unread notifications"""
+    cache.set(UNREAD_KEY.format(user_id), 0, timeout=get_timeout())
+    publish(user_id, {'event': 'unread_count', 'count': 0})
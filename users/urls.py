@@ -17,6 +17,14 @@ urlpatterns = [
         'notifications/',
         notification_views.notification_list,
         name='notification-list'),
+    path(
+        'notifications/feed/',
+        notification_views.notification_feed,
+        name='notification-feed'),
+    path(
+        'notifications/stream/',
+        notification_views.notification_stream,
+        name='notification-stream'),
     path(
         'notifications/mark-read/<int:notification_id>/',
         notification_views.mark_notification_read,
@@ -28,6 +36,10 @@ urlpatterns = [
     path('notifications/mark-all-read/',
          notification_views.mark_all_notifications_read,
          name='mark-all-notifications-read'),
+    path(
+        'notifications/delete/',
+        notification_views.delete_notifications,
+        name='notification-delete'),
     path(
         'notifications/delete/<int:notification_id>/',
         notification_views.delete_notification,
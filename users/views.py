@@ -3,10 +3,14 @@ from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from django.views.generic import DetailView
 from .forms import UserRegistrationForm, UserUpdateForm, UserProfileUpdateForm
 from .models import UserProfile
 from builds.models import Build, Comment
+from builds.pagination import paginate_by_cursor
 
 # Create your views here.
 
@@ -60,6 +64,19 @@ def profile_edit(request):
     return render(request, 'users/profile_edit.html', context)
 
 
+def _count(queryset, field):
+    """Subquery counting the rows of queryset that point at the outer user"""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+# Profile tabs, each listed newest first a page at a time
+PROFILE_TABS = ('builds', 'liked', 'comments')
+PROFILE_TAB_ORDERING = ('-created_at', '-id')
+PROFILE_ITEMS_PER_PAGE = 12
+
+
 class UserProfileView(DetailView):
     model = User
     template_name = 'users/profile.html'
@@ -67,32 +84,61 @@ class UserProfileView(DetailView):
     slug_field = 'username'
     slug_url_kwarg = 'username'
 
+    def get_queryset(self):
+        # The profile and all three totals come back with the user row
+        return User.objects.select_related('profile').annotate(
+            total_builds=_count(Build.objects.all(), 'user'),
+            total_liked_builds=_count(Build.liked_by.through.objects.all(),
+                                      'user'),
+            total_comments=_count(Comment.objects.all(), 'user'),
+        )
+
+    def get_current_tab(self):
+        tab = self.request.GET.get('tab', 'builds')
+        return tab if tab in PROFILE_TABS else 'builds'
+
+    def get_tab_queryset(self, tab, user):
+        """Return the listing shown on one tab of the profile"""
+        if tab == 'comments':
+            return Comment.objects.filter(
+                user=user).select_related('build').with_vote_counts()
+
+        builds = Build.objects.prefetch_related('images')
+        if tab == 'liked':
+            return builds.filter(liked_by=user).select_related(
+                'user', 'user__profile')
+        return builds.filter(user=user)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.get_object()
+        user = self.object
 
         # Get or create user profile
-        user_profile, created = UserProfile.objects.get_or_create(user=user)
+        try:
+            user_profile = user.profile
+        except UserProfile.DoesNotExist:
+            user_profile, created = UserProfile.objects.get_or_create(
+                user=user)
         context['user_profile'] = user_profile
 
-        # Get user's builds
-        user_builds = Build.objects.filter(user=user).order_by('-created_at')
-
-        # Get user's liked builds
-        liked_builds = Build.objects.filter(
-            liked_by=user).order_by('-created_at')
-
-        # Get user's comments
-        user_comments = Comment.objects.filter(
-            user=user).select_related('build').order_by('-created_at')
-
-        # Get current tab from URL parameters
-        current_tab = self.request.GET.get('tab', 'builds')
+        # Only the active tab is loaded, one page at a time
+        current_tab = self.get_current_tab()
+        cursor = self.request.GET.get('cursor')
+        try:
+            items, next_cursor = paginate_by_cursor(
+                self.get_tab_queryset(current_tab, user).order_by(
+                    *PROFILE_TAB_ORDERING),
+                PROFILE_TAB_ORDERING,
+                cursor,
+                PROFILE_ITEMS_PER_PAGE
+            )
+        except ValueError:
+            raise Http404("Invalid page")
 
         context.update({
-            'user_builds': user_builds,
-            'liked_builds': liked_builds,
-            'user_comments': user_comments,
+            'tab_items': items,
+            'next_cursor': next_cursor,
+            'is_first_page': not cursor,
             'current_tab': current_tab,
             'is_own_profile': self.request.user == user,
         })
@@ -0,0 +1,43 @@
+"""
+Cache deployment helpers
+
+Counters, profiles and live events kept in the default cache are only
+consistent when every web process and the notification worker use the
+same cache. A per-process backend (LocMemCache, the default, or
+DummyCache) gives each process its own copy, so code that relies on
+sharing checks is_shared_cache() and falls back, or keeps values only
+for LOCAL_CACHE_TIMEOUT seconds so other processes catch up soon.
+"""
+from django.conf import settings
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Longest a value invalidated by signals lives in a per-process cache
+LOCAL_CACHE_TIMEOUT = 30
+
+
+def is_shared_cache():
+    """
+    Whether every process reads and writes the same default cache
+
+    Worked out from the cache backend; set CACHE_SHARED to override it.
+    """
+    shared = getattr(settings, 'CACHE_SHARED', None)
+    if shared is not None:
+        return shared
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def get_cache_timeout(timeout):
+    """
+    Seconds to keep a value that other processes invalidate
+
+    Returns `timeout`, capped at LOCAL_CACHE_TIMEOUT when the cache isn't
+    shared and invalidations made in other processes can't reach it.
+    """
+    if not is_shared_cache():
+        return min(timeout, LOCAL_CACHE_TIMEOUT)
+    return timeout
@@ -1,7 +1,33 @@
 """
 Cloudinary utilities for image transformations and URL generation
+
+Generated URLs only depend on the public ID and the transformation, so
+they are memoized in a bounded LRU cache (CLOUDINARY_URL_CACHE_SIZE
+entries per process). With CLOUDINARY_STORE_IMAGE_URLS set, the URLs of
+every size preset are also stored on BuildImage and UserProfile rows
+when an image is uploaded, and pages read them without generating
+anything.
 """
+from functools import lru_cache
+
 from cloudinary.utils import cloudinary_url
+from django.conf import settings
+
+
+def store_image_urls():
+    """Whether preset URLs are stored on image rows when they are saved"""
+    return getattr(settings, 'CLOUDINARY_STORE_IMAGE_URLS', False)
+
+
+@lru_cache(maxsize=getattr(settings, 'CLOUDINARY_URL_CACHE_SIZE', 4096))
+def _cached_url(public_id, transformations):
+    url, options = cloudinary_url(public_id, **dict(transformations))
+    return url
+
+
+def clear_url_cache():
+    """Forget memoized URLs, e.g. after changing the Cloudinary config"""
+    _cached_url.cache_clear()
 
 
 def get_optimized_image_url(public_id, **transformations):
@@ -26,8 +52,7 @@ def get_optimized_image_url(public_id, **transformations):
     # Merge default transformations with custom ones
     all_transformations = {**default_transformations, **transformations}
 
-    url, options = cloudinary_url(public_id, **all_transformations)
-    return url
+    return _cached_url(public_id, tuple(sorted(all_transformations.items())))
 
 
 def get_profile_picture_url(cloudinary_field, size=300):
@@ -115,3 +140,45 @@ BUILD_SIZES = {
     'medium': {'width': 600, 'height': 400},
     'large': {'width': 1200, 'height': 800},
 }
+
+
+def get_profile_picture_urls(cloudinary_field):
+    """Return {size: URL} for every PROFILE_SIZES preset"""
+    if not cloudinary_field:
+        return {}
+    return {
+        size: get_profile_picture_url(cloudinary_field, config['width'])
+        for size, config in PROFILE_SIZES.items()
+    }
+
+
+def get_build_image_urls(cloudinary_field):
+    """Return {size: URL} for every BUILD_SIZES preset"""
+    if not cloudinary_field:
+        return {}
+    urls = {
+        size: get_build_image_url(
+            cloudinary_field, config['width'], config['height'])
+        for size, config in BUILD_SIZES.items()
+    }
+    # Build.get_image_url serves thumbnails at the thumbnail quality
+    urls['thumbnail'] = get_thumbnail_url(cloudinary_field)
+    return urls
+
+
+def build_srcset(urls, presets):
+    """
+    Format preset URLs as a srcset with width descriptors
+
+    Args:
+        urls (dict): {size: URL}, e.g. from get_build_image_urls()
+        presets (dict): BUILD_SIZES or PROFILE_SIZES
+
+    Returns:
+        str: e.g. 'https://...300 300w, https://...600 600w', narrowest first
+    """
+    return ', '.join(
+        f"{urls[size]} {presets[size]['width']}w"
+        for size in sorted(presets, key=lambda size: presets[size]['width'])
+        if urls.get(size)
+    )